@@ -0,0 +1,392 @@
+
+from typing import NamedTuple, List, Dict, Tuple, Callable, Optional, Union
+from Core.PAC.pac_file import (
+    PAC_instruction_template
+)
+from pathlib import Path
+from functools import partial
+import re
+import struct
+
+
+class PAC_asm_argument(NamedTuple):
+    arg_type: Optional[int]  # 0x1, 0x2, 0x4, 0x10, etc. or None if the text doesn't specify it
+    value: Union[int, float, str]
+
+
+# Encodes the arguments starting from the index and returns the index of the first unused argument
+PAC_param_encoder = Callable[[bytearray, List[PAC_asm_argument], int], int]
+
+
+# The types that PAC_instruction.argument_switch_case assigns to the uint_something_T arguments
+ARG_TYPE_BY_PARAM_TYPE: Dict[str, int] = {
+    "0x40 variable": 0x40,
+    "0x20 variable": 0x20,
+    "float": 0x10,
+    "0x8 variable": 0x8,
+    "0x4 variable": 0x4,
+    "uint32_t": 0x2,
+    "0x1 value": 0x1,
+}
+
+# The prefixes that PAC_dumper writes when omit_arg_names is set
+ARG_TYPE_BY_PREFIX: Dict[str, int] = {
+    "40": 0x40,
+    "20": 0x20,
+    "8": 0x8,
+    "4": 0x4,
+    "2": 0x2,
+    "1": 0x1,
+}
+
+HEADER_RE = re.compile(r"([0-9A-F]{8})  ")
+END_OF_LINE_RE = re.compile(r"\r?\n|\r?$")
+INSTRUCTION_RE = re.compile(r"([0-9A-F]+):[^(\n]*\(")
+UNKNOWN_INSTRUCTION_RE = re.compile(r"([0-9A-F]+)\(Unknown instruction\): size = (\d+)")
+MEMORY_ENTITY_RE = re.compile(r"Memory entity: size = (\d+) bytes, (shift-jis|hex) = \(")
+HEX_DATA_RE = re.compile(r"([0-9a-f ]*)\)")
+PADDING_BYTES_RE = re.compile(
+    r"Padding bytes: count = (\d+), all zeroes = (True|False), machine word length = \d+"
+)
+MESSAGE_TABLE_RE = re.compile(r"Message table: size = (\d+) bytes, message count = (\d+)")
+SWITCH_CASE_TABLE_RE = re.compile(
+    r"Switch-case table: size = (\d+) bytes, branches count = (\d+), addresses: \(([0-9A-F, ]*)\)"
+)
+LEFT_OUT_ARGS_RE = re.compile(
+    r"Potential left out PAC args: size = (\d+) bytes, supposed full size of the instruction = \d+"
+)
+# Either {type; name}=value or prefix:value (omit_arg_names) or just the value, strings are handled separately
+ARGUMENT_RE = re.compile(
+    r'(?:\{(?P<type>[^;]*); [^}]*}=|(?P<prefix>40|20|8|4|2|1):)?(?:(?P<quote>")|(?P<value>[^,)\n]*))'
+)
+HEX_VALUE_RE = re.compile(r"[0-9A-F]+")
+STRING_END_RE = re.compile(r'"(?=, |\)(?: \[Warning[^\n]*])?\r?(?:\n|$))')
+CUT_OFF_WARNING = " [Warning, instruction unexpectedly ends!]"
+
+UINT32 = struct.Struct("<I")
+UINT16 = struct.Struct("<H")
+FLOAT = struct.Struct("<f")
+SIGNATURE = struct.Struct(">I")
+
+
+class PAC_assembler:
+    """
+    Assembles the text produced by PAC_dumper (with omit_arg_names either on or off) back into bytes\n
+    Every entity is written at the offset from its line (lines without one continue the previous entity),
+    the gaps are filled with zeroes. The byte ranges that can't be restored from the text (unknown instructions,
+    left out args, non-zero padding, unknown argument types, etc.) are filled with zeroes and stored in
+    lossy_ranges
+    """
+    def __init__(self):
+        self.templates: Dict[int, PAC_instruction_template] = {}
+        self.encoders: Dict[int, List[PAC_param_encoder]] = {}
+        self.lossy_ranges: List[Tuple[int, int]] = []
+
+        self.text: str = ""
+        self.cur_pos = 0
+        self.cut_off = False  # the current instruction unexpectedly ends
+
+    def setTemplates(self, PAC_instruction_templates: Dict[int, PAC_instruction_template]):
+        self.templates = PAC_instruction_templates
+        self.encoders = {
+            signature: self.compile_template(template) for signature, template in self.templates.items()
+        }
+
+    def compile_template(self, template: PAC_instruction_template) -> List[PAC_param_encoder]:
+        """
+        Resolves the type of every param once, so that encoding an instruction is just a sequence of calls\n
+        :param template: the instruction template
+        :return: the list of param encoders in the order of template.PAC_params
+        """
+        encoders: List[PAC_param_encoder] = []
+        for param in template.PAC_params:
+            param_type = param.type
+            if param_type == "uintX_t":
+                encoders.append(self.encode_aligned_int)
+            elif param_type.startswith("uintX_t_T"):
+                encoders.append(self.encode_aligned_typed_arg)
+            elif param_type.startswith("uintXC_t_T"):
+                encoders.append(self.encode_compressed_typed_arg)
+            elif param_type.startswith("uint32_t_T"):
+                encoders.append(self.encode_typed_arg)
+            elif param_type.startswith("uint16_t_T"):
+                encoders.append(self.encode_small_typed_arg)
+            elif param_type == "float" or param_type.startswith("CONTINOUS_"):
+                # PAC_instruction doesn't keep these values, so they aren't in the text
+                encoders.append(partial(self.encode_missing_value, 4 if param_type == "float" else 0))
+            elif param_type == "string":
+                encoders.append(self.encode_string)
+            elif param_type.startswith("COUNT_"):
+                count_info, args_info = param_type.split("_")[1:3]
+                encoders.append(partial(self.encode_count_args, count_info, args_info))
+            elif param_type in ("uint32_t", "uint32_t_P", "KEYBIND_ID"):
+                encoders.append(self.encode_int)
+            elif param_type in ("ENTITY_ID", "EQUIP_ID"):
+                encoders.append(self.encode_skipped_int)
+        return encoders
+
+    def mark_lossy(self, start: int, end: int):
+        if start >= end:
+            return
+        if self.lossy_ranges and self.lossy_ranges[-1][1] == start:
+            self.lossy_ranges[-1] = (self.lossy_ranges[-1][0], end)
+        else:
+            self.lossy_ranges.append((start, end))
+
+    def get_arg(self, args: List[PAC_asm_argument], index: int) -> PAC_asm_argument:
+        if index >= len(args):
+            raise ValueError(f"{self.get_position()}: not enough arguments")
+        return args[index]
+
+    def encode_arg_type(self, out: bytearray, arg: PAC_asm_argument, sizeof: int):
+        arg_type = arg.arg_type
+        if arg_type is None:
+            if type(arg.value) is float:
+                arg_type = 0x10
+            else:
+                # Either the unknown type or a value without the type prefix
+                arg_type = 0
+                self.mark_lossy(len(out), len(out) + 1)
+        out.append(arg_type)
+        out += bytes(sizeof - 1)
+
+    @staticmethod
+    def encode_value(out: bytearray, arg: PAC_asm_argument):
+        if type(arg.value) is float:
+            out += FLOAT.pack(arg.value)
+        else:
+            out += UINT32.pack(arg.value)
+
+    def encode_int(self, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        out += UINT32.pack(self.get_arg(args, index).value)
+        return index + 1
+
+    def encode_aligned_int(self, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        out += bytes(-len(out) % 4)
+        return self.encode_int(out, args, index)
+
+    def encode_skipped_int(self, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        self.mark_lossy(len(out), len(out) + 4)
+        out += bytes(4)
+        return self.encode_int(out, args, index)
+
+    def encode_typed_arg(self, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        arg = self.get_arg(args, index)
+        self.encode_arg_type(out, arg, 4)
+        self.encode_value(out, arg)
+        return index + 1
+
+    def encode_aligned_typed_arg(self, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        out += bytes(-len(out) % 4)
+        return self.encode_typed_arg(out, args, index)
+
+    def encode_compressed_typed_arg(self, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        arg = self.get_arg(args, index)
+        self.encode_arg_type(out, arg, 4 - len(out) % 4)
+        self.encode_value(out, arg)
+        return index + 1
+
+    def encode_small_typed_arg(self, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        arg = self.get_arg(args, index)
+        self.encode_arg_type(out, arg, 2)
+        out += UINT16.pack(arg.value)
+        return index + 1
+
+    def encode_string(self, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        out += self.get_arg(args, index).value.encode("shift-jis")
+        out.append(0)
+        return index + 1
+
+    def encode_missing_value(self, size: int, out: bytearray, args: List[PAC_asm_argument], index: int) -> int:
+        self.mark_lossy(len(out), len(out) + size)
+        out += bytes(size)
+        return index
+
+    def encode_count_args(self, count_info: str, args_info: str, out: bytearray, args: List[PAC_asm_argument],
+                          index: int) -> int:
+        # COUNT params are always the last ones, so the rest of the arguments are the parsed counted ones.
+        # The count itself isn't in the text: a cut-off instruction had more arguments than the parser read
+        count = len(args) - index
+        if count_info == "byte":
+            if self.cut_off:
+                self.mark_lossy(len(out), len(out) + 1)
+            out.append(count)
+            out += bytes(3)
+        elif count_info == "uint32t":
+            # The type of the count (either 0x1 or 0x2) is not stored
+            self.mark_lossy(len(out), len(out) + 1)
+            out += UINT32.pack(0x2)
+            if self.cut_off:
+                self.mark_lossy(len(out), len(out) + 4)
+            out += UINT32.pack(count)
+        elif count_info == "uint32tP":
+            if self.cut_off:
+                self.mark_lossy(len(out), len(out) + 4)
+            out += UINT32.pack(count)
+
+        encode = self.encode_typed_arg if args_info == "uint32t" else self.encode_int
+        while index < len(args):
+            index = encode(out, args, index)
+        return index
+
+    def get_position(self) -> str:
+        return f"Line {self.text.count(chr(10), 0, self.cur_pos) + 1}"
+
+    def expect(self, pattern: re.Pattern) -> re.Match:
+        match = pattern.match(self.text, self.cur_pos)
+        if match is None:
+            raise ValueError(f"{self.get_position()}: can't parse {self.text[self.cur_pos:self.cur_pos + 40]!r}")
+        self.cur_pos = match.end()
+        return match
+
+    def read_arguments(self) -> List[PAC_asm_argument]:
+        text = self.text
+        args: List[PAC_asm_argument] = []
+        if text.startswith(")", self.cur_pos):
+            self.cur_pos += 1
+            return args
+
+        while True:
+            match = ARGUMENT_RE.match(text, self.cur_pos)
+            arg_type = None
+            if (param_type := match.group("type")) is not None:
+                if param_type.startswith("count_") and " " in param_type:
+                    # count_{count_info} {type} {i}
+                    param_type = param_type[param_type.find(" ") + 1:param_type.rfind(" ")]
+                arg_type = ARG_TYPE_BY_PARAM_TYPE.get(param_type)
+            elif (prefix := match.group("prefix")) is not None:
+                arg_type = ARG_TYPE_BY_PREFIX[prefix]
+
+            if match.group("quote") is not None:
+                string_end = STRING_END_RE.search(text, match.end())
+                if string_end is None:
+                    raise ValueError(f"{self.get_position()}: unterminated string")
+                value = text[match.end():string_end.start()]
+                self.cur_pos = string_end.end()
+            else:
+                token = match.group("value")
+                try:
+                    value = int(token, 16) if HEX_VALUE_RE.fullmatch(token) else float(token)
+                except ValueError:
+                    raise ValueError(f"{self.get_position()}: bad argument value {token!r}")
+                self.cur_pos = match.end()
+            args.append(PAC_asm_argument(arg_type, value))
+
+            if text.startswith(", ", self.cur_pos):
+                self.cur_pos += 2
+            elif text.startswith(")", self.cur_pos):
+                self.cur_pos += 1
+                return args
+            else:
+                raise ValueError(f"{self.get_position()}: expected ', ' or ')' after an argument")
+
+    def assemble_instruction(self, out: bytearray, signature: int):
+        encoders = self.encoders.get(signature)
+        if encoders is None:
+            raise ValueError(f"{self.get_position()}: unknown instruction signature {signature:X}")
+        args = self.read_arguments()
+        self.cut_off = self.text.startswith(CUT_OFF_WARNING, self.cur_pos)
+        if self.cut_off:
+            self.cur_pos += len(CUT_OFF_WARNING)
+
+        out += SIGNATURE.pack(signature)
+        index = 0
+        for encoder in encoders:
+            if self.cut_off and index >= len(args):
+                break
+            index = encoder(out, args, index)
+        if index != len(args):
+            raise ValueError(f"{self.get_position()}: too many arguments for instruction {signature:X}")
+
+    def assemble_memory_entity(self, out: bytearray, size: int, encoding: str):
+        if encoding == "hex":
+            out += bytes.fromhex(self.expect(HEX_DATA_RE).group(1))
+            return
+
+        # The decoded text may contain anything (even line breaks), so the size decides where it ends
+        start = self.cur_pos
+        end = self.text.find(")", start)
+        while end != -1:
+            if END_OF_LINE_RE.match(self.text, end + 1):
+                data = self.text[start:end].encode("shift-jis")
+                if len(data) == size:
+                    out += data
+                    self.cur_pos = end + 1
+                    return
+            end = self.text.find(")", end + 1)
+        raise ValueError(f"{self.get_position()}: the shift-jis data doesn't match the size of the memory entity")
+
+    def assemble_entity(self, out: bytearray) -> bool:
+        """
+        Assembles the entity at self.cur_pos\n
+        :param out: the assembled file
+        :return: True if the entity was dumped, False if it was left out (like skipped padding bytes)
+        """
+        text = self.text
+        pos = self.cur_pos
+        if match := INSTRUCTION_RE.match(text, pos):
+            self.cur_pos = match.end()
+            self.assemble_instruction(out, int(match.group(1), 16))
+        elif match := MEMORY_ENTITY_RE.match(text, pos):
+            self.cur_pos = match.end()
+            self.assemble_memory_entity(out, int(match.group(1)), match.group(2))
+        elif match := PADDING_BYTES_RE.match(text, pos):
+            self.cur_pos = match.end()
+            size = int(match.group(1))
+            if match.group(2) == "False":
+                self.mark_lossy(len(out), len(out) + size)
+            out += bytes(size)
+        elif match := SWITCH_CASE_TABLE_RE.match(text, pos):
+            self.cur_pos = match.end()
+            for branch in match.group(3).split(", "):
+                out += UINT32.pack(int(branch, 16))
+        elif match := MESSAGE_TABLE_RE.match(text, pos):
+            self.cur_pos = match.end()
+            for i in range(int(match.group(2))):
+                out += UINT32.pack(i)
+        elif match := UNKNOWN_INSTRUCTION_RE.match(text, pos):
+            self.cur_pos = match.end()
+            out += SIGNATURE.pack(int(match.group(1), 16))
+            size = int(match.group(2)) - 4
+            self.mark_lossy(len(out), len(out) + size)
+            out += bytes(size)
+        elif match := LEFT_OUT_ARGS_RE.match(text, pos):
+            self.cur_pos = match.end()
+            size = int(match.group(1))
+            self.mark_lossy(len(out), len(out) + size)
+            out += bytes(size)
+        else:
+            return False
+        return True
+
+    def assemble(self, text: str) -> bytes:
+        """
+        :param text: the disassembly produced by PAC_dumper
+        :return: the assembled file
+        """
+        self.text = text
+        self.cur_pos = 0
+        self.lossy_ranges = []
+
+        out = bytearray()
+        unknown_gap = False
+        while self.cur_pos < len(text):
+            match = HEADER_RE.match(text, self.cur_pos)
+            if match is not None:
+                offset = int(match.group(1), 16)
+                if offset < len(out):
+                    raise ValueError(f"{self.get_position()}: the entity at {offset:X} overlaps the previous one")
+                if unknown_gap:
+                    self.mark_lossy(len(out), offset)
+                out += bytes(offset - len(out))
+                self.cur_pos = match.end()
+
+            unknown_gap = not self.assemble_entity(out)
+            self.expect(END_OF_LINE_RE)
+
+        return bytes(out)
+
+    def assemble_from_file(self, path: Path) -> bytes:
+        # newline="" keeps the line breaks inside the strings intact
+        with open(path, encoding="utf-8", newline="") as source:
+            return self.assemble(source.read())
@@ -0,0 +1,443 @@
+
+from Core.PAC.pac_file import (
+    PAC_file, PAC_instruction, is_pointer_param
+)
+
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import NamedTuple, Dict, List, Set, Tuple, Optional, Hashable
+import json
+
+
+# The Myers fallback gives up on the ranges that need more edits (they become a single replacement)
+MAX_EDIT_DISTANCE = 512
+
+
+class PAC_diff_hunk(NamedTuple):
+    op: str  # "equal", "modify", "insert", "delete" or "replace"
+    old_start: int
+    old_end: int
+    new_start: int
+    new_end: int
+    """
+    The indices in the ordered instructions of both files (the ends are exclusive)
+    """
+
+
+class PAC_offset_shift(NamedTuple):
+    old_start: int
+    old_end: int
+    delta: int
+    """
+    The instructions in [old_start, old_end) of the old file moved by delta bytes
+    """
+
+
+class PAC_diff_summary(NamedTuple):
+    equal: int
+    modified: int
+    inserted: int
+    deleted: int
+
+
+def get_unique_anchors(a: List[int], a_start: int, a_end: int, b: List[int], b_start: int, b_end: int) \
+        -> List[Tuple[int, int]]:
+    """
+    The patience step: the tokens that occur exactly once in both ranges are paired up, then the longest
+    increasing subsequence of these pairs is kept\n
+    :return: the list of (index in a, index in b) sorted by both indices
+    """
+    counts: Dict[int, int] = {}
+    for i in range(a_start, a_end):
+        token = a[i]
+        counts[token] = counts.get(token, 0) + 1
+    # The first position in b of the tokens unique in a, the count drops to 0 if the token repeats in b
+    positions: Dict[int, int] = {}
+    for j in range(b_start, b_end):
+        token = b[j]
+        if counts.get(token) != 1:
+            continue
+        if token in positions:
+            counts[token] = 0
+        else:
+            positions[token] = j
+
+    pairs = [(i, positions[a[i]]) for i in range(a_start, a_end) if counts[a[i]] == 1 and a[i] in positions]
+    if not pairs:
+        return []
+
+    # Patience sorting over the b indices
+    tails: List[int] = []
+    tail_pairs: List[int] = []
+    previous: List[int] = [-1] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        pile = bisect_left(tails, j)
+        if pile > 0:
+            previous[index] = tail_pairs[pile - 1]
+        if pile == len(tails):
+            tails.append(j)
+            tail_pairs.append(index)
+        else:
+            tails[pile] = j
+            tail_pairs[pile] = index
+
+    anchors = []
+    index = tail_pairs[-1]
+    while index != -1:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def get_myers_matches(a: List[int], a_start: int, a_end: int, b: List[int], b_start: int, b_end: int,
+                      max_edit_distance: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    The shortest edit script of two ranges (Myers, O((N+M)D))\n
+    :return: the matched (index in a, index in b) pairs or None if more than max_edit_distance edits are needed
+    """
+    n = a_end - a_start
+    m = b_end - b_start
+    max_d = min(n + m, max_edit_distance)
+    shift = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace: List[List[int]] = []
+    found = False
+    for d in range(max_d + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or k != d and v[shift + k - 1] < v[shift + k + 1]:
+                x = v[shift + k + 1]
+            else:
+                x = v[shift + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_start + x] == b[b_start + y]:
+                x += 1
+                y += 1
+            v[shift + k] = x
+            if x >= n and y >= m:
+                found = True
+                break
+        if found:
+            break
+    if not found:
+        return None
+
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or k != d and v[shift + k - 1] < v[shift + k + 1]:
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = v[shift + previous_k]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((a_start + x, b_start + y))
+        x, y = previous_x, previous_y
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        matches.append((a_start + x, b_start + y))
+    matches.reverse()
+    return matches
+
+
+def match_sequences(a: List[int], b: List[int], max_edit_distance: int = MAX_EDIT_DISTANCE) -> List[Tuple[int, int]]:
+    """
+    Patience diff: the common prefix and suffix are stripped, the unique tokens split the rest into smaller
+    ranges and the ranges without unique tokens are left to Myers\n
+    :param a: the old tokens
+    :param b: the new tokens
+    :param max_edit_distance: see MAX_EDIT_DISTANCE
+    :return: the matched (index in a, index in b) pairs sorted by both indices
+    """
+    matches: List[Tuple[int, int]] = []
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        a_start, a_end, b_start, b_end = ranges.pop()
+        while a_start < a_end and b_start < b_end and a[a_start] == b[b_start]:
+            matches.append((a_start, b_start))
+            a_start += 1
+            b_start += 1
+        while a_start < a_end and b_start < b_end and a[a_end - 1] == b[b_end - 1]:
+            a_end -= 1
+            b_end -= 1
+            matches.append((a_end, b_end))
+        if a_start == a_end or b_start == b_end:
+            continue
+
+        anchors = get_unique_anchors(a, a_start, a_end, b, b_start, b_end)
+        if anchors:
+            for i, j in anchors:
+                matches.append((i, j))
+                ranges.append((a_start, i, b_start, j))
+                a_start, b_start = i + 1, j + 1
+            ranges.append((a_start, a_end, b_start, b_end))
+        else:
+            res = get_myers_matches(a, a_start, a_end, b, b_start, b_end, max_edit_distance)
+            if res is not None:
+                matches.extend(res)
+    matches.sort()
+    return matches
+
+
+class PAC_Diff:
+    """
+    A structural diff of two versions of the same PAC file over their ordered instructions\n
+    The instructions are compared with their pointer arguments masked, so the code that only moved is matched;
+    the pointers of the matched instructions are then relocated through the offset map: an instruction whose
+    pointers don't land on the counterparts of their old targets is reported as modified, as well as the
+    instructions of the replaced ranges that kept their signatures (see match_signatures)
+    """
+    def __init__(self, old: PAC_file, new: PAC_file, max_edit_distance: int = MAX_EDIT_DISTANCE):
+        self.old = old
+        self.new = new
+        self.max_edit_distance = max_edit_distance
+        self.verbose_level = 4  # The diff stays silent by default
+
+        self.old_offsets: List[int] = list(old.ordered_instructions)
+        self.new_offsets: List[int] = list(new.ordered_instructions)
+        self.offset_map: Dict[int, int] = {}
+        self.hunks: List[PAC_diff_hunk] = []
+        self.shifts: List[PAC_offset_shift] = []
+        self.shift_starts: List[int] = []
+        self.is_computed = False
+
+        self.pointer_params: Dict[str, bool] = {}
+        self.token_ids: Dict[Hashable, int] = {}
+
+    def is_pointer_param(self, param_type: str) -> bool:
+        res = self.pointer_params.get(param_type)
+        if res is None:
+            res = is_pointer_param(param_type)
+            self.pointer_params[param_type] = res
+        return res
+
+    def tokenize(self, file: PAC_file) -> List[int]:
+        """
+        :return: a token id per ordered instruction, the equal ids mean the same instructions up to the pointers
+        """
+        token_ids = self.token_ids
+        is_pointer = self.is_pointer_param
+        tokens = []
+        for instruction in file.ordered_instructions.values():
+            token = (instruction.signature, instruction.size, tuple(
+                (param.type, None if is_pointer(param.type) else value)
+                for param, value in instruction.ordered_PAC_params
+            ))
+            token_id = token_ids.get(token)
+            if token_id is None:
+                token_id = len(token_ids)
+                token_ids[token] = token_id
+            tokens.append(token_id)
+        return tokens
+
+    def get_pointers(self, instruction: PAC_instruction) -> List[int]:
+        return [value for param, value in instruction.ordered_PAC_params if self.is_pointer_param(param.type)]
+
+    def map_offset(self, old_offset: int) -> Optional[int]:
+        """
+        Maps an offset of the old file to the new one: the matched instructions are mapped exactly, anything else
+        (e.g. data) moves together with the closest matched instruction before it\n
+        :param old_offset: an offset in the old file
+        :return: the offset in the new file or None if nothing before it was matched
+        """
+        self.diff()
+        res = self.offset_map.get(old_offset)
+        if res is not None:
+            return res
+        index = bisect_right(self.shift_starts, old_offset) - 1
+        if index < 0:
+            return None
+        return old_offset + self.shifts[index].delta
+
+    def diff(self) -> List[PAC_diff_hunk]:
+        """
+        :return: the hunks covering both files, in order
+        """
+        if self.is_computed:
+            return self.hunks
+        old_tokens = self.tokenize(self.old)
+        new_tokens = self.tokenize(self.new)
+        matches = match_sequences(old_tokens, new_tokens, self.max_edit_distance)
+        signature_matches = self.match_signatures(matches, len(old_tokens), len(new_tokens))
+        if signature_matches:
+            matches = sorted(matches + signature_matches)
+
+        old_offsets = self.old_offsets
+        new_offsets = self.new_offsets
+        self.offset_map = {old_offsets[i]: new_offsets[j] for i, j in matches}
+        self.make_shifts(matches)
+        self.is_computed = True  # map_offset is used below
+        modified = self.find_modified(matches, set(signature_matches))
+        self.hunks = self.make_hunks(matches, modified, len(old_tokens), len(new_tokens))
+
+        if self.verbose_level <= 2:
+            summary = self.get_summary()
+            print(
+                f"{self.old.name} -> {self.new.name}: {summary.equal} equal, {summary.modified} modified, "
+                f"{summary.inserted} inserted, {summary.deleted} deleted instructions"
+            )
+        return self.hunks
+
+    def match_signatures(self, matches: List[Tuple[int, int]], old_count: int, new_count: int) \
+            -> List[Tuple[int, int]]:
+        """
+        Pairs up the instructions with the same signatures in the ranges between the matches: only their
+        arguments changed, so they are reported as modified instead of deleted and inserted\n
+        :param matches: the matched (index in old, index in new) pairs
+        :return: the pairs of the instructions with the same signatures, sorted by both indices
+        """
+        old_signatures = [instruction.signature for instruction in self.old.ordered_instructions.values()]
+        new_signatures = [instruction.signature for instruction in self.new.ordered_instructions.values()]
+        res: List[Tuple[int, int]] = []
+        i = j = 0
+        for next_i, next_j in matches + [(old_count, new_count)]:
+            if next_i > i and next_j > j:
+                res.extend(
+                    (i + old_index, j + new_index) for old_index, new_index in match_sequences(
+                        old_signatures[i: next_i], new_signatures[j: next_j], self.max_edit_distance
+                    )
+                )
+            i, j = next_i + 1, next_j + 1
+        return res
+
+    def make_shifts(self, matches: List[Tuple[int, int]]):
+        """
+        Compresses the offset map into the runs of the matched instructions that moved by the same delta
+        """
+        old_offsets = self.old_offsets
+        new_offsets = self.new_offsets
+        old_instructions = self.old.ordered_instructions
+        shifts: List[PAC_offset_shift] = []
+        for i, j in matches:
+            old_offset = old_offsets[i]
+            delta = new_offsets[j] - old_offset
+            end = old_offset + old_instructions[old_offset].size
+            if shifts and shifts[-1].delta == delta:
+                shifts[-1] = PAC_offset_shift(shifts[-1].old_start, end, delta)
+            else:
+                shifts.append(PAC_offset_shift(old_offset, end, delta))
+        self.shifts = shifts
+        self.shift_starts = [shift.old_start for shift in shifts]
+
+    def is_relocated(self, old_pointer: int, new_pointer: int) -> bool:
+        """
+        :return: True if the new pointer is the old one moved with its target (the values that aren't offsets
+        in the old file are compared as is)
+        """
+        mapped = self.map_offset(old_pointer) if 0 <= old_pointer < self.old.size else None
+        return (mapped if mapped is not None else old_pointer) == new_pointer
+
+    def find_modified(self, matches: List[Tuple[int, int]], signature_matches: Set[Tuple[int, int]]) -> List[bool]:
+        """
+        :param signature_matches: the matches with the same signatures only (see match_signatures)
+        :return: for every match, whether the arguments differ (the relocated pointers for the matched tokens)
+        """
+        old_instructions = self.old.ordered_instructions
+        new_instructions = self.new.ordered_instructions
+        old_offsets = self.old_offsets
+        new_offsets = self.new_offsets
+        modified = []
+        for i, j in matches:
+            if (i, j) in signature_matches:
+                modified.append(True)
+                continue
+            old_pointers = self.get_pointers(old_instructions[old_offsets[i]])
+            if not old_pointers:
+                modified.append(False)
+                continue
+            new_pointers = self.get_pointers(new_instructions[new_offsets[j]])
+            modified.append(not all(
+                self.is_relocated(old_pointer, new_pointer)
+                for old_pointer, new_pointer in zip(old_pointers, new_pointers)
+            ))
+        return modified
+
+    @staticmethod
+    def make_hunks(matches: List[Tuple[int, int]], modified: List[bool], old_count: int, new_count: int) \
+            -> List[PAC_diff_hunk]:
+        hunks: List[PAC_diff_hunk] = []
+
+        def add_hunk(op: str, old_start: int, old_end: int, new_start: int, new_end: int):
+            if hunks and hunks[-1].op == op:
+                previous = hunks[-1]
+                hunks[-1] = PAC_diff_hunk(op, previous.old_start, old_end, previous.new_start, new_end)
+            else:
+                hunks.append(PAC_diff_hunk(op, old_start, old_end, new_start, new_end))
+
+        i = j = 0
+        for (next_i, next_j), is_modified in zip(matches + [(old_count, new_count)], modified + [False]):
+            if next_i > i and next_j > j:
+                add_hunk("replace", i, next_i, j, next_j)
+            elif next_i > i:
+                add_hunk("delete", i, next_i, j, j)
+            elif next_j > j:
+                add_hunk("insert", i, i, j, next_j)
+            if next_i < old_count:
+                add_hunk("modify" if is_modified else "equal", next_i, next_i + 1, next_j, next_j + 1)
+            i, j = next_i + 1, next_j + 1
+        return hunks
+
+    def get_summary(self) -> PAC_diff_summary:
+        counts = {"equal": 0, "modify": 0, "insert": 0, "delete": 0}
+        for hunk in self.diff():
+            if hunk.op == "replace":
+                counts["delete"] += hunk.old_end - hunk.old_start
+                counts["insert"] += hunk.new_end - hunk.new_start
+            elif hunk.op == "insert":
+                counts["insert"] += hunk.new_end - hunk.new_start
+            else:
+                counts[hunk.op] += hunk.old_end - hunk.old_start
+        return PAC_diff_summary(counts["equal"], counts["modify"], counts["insert"], counts["delete"])
+
+    def get_offset_range(self, offsets: List[int], file: PAC_file, start: int, end: int) -> List[int]:
+        """
+        :return: [the offset of the first instruction, the offset after the last one] (or an empty range)
+        """
+        if start == end:
+            offset = offsets[start] if start < len(offsets) else file.size
+            return [offset, offset]
+        return [offsets[start], offsets[end - 1] + file.ordered_instructions[offsets[end - 1]].size]
+
+    def write_patch(self, output_path: Path):
+        """
+        Writes the patch as JSON Lines: a "diff" summary record, a "shift" record per run of the equally moved
+        instructions and a "hunk" record per change (the equal instructions are only described by the shifts)\n
+        :param output_path: the path of the output file
+        :return: None
+        """
+        hunks = self.diff()
+        summary = self.get_summary()
+        with open(output_path, "w", encoding="utf-8") as output:
+            output.write(json.dumps({
+                "kind": "diff", "old": self.old.name, "new": self.new.name,
+                "old_instructions": len(self.old_offsets), "new_instructions": len(self.new_offsets),
+                **summary._asdict()
+            }) + "\n")
+            for shift in self.shifts:
+                output.write(json.dumps({
+                    "kind": "shift", "old": [shift.old_start, shift.old_end], "delta": shift.delta
+                }) + "\n")
+
+            old_instructions = self.old.ordered_instructions
+            new_instructions = self.new.ordered_instructions
+            for hunk in hunks:
+                if hunk.op == "equal":
+                    continue
+                output.write(json.dumps({
+                    "kind": "hunk", "op": hunk.op,
+                    "old": self.get_offset_range(self.old_offsets, self.old, hunk.old_start, hunk.old_end),
+                    "new": self.get_offset_range(self.new_offsets, self.new, hunk.new_start, hunk.new_end),
+                    "removed": [
+                        old_instructions[offset].name for offset in self.old_offsets[hunk.old_start: hunk.old_end]
+                    ],
+                    "added": [
+                        new_instructions[offset].name for offset in self.new_offsets[hunk.new_start: hunk.new_end]
+                    ],
+                }, ensure_ascii=False) + "\n")
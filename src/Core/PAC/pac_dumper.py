@@ -1,5 +1,5 @@
 
-from typing import NamedTuple, TextIO
+from typing import NamedTuple, TextIO, List
 from Core.PAC.pac_file import (
     PAC_file, Memory_entity, PAC_instruction, PAC_message_table, Padding_bytes, Unknown_PAC_instruction,
     Switch_case_table, Left_out_PAC_arguments
@@ -123,35 +123,44 @@ class PAC_dumper:
             f"supposed full size of the instruction = {left_out_PAC_args.supposed_size}"
         )
 
+    def disassemble(self, output: TextIO) -> List[int]:
+        """
+        Writes the disassembly of the whole file\n
+        :param output: the text stream to write to
+        :return: the offsets of the memory entities that failed to decode as shift-jis
+        """
+        offsets_to_dump = []
+        for file_offset in self.file.entities_offsets:
+            hex_offset = f"{file_offset:08X}  "
+
+            output.write(hex_offset)
+            entity = self.file.entities[file_offset]
+            entity_type = type(entity)
+            if entity_type is Memory_entity:
+                # this variable can be removed
+                decoding_failed = self.dump_memory_entity(output, entity)
+                if decoding_failed:
+                    print(f"Failed to decode shift-jis at {file_offset:X}"
+                          f" (it will be dumped to file {file_offset:X}.bytes)")
+                    offsets_to_dump.append(file_offset)
+            elif entity_type is PAC_instruction:
+                self.dump_PAC_instruction(output, entity)
+            elif entity_type is Unknown_PAC_instruction:
+                self.dump_unknown_PAC_instruction(output, entity)
+            elif entity_type is Padding_bytes and not self.settings.skip_padding_bytes:
+                self.dump_padding_bytes(output, entity)
+            elif entity_type is PAC_message_table:
+                self.dump_PAC_message_table(output, entity)
+            elif entity_type is Switch_case_table:
+                self.dump_switch_case_table(output, entity)
+            elif entity_type is Left_out_PAC_arguments:
+                self.dump_left_out_PAC_args(output, entity)
+            output.write("\n")
+        return offsets_to_dump
+
     def disassemble_to_file(self, where_to: Path):
         with open(where_to, "w", encoding="utf-8") as output:
-            offsets_to_dump = []
-            for file_offset in self.file.entities_offsets:
-                hex_offset = f"{file_offset:08X}  "
-
-                output.write(hex_offset)
-                entity = self.file.entities[file_offset]
-                entity_type = type(entity)
-                if entity_type is Memory_entity:
-                    # this variable can be removed
-                    decoding_failed = self.dump_memory_entity(output, entity)
-                    if decoding_failed:
-                        print(f"Failed to decode shift-jis at {file_offset:X}"
-                              f" (it will be dumped to file {file_offset:X}.bytes)")
-                        offsets_to_dump.append(file_offset)
-                elif entity_type is PAC_instruction:
-                    self.dump_PAC_instruction(output, entity)
-                elif entity_type is Unknown_PAC_instruction:
-                    self.dump_unknown_PAC_instruction(output, entity)
-                elif entity_type is Padding_bytes and not self.settings.skip_padding_bytes:
-                    self.dump_padding_bytes(output, entity)
-                elif entity_type is PAC_message_table:
-                    self.dump_PAC_message_table(output, entity)
-                elif entity_type is Switch_case_table:
-                    self.dump_switch_case_table(output, entity)
-                elif entity_type is Left_out_PAC_arguments:
-                    self.dump_left_out_PAC_args(output, entity)
-                output.write("\n")
+            offsets_to_dump = self.disassemble(output)
 
             # Now we only need to dump the bad memory entities
             if not self.settings.dump_failed_decodings:
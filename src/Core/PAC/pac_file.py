@@ -1,6 +1,6 @@
 
 from typing import (
-    Set, NamedTuple, List, Dict, Any, Tuple, Union
+    Set, NamedTuple, List, Dict, Any, Tuple, Union, Iterable
 )
 from Utils.utils import (
     read_int_from_bytes, read_float_from_bytes, read_custom_int_from_bytes,
@@ -61,6 +61,18 @@ class PAC_instruction_param(NamedTuple):
     name: str
 
 
+# The resolved argument types that hold file offsets (see PAC_instruction.get_used_0x1_values/get_used_4_byte_values)
+POINTER_PARAM_PREFIXES = ("0x1", "uint32_t_P", "uintX_t")
+
+
+def is_pointer_param(param_type: str) -> bool:
+    """
+    :param param_type: the type of a resolved instruction argument
+    :return: True if the argument is a file offset (the COUNT_..._uint32tP lists are made of them too)
+    """
+    return param_type.startswith(POINTER_PARAM_PREFIXES) or param_type.startswith("count_") and " " not in param_type
+
+
 class PAC_variable(NamedTuple):
     type: str
     value: int
@@ -507,6 +519,22 @@ class Switch_case_table(Memory_entity):
         return f"Switch-case table: size = {self.size} bytes, branches count = {len(self.branches)}"
 
 
+class PAC_entity_diff(NamedTuple):
+    """
+    Describes the entities that were replaced after a part of the file had been reparsed
+    """
+    start: int
+    """
+    The start of the reparsed range (inclusive)
+    """
+    end: int
+    """
+    The end of the reparsed range (exclusive)
+    """
+    removed: Dict[int, Memory_entity]
+    added: Dict[int, Memory_entity]
+
+
 class PAC_file(Patapon_file):
     def __init__(self):
         Patapon_file.__init__(self)
@@ -567,12 +595,108 @@ class PAC_file(Patapon_file):
                 except Exception as e:
                     (base_path / (str(location) + ".sjis")).unlink(missing_ok=True)
 
+    def replace_entities(self, start: int, end: int, other: "PAC_file") -> Dict[int, Memory_entity]:
+        """
+        Replaces all entities in the range [start; end) with the entities of other (a partially parsed file)\n
+        :param start: the offset of the first entity to replace
+        :param end: either the offset of an entity or the file size
+        :param other: the file that stores the new entities
+        :return: the removed entities
+        """
+        lo = binary_search(self.entities_offsets, start)
+        hi = len(self.entities_offsets) if end >= self.size else binary_search(self.entities_offsets, end)
+        removed = {offset: self.entities[offset] for offset in self.entities_offsets[lo:hi]}
+
+        removed_offsets: Dict[str, Set[int]] = {}
+        removed_signatures: Dict[int, Set[int]] = {}
+        removed_unknown_signatures: Dict[int, Set[int]] = {}
+        for offset, entity in removed.items():
+            entity_type = type(entity)
+            if entity_type is PAC_instruction:
+                removed_signatures.setdefault(entity.signature, set()).add(offset)
+                removed_offsets.setdefault("ordered_instructions", set()).add(offset)
+                if self.cut_instructions.pop(offset, None) is not None:
+                    self.cut_instructions_count -= 1
+            elif entity_type is Unknown_PAC_instruction:
+                removed_unknown_signatures.setdefault(entity.signature, set()).add(offset)
+                self.unknown_instructions_count -= 1
+            else:
+                removed_offsets.setdefault(self.get_entity_container_name(entity_type), set()).add(offset)
+
+        self.entities_offsets[lo:hi] = other.entities_offsets
+        self.entities = replace_sorted_items(self.entities, removed.keys(), other.entities)
+
+        # Now the instructions (their offsets form a sublist of the entities offsets)
+        instr_lo = binary_search(self.instructions_offsets, start) if self.instructions_offsets else -1
+        if instr_lo == -1 or self.instructions_offsets[instr_lo] < start:
+            instr_lo += 1
+        instr_hi = instr_lo
+        while instr_hi < len(self.instructions_offsets) and self.instructions_offsets[instr_hi] < end:
+            instr_hi += 1
+        self.instructions_offsets[instr_lo:instr_hi] = other.instructions_offsets
+
+        for containers, removed_by_signature, other_containers in (
+                (self.instructions, removed_signatures, other.instructions),
+                (self.unknown_instructions, removed_unknown_signatures, other.unknown_instructions)):
+            for signature in removed_by_signature.keys() | other_containers.keys():
+                container = replace_sorted_items(containers.get(signature, {}),
+                                                 removed_by_signature.get(signature, ()),
+                                                 other_containers.get(signature, {}))
+                if container:
+                    containers[signature] = container
+                else:
+                    containers.pop(signature, None)
+        self.unknown_instructions_count += other.unknown_instructions_count
+        self.cut_instructions.update(other.cut_instructions)
+        self.cut_instructions_count += other.cut_instructions_count
+
+        for name in ("ordered_instructions", "raw_entities", "padding_bytes", "switch_case_tables",
+                     "left_out_PAC_arguments", "msg_tables"):
+            setattr(self, name, replace_sorted_items(getattr(self, name), removed_offsets.get(name, ()),
+                                                     getattr(other, name)))
+
+        return removed
+
+    @staticmethod
+    def get_entity_container_name(entity_type: type) -> str:
+        """
+        :param entity_type: the type of an entity that isn't an instruction
+        :return: the name of the attribute that stores the entities of this type
+        """
+        if entity_type is Padding_bytes:
+            return "padding_bytes"
+        if entity_type is Switch_case_table:
+            return "switch_case_tables"
+        if entity_type is PAC_message_table:
+            return "msg_tables"
+        if entity_type is Left_out_PAC_arguments:
+            return "left_out_PAC_arguments"
+        return "raw_entities"
+
     def getInstructions(self, signature: int) -> Dict[int, PAC_instruction]:
         if signature not in self.instructions:
             return {}
         return self.instructions[signature]  # can we not search for it again?
 
 
+def replace_sorted_items(container: Dict[int, Any], removed_keys: Iterable[int],
+                         new_items: Dict[int, Any]) -> Dict[int, Any]:
+    """
+    Removes then adds items to a dictionary whose keys are sorted (offsets) while keeping them sorted\n
+    The dictionary is only rebuilt when new keys are added, since re-added keys keep their position\n
+    :param container: the dictionary to update (it is modified in place when possible)
+    :param removed_keys: the keys to remove
+    :param new_items: the items to add
+    :return: the updated dictionary
+    """
+    for key in removed_keys:
+        if key not in new_items:
+            del container[key]
+    is_sorted = all(key in container for key in new_items)
+    container.update(new_items)
+    return container if is_sorted else dict(sorted(container.items()))
+
+
 def associate_pac_vars_and_instr(file: PAC_file):
     _0x4_vars: Dict[int, Dict[int, PAC_instruction]] = {}
     _0x8_vars: Dict[int, Dict[int, PAC_instruction]] = {}
@@ -1,7 +1,7 @@
 
 from typing import List, Tuple, Dict, Callable
 from Utils.utils import (
-    read_float_from_bytes, read_custom_int_from_bytes, read_int_from_bytes,
+    read_float_from_bytes, read_custom_int_from_bytes, read_int_from_bytes, binary_search, contains_bsearch
 )
 from Core.PAC.pac_utils import (
     is_PAC_instruction, read_PAC_string_argument, is_PAC_msg_table, is_left_out_PAC_args
@@ -9,7 +9,7 @@ from Core.PAC.pac_utils import (
 
 from Core.PAC.pac_file import (
     PAC_instruction_param, PAC_instruction_template, PAC_file, PAC_message_table, Left_out_PAC_arguments,
-    Memory_entity, PAC_instruction, Unknown_PAC_instruction, Padding_bytes, Switch_case_table
+    Memory_entity, PAC_instruction, Unknown_PAC_instruction, Padding_bytes, Switch_case_table, PAC_entity_diff
 )
 
 import struct
@@ -258,6 +258,7 @@ class PAC_parser:
         self.PAC_signature_to_name: Dict[int, str] = {}  # maybe not needed...
         self.templates: Dict[int, PAC_instruction_template] = {}
         self.instruction_heuristic: Callable[[int], bool] = defaultMayBeInstruction
+        self.change_listeners: List[Callable[[PAC_entity_diff], None]] = []
 
         self.file: PAC_file = PAC_file()
         self.cur_offset = 0
@@ -436,24 +437,105 @@ class PAC_parser:
             raise RuntimeError("PAC file raw data is empty!")
 
         while self.cur_offset < self.file.size:
-            res = self.findNextInstruction()
-            if res:
-                self.processRawData()
-                # now self.last_offset == self.cur_offset
-                signature = struct.unpack_from(">i", self.file.raw_data, self.cur_offset)[0]
-                self.cur_signature = signature
-
-                # self.find_unknown_instructions == False => the else clause is never executed
-                if signature in self.templates:
-                    self.processInstruction()
-                else:
-                    self.processUnknownInstruction()
-            else:
-                # No more instructions => self.file.raw_data[self.last_offset:] is a raw entity
-                self.cur_offset = self.file.size
-                self.processRawData()
+            self.parseNextEntity()
         pass
 
+    def parseNextEntity(self):
+        res = self.findNextInstruction()
+        if res:
+            self.processRawData()
+            # now self.last_offset == self.cur_offset
+            signature = struct.unpack_from(">i", self.file.raw_data, self.cur_offset)[0]
+            self.cur_signature = signature
+
+            # self.find_unknown_instructions == False => the else clause is never executed
+            if signature in self.templates:
+                self.processInstruction()
+            else:
+                self.processUnknownInstruction()
+        else:
+            # No more instructions => self.file.raw_data[self.last_offset:] is a raw entity
+            self.cur_offset = self.file.size
+            self.processRawData()
+
+    def addChangeListener(self, listener: Callable[[PAC_entity_diff], None]):
+        self.change_listeners.append(listener)
+
+    def isSynchronized(self, file: PAC_file, end: int) -> bool:
+        """
+        Checks if the reparsing can stop at self.last_offset: that's the case when the parser has passed the patched
+        range and is standing at the start of an old instruction (so the rest of the file would be parsed the same way)\n
+        :param file: the file with the old entities
+        :param end: the end of the patched range
+        :return: True if the old entities can be kept from now on
+        """
+        if self.last_offset < end or self.cur_offset != self.last_offset:
+            return False
+        if not contains_bsearch(file.entities_offsets, self.last_offset):
+            return False
+        return type(file.entities[self.last_offset]) in (PAC_instruction, Unknown_PAC_instruction)
+
+    def patch(self, offset: int, data: bytes) -> PAC_entity_diff:
+        """
+        Overwrites the file bytes at the offset (the file size stays the same), reparses the affected entities
+        and notifies the change listeners\n
+        :param offset: the file offset to write to
+        :param data: the new bytes
+        :return: the description of the replaced entities
+        """
+        file = self.file
+        end = offset + len(data)
+        if offset < 0 or end > file.size:
+            raise ValueError("The patch must lie within the file!")
+        old_raw_data = file.raw_data
+        file.raw_data = file.raw_data[:offset] + data + file.raw_data[end:]
+
+        # The reparsing starts from an instruction that precedes the patched range (cut off instructions peek
+        # at the next 4 bytes). Besides, the entity before it must not depend on the bytes that go after it:
+        # raw data, switch-case tables and unknown instructions last until the next instruction.
+        index = binary_search(file.entities_offsets, max(offset - 4, 0))
+        while index > 0:
+            entity_type = type(file.entities[file.entities_offsets[index]])
+            previous_type = type(file.entities[file.entities_offsets[index - 1]])
+            if entity_type in (PAC_instruction, Unknown_PAC_instruction) and \
+                    previous_type in (PAC_instruction, Padding_bytes):
+                break
+            index -= 1
+        start = file.entities_offsets[index]
+
+        # The new entities are collected in a separate file which shares the raw data with the original one
+        scratch = PAC_file()
+        scratch.name = file.name
+        scratch.raw_data = file.raw_data
+        scratch.size = file.size
+
+        self.reset(scratch)
+        self.cur_offset = start
+        self.last_offset = start
+
+        # The same loop as in parse(), but it stops as soon as the old entities can be reused
+        try:
+            while self.cur_offset < scratch.size and not self.isSynchronized(file, end):
+                self.parseNextEntity()
+        except Exception:
+            # The file must stay consistent with its entities
+            file.raw_data = old_raw_data
+            self.reset(file)
+            raise
+        stop = self.last_offset
+
+        removed = file.replace_entities(start, stop, scratch)
+        added = {location: scratch.entities[location] for location in scratch.entities_offsets}
+
+        self.reset(file)
+        self.cur_offset = file.size
+        self.last_offset = file.size
+
+        diff = PAC_entity_diff(start, stop, removed, added)
+        for listener in self.change_listeners:
+            listener(diff)
+        return diff
+
     def reset(self, file: PAC_file):
         self.file = file
         self.cur_offset = 0
@@ -1,7 +1,7 @@
 
 from typing import NamedTuple, List, Optional, Dict, Set
 from Core.PAC.pac_file import (
-    PAC_instruction, PAC_file
+    PAC_instruction, PAC_file, Switch_case_table
 )
 from Utils.utils import (
     in_between_bsearch, binary_search
@@ -94,6 +94,7 @@ class RawDataBlock:
         self.references_from: Dict[int] = {}
         self.data: bytes = b""
         self.shift_jis: Optional[str] = None
+        self.digests: Dict[str, int] = {}  # hasher name -> digest
 
     def __repr__(self):
         return f"Raw data block (size = {self.size} bytes)"
@@ -116,6 +117,8 @@ class ContiguousCodeBlock:
         self.is_split: bool = False
         self.is_source: bool = True
 
+        self.digests: Dict[str, int] = {}  # hasher name -> digest
+
     def __repr__(self):
         if self.is_dummy:
             return "Dummy code block"
@@ -304,6 +307,21 @@ class BasePacCodeBlocks:
         :return: -1 if it failed to get the block at offset, 0 if offset is not a valid instruction start, otherwise 1
         """
 
+        # Get the block at location
+        our_block = self.get_block_by_offset(location)[1]
+        # If the input is correct, this can't return None
+
+        return self.connect_exit_to_offset(our_block.exit_point, offset, transition)
+
+    def connect_exit_to_offset(self, exit_point: ExitPoint, offset: int, transition: PAC_transition):
+        """
+        Creates an "exit point -> entry point" connection between two blocks\n
+        :param exit_point: the exit point of the block that makes the transition
+        :param offset: the destination offset (it can point to the padding before the actual instruction)
+        :param transition: properties of this transition
+        :return: -1 if it failed to get the block at offset, 0 if offset is not a valid instruction start, otherwise 1
+        """
+
         # Let's see where this offset leads to
         res = self.get_block_by_offset(offset)
         if res is None:
@@ -317,12 +335,7 @@ class BasePacCodeBlocks:
                 print("Using the next block.")
 
         # Let's make the block at offset do the job
-
-        # Get the block at location
-        our_block = self.get_block_by_offset(location)[1]
-        # If the input is correct, this can't return None
-
-        if not block.accept_jump_to(offset, our_block.exit_point, transition):
+        if not block.accept_jump_to(offset, exit_point, transition):
             return 0
         return 1
 
@@ -337,28 +350,39 @@ class BasePacCodeBlocks:
 
             instructions = self.file.getInstructions(signature)
             for location, instruction in instructions.items():
-                # Connect the block to the destination
-                jumping_arg = instruction.ordered_PAC_params[index]
-                offset = jumping_arg[1]
-                save_address = signature in self.saving_RA_instructions
-                transition = PAC_transition(
-                    save_address=save_address, fallthrough=False, potential=False, special=False, callback=False
-                )
-                res = self.connect_location_to_offset(location, offset, transition)
-                if self.verbose_level <= 3:
-                    if res == -1:
-                        print(f"Failed to get a block at offset 0x{offset:X}")
-                    elif res == 0:
-                        print(f"0x{offset:X} is not a valid instruction start!")
-
-                # And now let's connect the consecutive blocks!
-                transition = PAC_transition(
-                    save_address=False, fallthrough=True, potential=False, special=False, callback=False
-                )
-                res = self.connect_location_to_offset(location, location + instruction.size, transition)
-                if self.verbose_level <= 3:
-                    if res != 1:
-                        print(f"Attempt to connect {instruction.name} to the next instruction failed")
+                _, block = self.get_block_by_offset(location)
+                self.connect_conditional_jump(location, instruction, block.exit_point)
+
+    def connect_conditional_jump(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint):
+        """
+        Creates both edges of an "if" instruction\n
+        :param location: the instruction offset
+        :param instruction: the conditional jump
+        :param exit_point: the exit point of the block that contains the instruction
+        :return: None
+        """
+        # Connect the block to the destination
+        jumping_arg = instruction.ordered_PAC_params[self.cond_jump_instructions[instruction.signature]]
+        offset = jumping_arg[1]
+        save_address = instruction.signature in self.saving_RA_instructions
+        transition = PAC_transition(
+            save_address=save_address, fallthrough=False, potential=False, special=False, callback=False
+        )
+        res = self.connect_exit_to_offset(exit_point, offset, transition)
+        if self.verbose_level <= 3:
+            if res == -1:
+                print(f"Failed to get a block at offset 0x{offset:X}")
+            elif res == 0:
+                print(f"0x{offset:X} is not a valid instruction start!")
+
+        # And now let's connect the consecutive blocks!
+        transition = PAC_transition(
+            save_address=False, fallthrough=True, potential=False, special=False, callback=False
+        )
+        res = self.connect_exit_to_offset(exit_point, location + instruction.size, transition)
+        if self.verbose_level <= 3:
+            if res != 1:
+                print(f"Attempt to connect {instruction.name} to the next instruction failed")
 
     def apply_cmd_inxJmp(self):
         """
@@ -369,17 +393,26 @@ class BasePacCodeBlocks:
             # We assume that switch-case tables are preceded by cmd_inxJmp instruction
 
             instr_offset, _ = self.file.get_entity_by_offset(location - 1)
-            # Note: the following code repeatedly grabs the block where cmd_inxJmp is
-            for offset in table.branches:
-                transition = PAC_transition(
-                    save_address=False, fallthrough=False, potential=False, special=False, callback=False
-                )
-                res = self.connect_location_to_offset(instr_offset, offset, transition)
-                if self.verbose_level <= 3:
-                    if res == -1:
-                        print(f"Failed to get a block at offset 0x{offset:X}")
-                    elif res == 0:
-                        print(f"0x{offset:X} is not a valid instruction start!")
+            _, block = self.get_block_by_offset(instr_offset)
+            self.connect_switch_case_table(table, block.exit_point)
+
+    def connect_switch_case_table(self, table: Switch_case_table, exit_point: ExitPoint):
+        """
+        Creates the edges that go from cmd_inxJmp to the branches of its switch-case table\n
+        :param table: the table that follows cmd_inxJmp
+        :param exit_point: the exit point of the block that contains cmd_inxJmp
+        :return: None
+        """
+        for offset in table.branches:
+            transition = PAC_transition(
+                save_address=False, fallthrough=False, potential=False, special=False, callback=False
+            )
+            res = self.connect_exit_to_offset(exit_point, offset, transition)
+            if self.verbose_level <= 3:
+                if res == -1:
+                    print(f"Failed to get a block at offset 0x{offset:X}")
+                elif res == 0:
+                    print(f"0x{offset:X} is not a valid instruction start!")
 
     def sort_jumps_from(self):
         """
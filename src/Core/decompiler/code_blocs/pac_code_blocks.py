@@ -1,18 +1,47 @@
 
-from typing import List, Optional, Dict, Set
+from typing import Callable, List, NamedTuple, Optional, Dict, Set, Tuple
 from Core.PAC.pac_file import (
-    PAC_instruction, PAC_file, PAC_variable, associate_pac_vars_and_instr
+    PAC_instruction, PAC_file, PAC_variable, associate_pac_vars_and_instr, PAC_entity_diff, Switch_case_table,
+    is_pointer_param
 )
 from Utils.utils import (
-    binary_search, print_hex
+    binary_search, binary_search_lambda, print_hex
 )
 from Core.decompiler.code_blocs.base_pac_code_blocks import (
-    BasePacCodeBlocks, ContiguousCodeBlock, EntryPoint, PAC_transition, PAC_Edge
+    BasePacCodeBlocks, ContiguousCodeBlock, EntryPoint, ExitPoint, PAC_transition, PAC_Edge
+)
+from Core.decompiler.pac_dataflow import (
+    PAC_ValueSetAnalysis
 )
 
 from pathlib import Path
 
 
+class PAC_CFG_diff(NamedTuple):
+    """
+    Describes how the code blocks changed after PAC_CodeBlocks.apply_entity_diff
+    """
+    removed_blocks: List[int]
+    """
+    The start offsets of the blocks that no longer exist
+    """
+    added_blocks: List[int]
+    """
+    The start offsets of the new blocks (a new block may start where a removed one did)
+    """
+    touched_blocks: Set[int]
+    """
+    The start offsets of the remaining blocks whose incoming or outgoing edges changed
+    """
+    edges_delta: int
+    """
+    The change of the edges count
+    """
+
+
+ConnectionHandler = Callable[[int, PAC_instruction, ExitPoint], None]
+
+
 class PAC_CodeBlocks(BasePacCodeBlocks):
     def __init__(self, file: Optional[PAC_file] = None):
         super().__init__(file)
@@ -20,8 +49,20 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
         self.label_to_offset: Dict[int, Set[int]] = {}
         self.unrecovered_jumps: Dict[int, PAC_variable] = {}  # offset -> variable
         self.getGateInfo_block_offsets: Set[int] = set()
+        self.getGateInfo_jumps: Dict[int, int] = {}  # unrecovered jump offset -> getGateInfo offset
         self.split_blocks: Dict[int, List[int]] = {}
         self.callback_destinations: Dict[int, int] = {}
+        self.callback_fallthroughs: Set[int] = set()
+        self.recovered_jumps: Dict[int, List[int]] = {}  # offset -> destinations
+        self.jumping_variables: Set[int] = set()  # the IntLocals that the destinations are computed from
+        # (cmd_mov offset, jump offset): only the code in between decides the destinations of these jumps
+        self.guarded_jump_ranges: List[Tuple[int, int]] = []
+        # The recovered jumps whose destinations depend on the whole CFG
+        self.flow_dependent_jumps: Set[int] = set()
+
+        self.include_callbacks: bool = True
+        self.block_terminators: Set[int] = set()
+        self.connection_order: Dict[int, List[Tuple[int, ConnectionHandler]]] = {}
 
     def reset(self, file: PAC_file):
         self.file = file
@@ -30,8 +71,14 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
         self.label_to_offset = {}
         self.unrecovered_jumps = {}
         self.getGateInfo_block_offsets = set()
+        self.getGateInfo_jumps = {}
         self.split_blocks = {}
         self.callback_destinations = {}
+        self.callback_fallthroughs = set()
+        self.recovered_jumps = {}
+        self.jumping_variables = set()
+        self.guarded_jump_ranges = []
+        self.flow_dependent_jumps = set()
 
     def read_instructions_info(self, cond_path, uncond_path, jump_path, returning_path, saving_path, callback_path):
         def read_dict(path):
@@ -91,6 +138,53 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
     def set_signature_to_name(self, matching: Dict[int, str]):
         self.signature_to_name = matching
 
+    def translate_instructions_info(self, reference: Dict[int, str], matching: Dict[int, str]):
+        """
+        Moves the instructions info read from the resources to another instruction set (the resources list the
+        signatures of one game), the instructions are matched by their names. The instructions that have
+        no unique counterpart are dropped, such important signatures become 0\n
+        :param reference: signature -> name for the instruction set of the resources
+        :param matching: signature -> name for the instruction set of the file
+        """
+        name_to_signature: Dict[str, int] = {}
+        repeated_names: Set[str] = set()
+        for signature, name in matching.items():
+            if name in name_to_signature:
+                repeated_names.add(name)
+            name_to_signature[name] = signature
+        for name in repeated_names:
+            del name_to_signature[name]
+
+        def translate(signature: int) -> int:
+            return name_to_signature.get(reference.get(signature), 0)
+
+        def translate_dict(info: Dict[int, int]) -> Dict[int, int]:
+            return {translate(signature): arg_index for signature, arg_index in info.items() if translate(signature)}
+
+        def translate_list(info: List[int]) -> List[int]:
+            return [translate(signature) for signature in info if translate(signature)]
+
+        self.cond_jump_instructions = translate_dict(self.cond_jump_instructions)
+        self.uncond_jump_instructions = translate_dict(self.uncond_jump_instructions)
+        self.jumping_instructions = translate_dict(self.jumping_instructions)
+        self.returning_instructions = translate_list(self.returning_instructions)
+        self.saving_RA_instructions = set(translate_list(list(self.saving_RA_instructions)))
+        self.callback_instructions = translate_dict(self.callback_instructions)
+
+        self.cmd_end = translate(self.cmd_end)
+        self.cmd_jmp = translate(self.cmd_jmp)
+        self.cmd_call = translate(self.cmd_call)
+        self.cmd_inxJmp = translate(self.cmd_inxJmp)
+        self.cmd_stkDec = translate(self.cmd_stkDec)
+        self.cmd_stkClr = translate(self.cmd_stkClr)
+        self.cmd_setLabelId = translate(self.cmd_setLabelId)
+        self.cmd_callLabelId = translate(self.cmd_callLabelId)
+        self.cmd_jmpLabelId = translate(self.cmd_jmpLabelId)
+        self.cmd_callLabel = translate(self.cmd_callLabel)
+        self.cmd_jmpLabel = translate(self.cmd_jmpLabel)
+        self.doSelect = translate(self.doSelect)
+        self.doSelectCursor = translate(self.doSelectCursor)
+
     def break_into_blocks(self, include_callbacks: bool):
         special_signatures = set(self.returning_instructions).union(self.jumping_instructions.keys())
 
@@ -100,57 +194,103 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
         if include_callbacks:
             special_signatures = special_signatures.union(self.callback_instructions.keys())
 
+        self.include_callbacks = include_callbacks
+        self.block_terminators = special_signatures
+        self.connection_order = self.get_connection_order()
+
+        for block in self.construct_blocks(self.file.instructions_offsets):
+            self.code_blocks[block.start] = block
+
+        # Finally, let's compute this
+        self.block_start_offsets = list(self.code_blocks.keys())
+
+    def construct_blocks(self, offsets: List[int]) -> List[ContiguousCodeBlock]:
+        """
+        Splits consecutive PAC instructions into blocks (their edges are not created)\n
+        :param offsets: the ascending instruction offsets
+        :return: the blocks, each of them has a single entry point
+        """
+        blocks: List[ContiguousCodeBlock] = []
         current_block = ContiguousCodeBlock()
-        # Damn this is ugly...
-        current_location: int = 0
-        current_instr_size: int = 0
-        start: int = -1
-
-        for location, instruction in self.file.ordered_instructions.items():
-            # This is saved so that it could be accessed after the loop is over
-            current_location, current_instr_size = location, instruction.size
-            # This is a weird signal that we need to reset start
-            if start < 0:
-                start = location
+
+        for location in offsets:
+            instruction = self.file.ordered_instructions[location]
+            if not current_block.instructions:
+                current_block.start = location
 
             current_block.instructions[location] = instruction
             current_block.ordered_instructions.append(instruction)
             current_block.instructions_offsets.append(location)
-            if instruction.signature in special_signatures:
+            if instruction.signature in self.block_terminators:
                 # End current block with this instruction and start a new one
-                current_block.start = start
-                current_block.size = location + instruction.size - start
-
-                current_block.exit_point.position = location
-                current_block.exit_point.instruction = instruction
-                current_block.exit_point.code_block = current_block
-
-                self.code_blocks[current_block.start] = current_block
-                # start += current_block.size  # This is erroneous...
-                start = -1
-
+                blocks.append(current_block)
                 current_block = ContiguousCodeBlock()
 
         if current_block.instructions:
-            current_block.start = list(current_block.instructions.keys())[0]  # I guess that's not too efficient...
-            current_block.size = current_location + current_instr_size - start
+            blocks.append(current_block)
 
-            current_block.exit_point.position = current_location
-            current_block.exit_point.instruction = self.file.ordered_instructions[-1]
+        # Now let's initialize entry points and exit points
+        for block in blocks:
+            location = block.instructions_offsets[-1]
+            instruction = block.ordered_instructions[-1]
+            block.size = location + instruction.size - block.start
 
-            self.code_blocks[current_block.start] = current_block
+            block.exit_point.position = location
+            block.exit_point.instruction = instruction
+            block.exit_point.code_block = block
 
-        # Now let's initialize entry points and exit points
-        for start, block in self.code_blocks.items():
             entry_point = EntryPoint()
-            entry_point.position = start
-            entry_point.instruction = block.instructions[start]
+            entry_point.position = block.start
+            entry_point.instruction = block.ordered_instructions[0]
             entry_point.code_block = block
             # Here we don't assign entry_point.where_from
-            block.entry_points[start] = entry_point
-
-        # Finally, let's compute this
-        self.block_start_offsets = list(self.code_blocks.keys())
+            block.entry_points[block.start] = entry_point
+        return blocks
+
+    def get_connection_order(self) -> Dict[int, List[Tuple[int, ConnectionHandler]]]:
+        """
+        Lists the methods that create the edges for each instruction signature\n
+        The ranks follow the order of the steps made by apply_jump_table_to_blocks,
+        apply_returning_instructions and apply_callbacks\n
+        :return: signature -> list of (rank, handler)
+        """
+        steps: List[Tuple[List[int], ConnectionHandler]] = [
+            (list(self.cond_jump_instructions), self.connect_conditional_jump),
+            (list(self.uncond_jump_instructions), self.connect_unconditional_jump),
+            ([self.cmd_inxJmp], self.connect_cmd_inxJmp),
+            ([self.cmd_jmpLabelId, self.cmd_callLabelId], self.connect_label_jump),
+            ([self.cmd_jmpLabel, self.cmd_callLabel], self.connect_runtime_jump),
+            ([self.cmd_jmpLabel, self.cmd_callLabel], self.connect_recovered_jump),
+            (self.returning_instructions, self.connect_returning_instruction),
+        ]
+        if self.include_callbacks:
+            steps.append((list(self.callback_instructions), self.connect_callback_instruction))
+
+        order: Dict[int, List[Tuple[int, ConnectionHandler]]] = {}
+        rank = 0
+        for signatures, handler in steps:
+            for signature in signatures:
+                if signature not in order:
+                    order[signature] = []
+                order[signature].append((rank, handler))
+                rank += 1
+        return order
+
+    def connect_instructions(self, instructions: Dict[int, PAC_instruction], exit_point: ExitPoint):
+        """
+        Creates the edges that come from the instructions of a block that hasn't been normalized\n
+        The edges are created in the same order as if the whole file was processed\n
+        :param instructions: the instructions of the block
+        :param exit_point: the exit point of the block
+        :return: None
+        """
+        connections = []
+        for location, instruction in instructions.items():
+            for rank, handler in self.connection_order.get(instruction.signature, ()):
+                connections.append((rank, location, handler))
+        connections.sort(key=lambda connection: connection[:2])
+        for _, location, handler in connections:
+            handler(location, instructions[location], exit_point)
 
     def apply_unconditional_jumps(self):
         for signature, index in self.uncond_jump_instructions.items():
@@ -158,28 +298,39 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
                 print(f"Processing {self.signature_to_name[signature]} ({signature:X})...")
             instructions = self.file.getInstructions(signature)
             for location, instruction in instructions.items():
-                jumping_arg = instruction.ordered_PAC_params[index]
-                offset = jumping_arg[1]
-                save_address = signature in self.saving_RA_instructions
-                transition = PAC_transition(
-                    save_address=save_address, fallthrough=False, potential=False, special=False, callback=False
-                )
-                res = self.connect_location_to_offset(location, offset, transition)
-                if self.verbose_level <= 3:
-                    if res == -1:
-                        print(f"Failed to get a block at offset 0x{offset:X}")
-                    elif res == 0:
-                        print(f"0x{offset:X} is not a valid instruction start!")
-
-                # The general code would've been 'if signature in save_address'
-                if signature == self.cmd_call:
-                    transition = PAC_transition(
-                        save_address=False, fallthrough=False, potential=True, special=False, callback=False
-                    )
-                    res = self.connect_location_to_offset(location, location + instruction.size, transition)
-                    if self.verbose_level <= 3:
-                        if res != 1:
-                            print(f"Attempt to connect {instruction.name} to the next instruction failed")
+                _, block = self.get_block_by_offset(location)
+                self.connect_unconditional_jump(location, instruction, block.exit_point)
+
+    def connect_unconditional_jump(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint):
+        signature = instruction.signature
+        jumping_arg = instruction.ordered_PAC_params[self.uncond_jump_instructions[signature]]
+        offset = jumping_arg[1]
+        save_address = signature in self.saving_RA_instructions
+        transition = PAC_transition(
+            save_address=save_address, fallthrough=False, potential=False, special=False, callback=False
+        )
+        res = self.connect_exit_to_offset(exit_point, offset, transition)
+        if self.verbose_level <= 3:
+            if res == -1:
+                print(f"Failed to get a block at offset 0x{offset:X}")
+            elif res == 0:
+                print(f"0x{offset:X} is not a valid instruction start!")
+
+        # The general code would've been 'if signature in save_address'
+        if signature == self.cmd_call:
+            transition = PAC_transition(
+                save_address=False, fallthrough=False, potential=True, special=False, callback=False
+            )
+            res = self.connect_exit_to_offset(exit_point, location + instruction.size, transition)
+            if self.verbose_level <= 3:
+                if res != 1:
+                    print(f"Attempt to connect {instruction.name} to the next instruction failed")
+
+    def connect_cmd_inxJmp(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint):
+        # The switch-case table goes right after cmd_inxJmp
+        table = self.file.entities.get(location + instruction.size)
+        if type(table) is Switch_case_table:
+            self.connect_switch_case_table(table, exit_point)
 
     def elementary_label_study(self):
         cmd_setLabelId_instructions = self.file.getInstructions(self.cmd_setLabelId)
@@ -207,27 +358,31 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
             instructions = self.file.getInstructions(signature)
 
             for location, instruction in instructions.items():
-                index_arg = instruction.ordered_PAC_params[0]
-                if index_arg[0].type != "uint32_t":
-                    print(f"Label index is passed through {index_arg[0].type}!")
-                    continue
-                if index_arg[1] not in self.label_to_offset:
-                    print(f"Unknown label {index_arg[1]} accessed at 0x{location:X}!")
-                    continue
-
-                # Else we can do our job
-                offsets = self.label_to_offset[index_arg[1]]
-                save_address = instruction.signature in self.saving_RA_instructions
-                for offset in offsets:
-                    transition = PAC_transition(
-                        save_address=save_address, fallthrough=False, potential=False, special=False, callback=False
-                    )
-                    res = self.connect_location_to_offset(location, offset, transition)
-                    if self.verbose_level <= 3:
-                        if res == -1:
-                            print(f"Failed to get a block at offset 0x{offset:X}")
-                        elif res == 0:
-                            print(f"0x{offset:X} is not a valid instruction start!")
+                _, block = self.get_block_by_offset(location)
+                self.connect_label_jump(location, instruction, block.exit_point)
+
+    def connect_label_jump(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint):
+        index_arg = instruction.ordered_PAC_params[0]
+        if index_arg[0].type != "uint32_t":
+            print(f"Label index is passed through {index_arg[0].type}!")
+            return
+        if index_arg[1] not in self.label_to_offset:
+            print(f"Unknown label {index_arg[1]} accessed at 0x{location:X}!")
+            return
+
+        # Else we can do our job
+        offsets = self.label_to_offset[index_arg[1]]
+        save_address = instruction.signature in self.saving_RA_instructions
+        for offset in offsets:
+            transition = PAC_transition(
+                save_address=save_address, fallthrough=False, potential=False, special=False, callback=False
+            )
+            res = self.connect_exit_to_offset(exit_point, offset, transition)
+            if self.verbose_level <= 3:
+                if res == -1:
+                    print(f"Failed to get a block at offset 0x{offset:X}")
+                elif res == 0:
+                    print(f"0x{offset:X} is not a valid instruction start!")
 
     def elementary_runtime_jump_study(self):
         # This function just connects cmd_CallLabel instructions to the following blocks
@@ -235,19 +390,54 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
         signatures = (self.cmd_jmpLabel, self.cmd_callLabel)
         for signature in signatures:
             if self.verbose_level <= 2:
-                print(f"Processing {self.signature_to_name[signature]} ({signature:X})...")
+                print(f"Processing {self.signature_to_name.get(signature)} ({signature:X})...")
             instructions = self.file.getInstructions(signature)
 
             for location, instruction in instructions.items():
-                if signature in self.saving_RA_instructions:
-                    # Let's connect it to the next block
-                    transition = PAC_transition(
-                        save_address=False, fallthrough=False, potential=True, special=False, callback=False
-                    )
-                    res = self.connect_location_to_offset(location, location + instruction.size, transition)
-                    if self.verbose_level <= 3:
-                        if res != 1:
-                            print(f"Attempt to connect {instruction.name} to the next instruction failed")
+                _, block = self.get_block_by_offset(location)
+                self.connect_runtime_jump(location, instruction, block.exit_point)
+
+    def connect_runtime_jump(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint):
+        if instruction.signature in self.saving_RA_instructions:
+            # Let's connect it to the next block
+            transition = PAC_transition(
+                save_address=False, fallthrough=False, potential=True, special=False, callback=False
+            )
+            res = self.connect_exit_to_offset(exit_point, location + instruction.size, transition)
+            if self.verbose_level <= 3:
+                if res != 1:
+                    print(f"Attempt to connect {instruction.name} to the next instruction failed")
+
+    def connect_recovered_jump(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint):
+        """
+        Connects cmd_jmpLabel / cmd_callLabel to the destinations found by intermediate_runtime_jump_study\n
+        :return: the number of the connected destinations or None if the destinations are unknown
+        """
+        if location not in self.recovered_jumps:
+            return None
+        return self.connect_destinations(location, instruction, exit_point, self.recovered_jumps[location])
+
+    def connect_destinations(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint,
+                             destinations: List[int]) -> int:
+        """
+        :return: the number of the destinations that were connected
+        """
+        save_ra = instruction.signature in self.saving_RA_instructions
+        transition = PAC_transition(
+            save_address=save_ra, fallthrough=False, potential=False, special=False, callback=False
+        )
+        connected = 0
+        for offset in destinations:
+            res = self.connect_exit_to_offset(exit_point, offset, transition)
+            if res == -1:
+                if self.verbose_level <= 3:
+                    print(f"Failed to get a block at offset 0x{offset:X} (jump at 0x{location:X})")
+            elif res == 0:
+                if self.verbose_level <= 3:
+                    print(f"0x{offset:X} is not a valid instruction start (jump at 0x{location:X})!")
+            else:
+                connected += 1
+        return connected
 
     def attempt_variable_recovery(self, references: Dict[int, Dict[int, PAC_instruction]],
                                   variable_to_offset: Dict[PAC_variable, List[int]]):
@@ -347,7 +537,7 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
         offset_to_jumping_variable: Dict[int, PAC_variable] = {}
         for signature in signatures:
             if self.verbose_level <= 2:
-                print(f"Processing {self.signature_to_name[signature]} ({signature:X})...")
+                print(f"Processing {self.signature_to_name.get(signature)} ({signature:X})...")
             instructions = self.file.getInstructions(signature)
             for location, instruction in instructions.items():
                 # It's the only hardcoded part: the destination is contained in the first argument
@@ -361,17 +551,65 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
                 variable_to_offset[variable] = []
             variable_to_offset[variable].append(location)
 
+        # The destinations are computed from IntLocals: let's propagate the values they may hold
+        int_locals = {variable.value for variable in variable_to_offset if variable.type.startswith("0x4")}
+        tracked = PAC_ValueSetAnalysis.get_tracked_variables(self.file.ordered_instructions, int_locals)
+        # Changing the instructions that use these variables may change the recovered jumps
+        self.jumping_variables = tracked | {
+            variable.value for variable in variable_to_offset if "variable" in variable.type
+        }
+
+        # Every new edge can make more code (and more values) reachable, so we repeat until nothing changes
+        recovered_jumps_count = 0
+        iterations = 0
+        while True:
+            iterations += 1
+            analysis = PAC_ValueSetAnalysis(self, tracked)
+            analysis.solve()
+
+            new_destinations: Dict[int, Set[int]] = {}
+            for offset, variable in offset_to_jumping_variable.items():
+                if not variable.type.startswith("0x4"):
+                    continue
+                values = analysis.get_values_at(offset, variable.value)
+                if values:
+                    # Neither unknown nor unassigned on every path
+                    new_destinations[offset] = set(values)
+
+            # The edges are added in one go, the analysis sees all of them in the next iteration
+            added = 0
+            for offset, destinations in new_destinations.items():
+                added += self.add_recovered_destinations(offset, destinations)
+            recovered_jumps_count += added
+            if not added:
+                break
+        if self.verbose_level <= 2:
+            print(f"Value-set propagation: {iterations} iterations, {analysis.visits} visits in the last one")
+
+        # Most destinations are set right before the jump: the CFG changes elsewhere can't affect them
+        for offset in self.recovered_jumps:
+            move = analysis.get_defining_move(offset, offset_to_jumping_variable[offset].value)
+            if move is None:
+                self.flow_dependent_jumps.add(offset)
+            else:
+                self.guarded_jump_ranges.append((move, offset))
+        self.guarded_jump_ranges.sort()
+
         # We're gonna assume that only IntLocals can be used for the destination
         references, _, _, _ = associate_pac_vars_and_instr(self.file)
         # 'references[variable_index]' is a dict of (location -> instruction)
         # It stores all instructions which use IntLocal[variable_index]
 
-        # If we're lucky, we'll be able to uniquely identify the values that are stored in these variables
-        recovered_variables = self.attempt_variable_recovery(references, variable_to_offset)
+        # The jumps that the propagation couldn't resolve: maybe their variables are set only once
+        remaining: Dict[PAC_variable, List[int]] = {}
+        for variable, offsets in variable_to_offset.items():
+            offsets = [offset for offset in offsets if offset not in self.recovered_jumps]
+            if offsets:
+                remaining[variable] = offsets
+        recovered_variables = self.attempt_variable_recovery(references, remaining)
 
         # We could have recovered some branches
-        recovered_jumps_count = 0
-        for variable, offsets in variable_to_offset.items():
+        for variable, offsets in remaining.items():
             # Time to see if we were lucky with this variable
             if variable not in recovered_variables:
                 for offset in offsets:
@@ -382,19 +620,10 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
             # We're here => we've recovered this jump
             # That means we can now update all the places where this variable is used
             for offset in offsets:
-                save_ra = self.file.ordered_instructions[offset].signature in self.saving_RA_instructions
-                transition = PAC_transition(
-                    save_address=save_ra, fallthrough=False, potential=False, special=False, callback=False
-                )
-                res = self.connect_location_to_offset(offset, recovered_variables[variable], transition)
-                if res == -1:
-                    if self.verbose_level <= 3:
-                        print(f"Failed to get a block at offset 0x{offset:X}")
-                elif res == 0:
-                    if self.verbose_level <= 3:
-                        print(f"0x{offset:X} is not a valid instruction start!")
-                else:
-                    recovered_jumps_count += 1
+                self.recovered_jumps[offset] = [recovered_variables[variable]]
+                _, block = self.get_block_by_offset(offset)
+                res = self.connect_recovered_jump(offset, self.file.ordered_instructions[offset], block.exit_point)
+                recovered_jumps_count += res
         if self.verbose_level <= 2:
             print(f"Recovered jumps count = {recovered_jumps_count}")
             print("Unrecovered jumps:", self.unrecovered_jumps)
@@ -403,60 +632,94 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
 
         # Let's see how many jumps follow the rule "getGateInfo -> cmd_jumpLabel/cmd_callLabel" ...
         for offset in self.unrecovered_jumps:
-            index = binary_search(self.file.entities_offsets, offset)
-            if index == 0:
-                if self.verbose_level <= 3:
-                    print(f"The first file entity is {self.file.entities[index].name}")
-                continue
-            previous = self.file.entities[self.file.entities_offsets[index - 1]]
-            if type(previous) is not PAC_instruction or previous.signature != 0x2516BE00:
-                # not getGateInfo
-                if self.verbose_level <= 3:
-                    print(f"Unrecognized runtime jump practice: getGateInfo does not precede 0x{offset:X}")
-                continue
-            # Recognized pattern...!
-            self.getGateInfo_block_offsets.add(self.get_block_by_offset(offset)[0])
+            self.register_getGateInfo_jump(offset)
+
+    def register_getGateInfo_jump(self, offset: int):
+        """
+        Remembers the block of an unrecovered runtime jump if getGateInfo goes right before it\n
+        :param offset: the offset of cmd_jmpLabel / cmd_callLabel
+        :return: None
+        """
+        index = binary_search(self.file.entities_offsets, offset)
+        if index == 0:
+            if self.verbose_level <= 3:
+                print(f"The first file entity is {self.file.entities[index].name}")
+            return
+        previous = self.file.entities[self.file.entities_offsets[index - 1]]
+        if type(previous) is not PAC_instruction or previous.signature != 0x2516BE00:
+            # not getGateInfo
+            if self.verbose_level <= 3:
+                print(f"Unrecognized runtime jump practice: getGateInfo does not precede 0x{offset:X}")
+            return
+        # Recognized pattern...!
+        self.getGateInfo_block_offsets.add(self.get_block_by_offset(offset)[0])
+        self.getGateInfo_jumps[offset] = self.file.entities_offsets[index - 1]
+
+    def add_recovered_destinations(self, offset: int, destinations: Set[int]) -> int:
+        """
+        Remembers and connects the destinations of a runtime jump that weren't known yet\n
+        :param offset: the offset of cmd_jmpLabel / cmd_callLabel
+        :param destinations: the offsets it may lead to
+        :return: the number of the new destinations
+        """
+        known = self.recovered_jumps.get(offset, [])
+        new = sorted(destinations.difference(known))
+        if not new:
+            return 0
+        self.recovered_jumps[offset] = known + new
+        _, block = self.get_block_by_offset(offset)
+        self.connect_destinations(offset, self.file.ordered_instructions[offset], block.exit_point, new)
+        return len(new)
+
+    def forget_unrecovered_jump(self, offset: int):
+        """
+        Called when the destinations of a jump from unrecovered_jumps are found
+        """
+        del self.unrecovered_jumps[offset]
+        if self.getGateInfo_jumps.pop(offset, None) is not None:
+            self.getGateInfo_block_offsets.discard(self.get_block_by_offset(offset)[0])
+        self.flow_dependent_jumps.add(offset)
 
     def apply_returning_instructions(self):
         if self.verbose_level <= 2:
             print("Step 6: apply returning instructions...")
         for signature in self.returning_instructions:
-
-            # doSelect and doSelectCursor get special treatment
-            if signature == self.doSelect or signature == self.doSelectCursor:
-                instruction_name = self.signature_to_name[signature]
-                if self.verbose_level <= 2:
-                    print(f"Processing {instruction_name}...")
-                instructions = self.file.getInstructions(signature)
-                for location, instruction in instructions.items():
-                    jumping_offset = instruction.ordered_PAC_params[0][1]
-                    res = self.get_block_by_offset(jumping_offset)
-                    if res is None or res[0] != jumping_offset:
-                        if self.verbose_level <= 2:
-                            print(f"Unrecognized {instruction_name} usage practice at 0x{location:X}!")
-                    else:
-                        _, block = res
-                        transition = PAC_transition(
-                            save_address=False, fallthrough=False, potential=False, special=True, callback=False
-                        )
-                        res = self.connect_location_to_offset(location, jumping_offset, transition)
-                        if self.verbose_level <= 2:
-                            if res != 1:
-                                print(f"For some reason {instruction_name} connection failed at 0x{location:X}")
-                continue
-
-            # Ordinary instructions
             if self.verbose_level <= 2:
                 print(f"Processing {self.signature_to_name[signature]}...")
             instructions = self.file.getInstructions(signature)
             for location, instruction in instructions.items():
+                _, block = self.get_block_by_offset(location)
+                self.connect_returning_instruction(location, instruction, block.exit_point)
+
+    def connect_returning_instruction(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint):
+        signature = instruction.signature
+
+        # doSelect and doSelectCursor get special treatment
+        if signature == self.doSelect or signature == self.doSelectCursor:
+            instruction_name = self.signature_to_name[signature]
+            jumping_offset = instruction.ordered_PAC_params[0][1]
+            res = self.get_block_by_offset(jumping_offset)
+            if res is None or res[0] != jumping_offset:
+                if self.verbose_level <= 2:
+                    print(f"Unrecognized {instruction_name} usage practice at 0x{location:X}!")
+            else:
                 transition = PAC_transition(
-                    save_address=False, fallthrough=False, potential=True, special=False, callback=False
+                    save_address=False, fallthrough=False, potential=False, special=True, callback=False
                 )
-                res = self.connect_location_to_offset(location, location + instruction.size, transition)
+                res = self.connect_exit_to_offset(exit_point, jumping_offset, transition)
                 if self.verbose_level <= 2:
                     if res != 1:
-                        print(f"Attempt to connect {instruction.name} to the next instruction failed")
+                        print(f"For some reason {instruction_name} connection failed at 0x{location:X}")
+            return
+
+        # Ordinary instructions
+        transition = PAC_transition(
+            save_address=False, fallthrough=False, potential=True, special=False, callback=False
+        )
+        res = self.connect_exit_to_offset(exit_point, location + instruction.size, transition)
+        if self.verbose_level <= 2:
+            if res != 1:
+                print(f"Attempt to connect {instruction.name} to the next instruction failed")
 
     def apply_callbacks(self):
         if self.verbose_level <= 2:
@@ -467,38 +730,8 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
 
             instructions = self.file.getInstructions(signature)
             for location, instruction in instructions.items():
-                transition = PAC_transition(
-                    save_address=False, fallthrough=False, potential=False, special=False, callback=False
-                )
-                res = self.connect_location_to_offset(location, location + instruction.size, transition)
-                if res != 1:
-                    if self.verbose_level <= 3:
-                        print(f"Attempt to connect {instruction.name} to the next instruction failed")
-                else:
-                    block: ContiguousCodeBlock
-                    _, block = self.get_block_by_offset(location)
-                    block.is_split = True  # for the SVG graph
-
-                # Now then... Let's see if the last instruction actually makes a callback
-                callback_param, offset = instruction.ordered_PAC_params[index]
-                arg_type = callback_param.type
-                if arg_type.startswith("0x1") or arg_type.startswith("uint32_t_P") or arg_type.startswith("uintX_t"):
-                    # It is a callback
-                    transition = PAC_transition(
-                        save_address=False, fallthrough=False, potential=False, special=False, callback=True
-                    )
-                    res = self.connect_location_to_offset(location, offset, transition)
-                    if res == -1:
-                        if self.verbose_level <= 2:
-                            print(f"Failed to get a block at offset 0x{offset:X}")
-                    elif res == 0:
-                        if self.verbose_level <= 2:
-                            print(f"0x{offset:X} is not a valid instruction start!")
-                    else:
-                        self.callback_destinations[location] = offset
-                else:
-                    # Do nothing
-                    pass
+                _, block = self.get_block_by_offset(location)
+                self.connect_callback_instruction(location, instruction, block.exit_point)
         if self.verbose_level <= 2:
             print("Callbacks found!" if self.callback_destinations else "No callbacks found!")
 
@@ -521,6 +754,39 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
                 print("The file ends with a split block!")
             self.split_blocks[offset_buffer[0]] = offset_buffer
 
+    def connect_callback_instruction(self, location: int, instruction: PAC_instruction, exit_point: ExitPoint):
+        transition = PAC_transition(
+            save_address=False, fallthrough=False, potential=False, special=False, callback=False
+        )
+        res = self.connect_exit_to_offset(exit_point, location + instruction.size, transition)
+        if res != 1:
+            if self.verbose_level <= 3:
+                print(f"Attempt to connect {instruction.name} to the next instruction failed")
+        else:
+            exit_point.code_block.is_split = True  # for the SVG graph
+            self.callback_fallthroughs.add(location)
+
+        # Now then... Let's see if the last instruction actually makes a callback
+        callback_param, offset = instruction.ordered_PAC_params[self.callback_instructions[instruction.signature]]
+        arg_type = callback_param.type
+        if arg_type.startswith("0x1") or arg_type.startswith("uint32_t_P") or arg_type.startswith("uintX_t"):
+            # It is a callback
+            transition = PAC_transition(
+                save_address=False, fallthrough=False, potential=False, special=False, callback=True
+            )
+            res = self.connect_exit_to_offset(exit_point, offset, transition)
+            if res == -1:
+                if self.verbose_level <= 2:
+                    print(f"Failed to get a block at offset 0x{offset:X}")
+            elif res == 0:
+                if self.verbose_level <= 2:
+                    print(f"0x{offset:X} is not a valid instruction start!")
+            else:
+                self.callback_destinations[location] = offset
+        else:
+            # Do nothing
+            pass
+
     def apply_jump_table_to_blocks(self):
         if self.verbose_level <= 3:
             print("Step 1: conditional jumps...")
@@ -592,102 +858,7 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
         keys = list(self.code_blocks.keys())
         # Let's save the info about these blocks...
         for location in keys:
-            code_block = self.code_blocks[location]
-
-            if len(code_block.entry_points) == 1:
-                continue
-            # Now let's deal with this abnormality
-
-            offsets = sorted(code_block.entry_points.keys())
-            self.split_blocks[offsets[0]] = offsets
-
-            end_location = location + code_block.size
-            last_block = True
-            for offset in offsets[:0:-1]:
-                # Everything in [offset; end_location) is a new block
-                new_block = ContiguousCodeBlock()
-                new_block.size = end_location - offset
-                new_block.start = offset
-
-                instructions: Dict[int, PAC_instruction] = {}
-                ordered_instructions: List[PAC_instruction] = []
-                for instr_offset, instr in code_block.instructions.items():
-                    if instr_offset < offset:
-                        continue
-                    instructions[instr_offset] = instr
-                    ordered_instructions.append(instr)
-                new_block.instructions = instructions
-                new_block.ordered_instructions = ordered_instructions
-                new_block.instructions_offsets = sorted(new_block.instructions.keys())
-
-                # Now let's prepare the exitpoint
-                new_block.exit_point.code_block = new_block
-                new_block.exit_point.instruction = ordered_instructions[-1]
-                new_block.exit_point.position = new_block.instructions_offsets[-1]
-
-                # Reattach entry points to the new exitpoint
-                edge: PAC_Edge
-                for edge in code_block.exit_point.where_to:
-                    new_block.exit_point.where_to.append(edge)
-                    # edge.exit.where_to.remove(edge)
-                    edge.exit = new_block.exit_point
-                code_block.exit_point.where_to = []
-
-                # Now let's shorten the current block
-                code_block.size -= new_block.size
-                shortened_instructions = {
-                    instr_offset: code_block.instructions[instr_offset]
-                    for instr_offset in sorted(set(code_block.instructions) - set(new_block.instructions))
-                }
-                code_block.instructions = shortened_instructions
-                count = len(new_block.instructions_offsets)
-                code_block.instructions_offsets = code_block.instructions_offsets[: -count]
-                code_block.ordered_instructions = code_block.ordered_instructions[: -count]
-
-                # Now let's modify the exitpoint
-                code_block.exit_point.instruction = code_block.ordered_instructions[-1]
-                code_block.exit_point.position = code_block.instructions_offsets[-1]
-
-                # Now let's prepare the entry point
-                entry_point = EntryPoint()
-                entry_point.position = new_block.start
-                entry_point.instruction = new_block.ordered_instructions[0]
-                entry_point.code_block = new_block
-
-                new_edge = PAC_Edge()
-                # new_edge.properties = new_edge.properties._replace(save_address=False)  # Yeah, dataclasses...
-                new_edge.exit = code_block.exit_point
-                new_edge.entry = entry_point
-                code_block.exit_point.where_to = [new_edge]
-
-                # Two-step setup:
-                entry_point.where_from = [new_edge]
-                # ...but there could have been other jumps to this entry point:
-                entry_point.where_from.extend(code_block.entry_points[offset].where_from)
-
-                new_block.entry_points[new_block.start] = entry_point
-
-                # Let's modify all edges which point to the old entry point
-                for edge in code_block.entry_points[offset].where_from:
-                    edge.entry = entry_point
-
-                # Now let's delete this entry point
-                del code_block.entry_points[offset]
-
-                # new_block is ready to be deployed
-                new_block.is_source = False
-                self.code_blocks[new_block.start] = new_block
-                end_location = new_block.start
-
-                # And let's mark all the blocks as split besides the last one
-                if last_block:
-                    last_block = False
-                else:
-                    new_block.is_split = True
-            code_block.is_split = True
-            # After the block has been split, it could have become a source
-            if not code_block.get_entry_point().where_from:
-                code_block.is_source = True
+            self.normalize_block(location)
         reordered_code_blocks: Dict[int, ContiguousCodeBlock] = {}
         keys = sorted(self.code_blocks.keys())
         for key in keys:
@@ -696,3 +867,356 @@ class PAC_CodeBlocks(BasePacCodeBlocks):
         self.code_blocks = reordered_code_blocks
         self.sort_jumps_from()
 
+    def normalize_block(self, location: int) -> List[int]:
+        """
+        Splits the block so that every entry point becomes the start of a block\n
+        :param location: the start of the block
+        :return: the start offsets of the new blocks (the order is descending)
+        """
+        code_block = self.code_blocks[location]
+        new_offsets: List[int] = []
+
+        if len(code_block.entry_points) == 1:
+            return new_offsets
+        # Now let's deal with this abnormality
+
+        offsets = sorted(code_block.entry_points.keys())
+        self.split_blocks[offsets[0]] = offsets
+        # The block is shortened in place, so the digests of its old contents go
+        code_block.digests.clear()
+
+        end_location = location + code_block.size
+        last_block = True
+        for offset in offsets[:0:-1]:
+            # Everything in [offset; end_location) is a new block
+            new_block = ContiguousCodeBlock()
+            new_block.size = end_location - offset
+            new_block.start = offset
+
+            instructions: Dict[int, PAC_instruction] = {}
+            ordered_instructions: List[PAC_instruction] = []
+            for instr_offset, instr in code_block.instructions.items():
+                if instr_offset < offset:
+                    continue
+                instructions[instr_offset] = instr
+                ordered_instructions.append(instr)
+            new_block.instructions = instructions
+            new_block.ordered_instructions = ordered_instructions
+            new_block.instructions_offsets = sorted(new_block.instructions.keys())
+
+            # Now let's prepare the exitpoint
+            new_block.exit_point.code_block = new_block
+            new_block.exit_point.instruction = ordered_instructions[-1]
+            new_block.exit_point.position = new_block.instructions_offsets[-1]
+
+            # Reattach entry points to the new exitpoint
+            edge: PAC_Edge
+            for edge in code_block.exit_point.where_to:
+                new_block.exit_point.where_to.append(edge)
+                # edge.exit.where_to.remove(edge)
+                edge.exit = new_block.exit_point
+            code_block.exit_point.where_to = []
+
+            # Now let's shorten the current block
+            code_block.size -= new_block.size
+            shortened_instructions = {
+                instr_offset: code_block.instructions[instr_offset]
+                for instr_offset in sorted(set(code_block.instructions) - set(new_block.instructions))
+            }
+            code_block.instructions = shortened_instructions
+            count = len(new_block.instructions_offsets)
+            code_block.instructions_offsets = code_block.instructions_offsets[: -count]
+            code_block.ordered_instructions = code_block.ordered_instructions[: -count]
+
+            # Now let's modify the exitpoint
+            code_block.exit_point.instruction = code_block.ordered_instructions[-1]
+            code_block.exit_point.position = code_block.instructions_offsets[-1]
+
+            # Now let's prepare the entry point
+            entry_point = EntryPoint()
+            entry_point.position = new_block.start
+            entry_point.instruction = new_block.ordered_instructions[0]
+            entry_point.code_block = new_block
+
+            new_edge = PAC_Edge()
+            # new_edge.properties = new_edge.properties._replace(save_address=False)  # Yeah, dataclasses...
+            new_edge.exit = code_block.exit_point
+            new_edge.entry = entry_point
+            code_block.exit_point.where_to = [new_edge]
+
+            # Two-step setup:
+            entry_point.where_from = [new_edge]
+            # ...but there could have been other jumps to this entry point:
+            entry_point.where_from.extend(code_block.entry_points[offset].where_from)
+
+            new_block.entry_points[new_block.start] = entry_point
+
+            # Let's modify all edges which point to the old entry point
+            for edge in code_block.entry_points[offset].where_from:
+                edge.entry = entry_point
+
+            # Now let's delete this entry point
+            del code_block.entry_points[offset]
+
+            # new_block is ready to be deployed
+            new_block.is_source = False
+            self.code_blocks[new_block.start] = new_block
+            new_offsets.append(new_block.start)
+            end_location = new_block.start
+
+            # And let's mark all the blocks as split besides the last one
+            if last_block:
+                last_block = False
+            else:
+                new_block.is_split = True
+        code_block.is_split = True
+        # After the block has been split, it could have become a source
+        if not code_block.get_entry_point().where_from:
+            code_block.is_source = True
+        return new_offsets
+
+
+    def is_block_terminator(self, block: ContiguousCodeBlock) -> bool:
+        return block.exit_point.instruction.signature in self.block_terminators
+
+    def get_chain_bounds(self, index: int) -> Tuple[int, int]:
+        """
+        Finds the blocks that were made from the same block by normalize_entrypoints\n
+        :param index: the index of a block in block_start_offsets
+        :return: the indices of the first and the last block of the chain (inclusive)
+        """
+        offsets = self.block_start_offsets
+        first = index
+        while first > 0 and not self.is_block_terminator(self.code_blocks[offsets[first - 1]]):
+            first -= 1
+        last = index
+        while last < len(offsets) - 1 and not self.is_block_terminator(self.code_blocks[offsets[last]]):
+            last += 1
+        return first, last
+
+    def requires_full_rebuild(self, diff: PAC_entity_diff) -> bool:
+        """
+        Checks if the change affects the whole file: labels, runtime jumps and switch-case tables are studied globally\n
+        :param diff: the change notification from PAC_parser
+        :return: True if the blocks have to be built from scratch
+        """
+        global_signatures = {
+            self.cmd_inxJmp, self.cmd_setLabelId, self.cmd_jmpLabelId, self.cmd_callLabelId,
+            self.cmd_jmpLabel, self.cmd_callLabel, 0x2516BE00, 0x2516BD00  # getGateInfo, setGateInfo
+        }
+        for entities in (diff.removed, diff.added):
+            for location, entity in entities.items():
+                if type(entity) is Switch_case_table:
+                    return True
+                if type(entity) is not PAC_instruction:
+                    continue
+                if entity.signature in global_signatures:
+                    return True
+                if not self.jumping_variables.isdisjoint(entity.get_used_pac_vars().var_0x4):
+                    return True
+                if entity.signature in self.block_terminators and self.affects_runtime_jumps(location, entity):
+                    return True
+        return False
+
+    def affects_runtime_jumps(self, location: int, instruction: PAC_instruction) -> bool:
+        """
+        The propagated values depend on which code is reachable and on where the blocks are cut\n
+        :param location: the offset of a block terminator that was added or removed
+        :param instruction: the block terminator
+        :return: True if the destinations of the runtime jumps may change
+        """
+        if self.flow_dependent_jumps:
+            return True
+        if any(variable.type.startswith("0x4") for variable in self.unrecovered_jumps.values()):
+            # New paths may bring the values (or the gates) they lack
+            return True
+        if not self.guarded_jump_ranges:
+            return False
+        destinations = [location]
+        for param, value in instruction.ordered_PAC_params:
+            if is_pointer_param(param.type):
+                destinations.extend(value if type(value) is list else [value])
+        for destination in destinations:
+            index = binary_search_lambda(self.guarded_jump_ranges, destination, key=lambda jump_range: jump_range[0])
+            if index != -1 and self.guarded_jump_ranges[index][0] < destination <= self.guarded_jump_ranges[index][1]:
+                return True
+        return False
+
+    def refresh_split_blocks(self, locations: Set[int]):
+        """
+        Recomputes split_blocks and the is_split flags around the given blocks\n
+        The result is the same as if apply_callbacks and normalize_entrypoints were called for the whole file\n
+        :param locations: the start offsets of some blocks
+        :return: None
+        """
+        offsets = self.block_start_offsets
+        done = -1
+        for location in sorted(locations):
+            index = binary_search(offsets, location)
+            if index <= done:
+                continue
+            first, last = self.get_chain_bounds(index)
+
+            # Callbacks group chains together: the callback chains and the chain after them
+            while first > 0:
+                previous_first, previous_last = self.get_chain_bounds(first - 1)
+                if self.code_blocks[offsets[previous_last]].exit_point.position not in self.callback_fallthroughs:
+                    break
+                first = previous_first
+            while last < len(offsets) - 1:
+                if self.code_blocks[offsets[last]].exit_point.position not in self.callback_fallthroughs:
+                    break
+                _, last = self.get_chain_bounds(last + 1)
+            done = last
+
+            for offset in offsets[first:last + 1]:
+                self.split_blocks.pop(offset, None)
+
+            chains: List[Tuple[int, int]] = []
+            offset_buffer = []
+            last_was_split = False
+            index = first
+            while index <= last:
+                chain_first, chain_last = self.get_chain_bounds(index)
+                chains.append((chain_first, chain_last))
+                is_split = self.code_blocks[offsets[chain_last]].exit_point.position in self.callback_fallthroughs
+                if is_split:
+                    offset_buffer.append(offsets[chain_first])
+                elif last_was_split:
+                    offset_buffer.append(offsets[chain_first])
+                    self.split_blocks[offset_buffer[0]] = offset_buffer
+                    offset_buffer = []
+                last_was_split = is_split
+                index = chain_last + 1
+            if offset_buffer:
+                self.split_blocks[offset_buffer[0]] = offset_buffer
+
+            for chain_first, chain_last in chains:
+                if chain_first == chain_last:
+                    block = self.code_blocks[offsets[chain_first]]
+                    block.is_split = block.exit_point.position in self.callback_fallthroughs
+                    continue
+                self.split_blocks[offsets[chain_first]] = offsets[chain_first:chain_last + 1]
+                for i in range(chain_first, chain_last + 1):
+                    self.code_blocks[offsets[i]].is_split = i != chain_last
+
+    def apply_entity_diff(self, diff: PAC_entity_diff) -> Optional[PAC_CFG_diff]:
+        """
+        Updates the blocks and the edges after a part of the file has been reparsed (see PAC_parser.patch)\n
+        Only the blocks around the reparsed range and the blocks that jump there are rebuilt\n
+        :param diff: the change notification from PAC_parser
+        :return: the description of the changes or None if the blocks have to be built from scratch
+        """
+        if not self.block_start_offsets or not self.file.instructions_offsets or self.requires_full_rebuild(diff):
+            return None
+        offsets = self.block_start_offsets
+
+        # 1) The chains that overlap the reparsed range
+        first = max(binary_search(offsets, diff.start), 0)
+        last = max(binary_search(offsets, diff.end - 1), first)
+        first, _ = self.get_chain_bounds(first)
+        _, last = self.get_chain_bounds(last)
+        while last < len(offsets) - 1 and diff.start <= self.code_blocks[offsets[last]].exit_point.position < diff.end:
+            # The instruction that ended the chain was reparsed => the chain might go on
+            _, last = self.get_chain_bounds(last + 1)
+        ranges: Dict[int, int] = {first: last}
+
+        # 2) The chains which have been split because of the jumps from the reparsed range
+        for index in range(first, last + 1):
+            for edge in self.code_blocks[offsets[index]].get_outgoing():
+                target = binary_search(offsets, edge.entry.position)
+                if first <= target <= last:
+                    continue
+                target_first, target_last = self.get_chain_bounds(target)
+                if target_first != target_last:
+                    ranges[target_first] = target_last
+        ranges_list = sorted(ranges.items())
+        rebuilt: Set[int] = {offset for lo, hi in ranges_list for offset in offsets[lo:hi + 1]}
+
+        # 3) The blocks that jump into the rebuilt chains: all of their edges will be made again
+        sources: Dict[int, List[int]] = {}  # last block of the chain -> the chain
+        for lo, hi in ranges_list:
+            for offset in offsets[lo:hi + 1]:
+                for edge in self.code_blocks[offset].get_incoming():
+                    _, block = self.get_block_by_offset(edge.exit.position)
+                    if block.start in rebuilt or block.start in sources:
+                        continue
+                    chain_first, chain_last = self.get_chain_bounds(binary_search(offsets, block.start))
+                    sources[offsets[chain_last]] = offsets[chain_first:chain_last + 1]
+
+        # 4) Detach the edges
+        touched: Set[int] = set()
+        edges_delta = 0
+        for offset in list(rebuilt) + list(sources):
+            block = self.code_blocks[offset]
+            for edge in block.get_outgoing():
+                edge.entry.where_from.remove(edge)
+                touched.add(edge.entry.code_block.start)
+                edges_delta -= 1
+            block.exit_point.where_to = []
+        touched.update(sources)
+
+        # 5) Replace the blocks
+        for instructions in (diff.removed, *sources.values()):
+            for location in instructions:
+                self.callback_destinations.pop(location, None)
+                self.callback_fallthroughs.discard(location)
+        for offset in rebuilt:
+            self.split_blocks.pop(offset, None)
+            self.getGateInfo_block_offsets.discard(offset)
+            del self.code_blocks[offset]
+
+        new_blocks: List[ContiguousCodeBlock] = []
+        new_offsets = list(offsets)
+        instructions_offsets = self.file.instructions_offsets
+        byte_ranges: List[Tuple[int, int]] = []
+        for lo, hi in reversed(ranges_list):
+            start = 0 if lo == 0 else offsets[lo]
+            end = offsets[hi + 1] if hi + 1 < len(offsets) else self.file.size
+            byte_ranges.append((start, end))
+            instr_lo = binary_search(instructions_offsets, start - 1) + 1
+            instr_hi = binary_search(instructions_offsets, end - 1) + 1
+            blocks = self.construct_blocks(instructions_offsets[instr_lo:instr_hi])
+            new_offsets[lo:hi + 1] = [block.start for block in blocks]
+            new_blocks.extend(blocks)
+        for block in new_blocks:
+            self.code_blocks[block.start] = block
+        self.block_start_offsets = new_offsets
+        touched.difference_update(rebuilt)
+
+        # getGateInfo_block_offsets stores the blocks before normalization, just like the new blocks are now
+        for location in self.unrecovered_jumps:
+            if any(start <= location < end for start, end in byte_ranges):
+                self.register_getGateInfo_jump(location)
+
+        # 6) Make the edges again
+        for block in new_blocks:
+            self.connect_instructions(block.instructions, block.exit_point)
+        for last_offset, chain in sources.items():
+            instructions: Dict[int, PAC_instruction] = {}
+            for offset in chain:
+                instructions.update(self.code_blocks[offset].instructions)
+            self.connect_instructions(instructions, self.code_blocks[last_offset].exit_point)
+        for block in new_blocks + [self.code_blocks[offset] for offset in sources]:
+            for edge in block.get_outgoing():
+                edges_delta += 1
+                if edge.entry.code_block.start not in rebuilt:
+                    touched.add(edge.entry.code_block.start)
+
+        # 7) Normalize the entry points
+        added: List[int] = [block.start for block in new_blocks]
+        for offset in added + sorted(touched):
+            new_pieces = self.normalize_block(offset)
+            added.extend(new_pieces)
+            edges_delta += len(new_pieces)
+        self.block_start_offsets = sorted(self.code_blocks)
+        self.code_blocks = {offset: self.code_blocks[offset] for offset in self.block_start_offsets}
+
+        touched.difference_update(added)
+        for offset in added + list(touched):
+            block = self.code_blocks[offset]
+            block.is_source = not block.get_incoming()
+            block.get_entry_point().where_from.sort(key=lambda edge: edge.exit.position)
+        self.refresh_split_blocks(set(added).union(touched))
+
+        return PAC_CFG_diff(sorted(rebuilt), sorted(added), touched, edges_delta)
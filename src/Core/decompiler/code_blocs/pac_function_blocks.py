@@ -10,87 +10,109 @@ from Core.decompiler.code_blocs.pac_code_blocks import (
 from Core.PAC.pac_file import (
     PAC_file
 )
-from Utils.utils import (
-    binary_search
-)
+from bisect import bisect_left
 
 
-def get_subroutine_possible_starts(code_blocks: PAC_CodeBlocks):
+def get_subroutines(code_blocks: PAC_CodeBlocks) -> Dict[int, int]:
     """
-    Returns all possible start offsets for the PAC subroutines (they need to be filtered later)\n
+    Finds the subroutines: they start at the call / callback destinations, at the first block and at the blocks
+    only the calls lead to. A subroutine owns the blocks it reaches without calls, the blocks several subroutines
+    reach go to the first one (in the order of the starts), the blocks nothing reaches start the subroutines
+    of their own\n
     :param code_blocks: the initialized code blocks
-    :return: the set of valid file offsets
+    :return: the start of a CFG block -> the start of its subroutine
     """
-    ans: Set[int] = set()
-    # 1) some destinations of the edges
-    # We don't need the possible edges that come from cmd_call / cmd_callLabel / cmd_callLabelId:
-    all_destinations: Set[int] = {i.entry.position for i in code_blocks.get_edges()}
-    bad_destinations: Set[int] = {i.entry.position for i in code_blocks.get_step_over_edges()}
-    destinations = all_destinations - bad_destinations
-    ans.update(destinations)
-
-    # 2) the offsets after of the instructions that jump without saving the RA
-    all_jump_locations: Set[int] = {i.exit.position + i.exit.instruction.size for i in code_blocks.get_all_jumps()}
-    ans.update(all_jump_locations)
-
-    # 3) the offsets after the returning instructions (remove the invalid one, if it's there)
-    returning = set(code_blocks.get_offsets_after_returning_instructions())
-    returning.discard(code_blocks.file.size)
-    ans.update(returning)
-
-    # 4) the offsets after the flow-truncators cmd_end, cmd_stkDec and cmd_stkClr
-    # (except for the possible invalid one)
-    truncators: Set[int] = {offset + 4 for offset in code_blocks.get_flow_truncators()}
-    truncators.discard(code_blocks.file.size)
-    ans.update(truncators)
-
-    return ans
+    blocks = code_blocks.code_blocks
+    offsets = code_blocks.block_start_offsets
+    starts: Set[int] = set(offsets[:1])
+    has_predecessors: Set[int] = set()
+    for offset in offsets:
+        for edge in blocks[offset].exit_point.where_to:
+            properties = edge.properties
+            if properties.save_address or properties.callback:
+                starts.add(edge.entry.code_block.start)
+            elif not properties.special:
+                has_predecessors.add(edge.entry.code_block.start)
+    starts.update(offset for offset in offsets if offset not in has_predecessors)
+
+    owner: Dict[int, int] = {}
+    for start in sorted(starts) + offsets:
+        if start in owner:
+            continue
+        owner[start] = start
+        reached = [start]
+        for offset in reached:
+            for edge in blocks[offset].exit_point.where_to:
+                properties = edge.properties
+                if properties.save_address or properties.callback or properties.special:
+                    continue
+                to = edge.entry.code_block.start
+                if to not in owner and to not in starts:
+                    owner[to] = start
+                    reached.append(to)
+    return owner
 
 
 class PAC_FunctionBlocks(BasePacCodeBlocks):
     def __init__(self, file: Optional[PAC_file] = None):
         super().__init__(file)
+        self.subroutine_of: Dict[int, int] = {}  # CFG block start -> subroutine start
+        self.block_to_subroutine: Dict[int, int] = {}  # the start of a block of this partition -> subroutine start
 
     def reset(self, file: PAC_file):
         self.file = file
         self.code_blocks: Dict[int, ContiguousCodeBlock] = {}
         self.block_start_offsets = []
+        self.subroutine_of = {}
+        self.block_to_subroutine = {}
 
-    def construct_block(self, start: int, end: int):
+    def construct_block(self, start: int, end: int) -> Optional[ContiguousCodeBlock]:
         """
-        Creates a basic block from all PAC instructions found in the specified range\n
+        Creates a basic block from all PAC instructions found in the specified range and stores it\n
         :param start: the start of the range, inclusive
         :param end: the end of the range, exclusive
-        :return:
+        :return: the block or None if there are no instructions in the range
         """
-        block = ContiguousCodeBlock()
+        offsets = self.file.instructions_offsets
+        start_index = bisect_left(offsets, start)
+        end_index = bisect_left(offsets, end, start_index)
+        if start_index >= end_index:
+            return None
 
-        start_index = binary_search(self.file.instructions_offsets, start)
-        end_index = binary_search(self.file.instructions_offsets, end)
-        for i in range(start_index, end_index):
-            offset = self.file.instructions_offsets[i]
-            instruction = self.file.ordered_instructions[offset]
+        block = ContiguousCodeBlock()
+        instructions = self.file.ordered_instructions
+        block.instructions_offsets = offsets[start_index:end_index]
+        block.ordered_instructions = [instructions[offset] for offset in block.instructions_offsets]
+        block.instructions = dict(zip(block.instructions_offsets, block.ordered_instructions))
+        block.start = offsets[start_index]
+        block.size = offsets[end_index - 1] + block.ordered_instructions[-1].size - block.start
 
-            block.instructions[offset] = instruction
-            block.ordered_instructions.append(instruction)
-            block.instructions_offsets.append(offset)
-        block.start = self.file.instructions_offsets[start_index]
-        # block.size =
-        pass
+        self.code_blocks[block.start] = block
+        self.block_start_offsets.append(block.start)
+        return block
 
     def break_into_blocks(self, code_blocks: PAC_CodeBlocks):
-        # We run a similar algorithm to split the code into blocks, but this time we know where to split
-        # => we have no need for normalizing entrypoints after that.
-        possible_offsets = sorted(get_subroutine_possible_starts(code_blocks))
-        # print("\n".join((f"0x{offset:X}" for offset in possible_offsets)))
-        if len(possible_offsets) == 1:
-            raise RuntimeError("Exactly one code block boundary!")
-        last_offset = possible_offsets[0]
-        for offset in possible_offsets[1:]:
-            # [last_offset; offset)
-            self.construct_block(last_offset, offset)
-
-            # Update the last offset
-            last_offset = offset
-
-
+        """
+        Makes a block for every run of the CFG blocks that belong to the same subroutine (see get_subroutines),
+        a block spans up to the next run, so the data between the runs is within the ranges\n
+        :param code_blocks: the initialized code blocks
+        :return: None
+        """
+        self.code_blocks = {}
+        self.block_start_offsets = []
+        self.subroutine_of = get_subroutines(code_blocks)
+        self.block_to_subroutine = {}
+        offsets = code_blocks.block_start_offsets
+        if not self.file.instructions_offsets or not offsets:
+            return
+
+        run_starts = [
+            i for i, offset in enumerate(offsets)
+            if i == 0 or self.subroutine_of[offset] != self.subroutine_of[offsets[i - 1]]
+        ]
+        # The code before the first CFG block goes to the first run
+        bounds = [self.file.instructions_offsets[0]] + [offsets[i] for i in run_starts[1:]] + [self.file.size]
+        for i, first in enumerate(run_starts):
+            block = self.construct_block(bounds[i], bounds[i + 1])
+            if block is not None:
+                self.block_to_subroutine[block.start] = self.subroutine_of[offsets[first]]
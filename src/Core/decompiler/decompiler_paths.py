@@ -3,6 +3,7 @@ from Utils.utils import resource_path
 
 # Important paths
 instructions_info_path = resource_path("../../res/newest_p3_instruction_set.bin")
+p2_instructions_info_path = resource_path("../../res/newest_p2_instruction_set.bin")
 cond_jump_instructions_path = resource_path("../../res/cond_jumping_instructions.dat")
 uncond_jump_instructions_path = resource_path("../../res/uncond_jumping_instructions.dat")
 jumping_instructions_path = resource_path("../../res/jumping_instructions.dat")
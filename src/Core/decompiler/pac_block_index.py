@@ -0,0 +1,241 @@
+
+from Core.decompiler.pac_decompiler import (
+    PAC_Decompiler
+)
+from Core.decompiler.pac_vt_session import (
+    PAC_hasher, BytesHasher, InstructionHasher, RawDataHasher, VTSettings, CodeBlockMatcher, DataBlockMatcher
+)
+
+from pathlib import Path
+from typing import NamedTuple, Dict, List, Tuple, Optional
+from zlib import crc32
+import pickle
+
+
+BLOCK_INDEX_VERSION = 2
+BLOCK_INDEX_KINDS = ("bytes", "instructions", "data")
+
+
+class PAC_block_location(NamedTuple):
+    file_name: str
+    offset: int
+
+
+class PAC_file_similarity(NamedTuple):
+    first: str
+    second: str
+    shared: int
+    jaccard: float
+
+
+class PAC_BlockIndex:
+    """
+    An inverted index from the block hashes to the (file, offset) pairs for a whole corpus of PAC files\n
+    For every pair of files the index keeps the number of the distinct hashes they share, so the file similarity
+    is updated with every added or removed file instead of being recomputed for all the pairs
+    """
+    def __init__(self, settings: Optional[VTSettings] = None):
+        self.settings: VTSettings = settings if settings is not None else VTSettings()
+        self.hashers: Dict[str, PAC_hasher] = {
+            "bytes": BytesHasher(),
+            "instructions": InstructionHasher(),
+            "data": RawDataHasher(),
+        }
+
+        self.file_ids: Dict[str, int] = {}
+        self.file_names: Dict[int, str] = {}
+        self.file_checksums: Dict[int, int] = {}
+        self.next_file_id: int = 0
+
+        # kind -> hash -> file id -> offsets
+        self.postings: Dict[str, Dict[int, Dict[int, List[int]]]] = {kind: {} for kind in BLOCK_INDEX_KINDS}
+        # kind -> file id -> offset -> hash
+        self.file_hashes: Dict[str, Dict[int, Dict[int, int]]] = {kind: {} for kind in BLOCK_INDEX_KINDS}
+        # kind -> file id -> the number of distinct hashes
+        self.distinct_counts: Dict[str, Dict[int, int]] = {kind: {} for kind in BLOCK_INDEX_KINDS}
+        # kind -> (smaller file id, bigger file id) -> the number of shared distinct hashes
+        self.shared_counts: Dict[str, Dict[Tuple[int, int], int]] = {kind: {} for kind in BLOCK_INDEX_KINDS}
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def __contains__(self, file_name: str):
+        return file_name in self.file_ids
+
+    def is_up_to_date(self, file_name: str, raw_data: bytes) -> bool:
+        file_id = self.file_ids.get(file_name)
+        return file_id is not None and self.file_checksums[file_id] == crc32(raw_data)
+
+    def hash_file(self, decompiler: PAC_Decompiler) -> Dict[str, Dict[int, int]]:
+        """
+        Hashes every code and data block of the decompiled file that passes the size filters\n
+        :param decompiler: a decompiler that has already processed the file
+        :return: kind -> offset -> hash
+        """
+        code_blocks = CodeBlockMatcher.get_blocks(decompiler, self.settings)
+        data_blocks = DataBlockMatcher.get_blocks(decompiler, self.settings)
+        return {
+            "bytes": self.hashers["bytes"].hash_all(decompiler.file, code_blocks),
+            "instructions": self.hashers["instructions"].hash_all(decompiler.file, code_blocks),
+            "data": self.hashers["data"].hash_all(decompiler.file, data_blocks),
+        }
+
+    def add_file(self, decompiler: PAC_Decompiler, file_name: Optional[str] = None) -> bool:
+        """
+        Adds the file to the index or updates it if the file has changed since it was indexed\n
+        :param decompiler: a decompiler that has already processed the file
+        :param file_name: the name to index the file by (the PAC file's name by default)
+        :return: False if the same file was already indexed and nothing had to be done
+        """
+        if file_name is None:
+            file_name = decompiler.file.name
+        if self.is_up_to_date(file_name, decompiler.file.raw_data):
+            return False
+        if file_name in self.file_ids:
+            self.remove_file(file_name)
+
+        file_id = self.next_file_id
+        self.next_file_id += 1
+        self.file_ids[file_name] = file_id
+        self.file_names[file_id] = file_name
+        self.file_checksums[file_id] = crc32(decompiler.file.raw_data)
+
+        for kind, hashes in self.hash_file(decompiler).items():
+            self.insert_hashes(kind, file_id, hashes)
+        return True
+
+    def insert_hashes(self, kind: str, file_id: int, hashes: Dict[int, int]):
+        postings = self.postings[kind]
+        shared_counts = self.shared_counts[kind]
+
+        offsets_by_hash: Dict[int, List[int]] = {}
+        for offset, block_hash in hashes.items():
+            offsets_by_hash.setdefault(block_hash, []).append(offset)
+
+        for block_hash, offsets in offsets_by_hash.items():
+            files = postings.get(block_hash)
+            if files is None:
+                files = {}
+                postings[block_hash] = files
+            for other_id in files:
+                # The new id is always the biggest one
+                key = (other_id, file_id)
+                shared_counts[key] = shared_counts.get(key, 0) + 1
+            files[file_id] = offsets
+
+        self.file_hashes[kind][file_id] = hashes
+        self.distinct_counts[kind][file_id] = len(offsets_by_hash)
+
+    def remove_file(self, file_name: str):
+        """
+        Removes the file from the index\n
+        :param file_name: the name the file was indexed by
+        :return: None
+        """
+        file_id = self.file_ids.pop(file_name)
+        del self.file_names[file_id]
+        del self.file_checksums[file_id]
+
+        for kind in BLOCK_INDEX_KINDS:
+            postings = self.postings[kind]
+            shared_counts = self.shared_counts[kind]
+            for block_hash in set(self.file_hashes[kind].pop(file_id).values()):
+                files = postings[block_hash]
+                del files[file_id]
+                for other_id in files:
+                    key = (other_id, file_id) if other_id < file_id else (file_id, other_id)
+                    count = shared_counts[key] - 1
+                    if count:
+                        shared_counts[key] = count
+                    else:
+                        del shared_counts[key]
+                if not files:
+                    del postings[block_hash]
+            del self.distinct_counts[kind][file_id]
+
+    def find_hash(self, kind: str, block_hash: int) -> List[PAC_block_location]:
+        """
+        :param kind: "bytes", "instructions" or "data"
+        :param block_hash: the hash produced by the kind's hasher
+        :return: all the indexed blocks with this hash
+        """
+        return [
+            PAC_block_location(self.file_names[file_id], offset)
+            for file_id, offsets in self.postings[kind].get(block_hash, {}).items()
+            for offset in offsets
+        ]
+
+    def find_occurrences(self, kind: str, file_name: str, offset: int) -> List[PAC_block_location]:
+        """
+        Answers "where else does this block occur"\n
+        :param kind: "bytes", "instructions" or "data"
+        :param file_name: the name of an indexed file
+        :param offset: the start of the block in this file
+        :return: the other blocks with the same hash (the block itself is left out)
+        """
+        block_hash = self.file_hashes[kind][self.file_ids[file_name]].get(offset)
+        if block_hash is None:
+            return []
+        return [
+            location for location in self.find_hash(kind, block_hash)
+            if location.offset != offset or location.file_name != file_name
+        ]
+
+    def get_similarity(self, kind: str, first: str, second: str) -> PAC_file_similarity:
+        """
+        Compares the sets of the distinct block hashes of two indexed files\n
+        :return: the number of shared hashes and the Jaccard index of the sets
+        """
+        first_id = self.file_ids[first]
+        second_id = self.file_ids[second]
+        key = (first_id, second_id) if first_id < second_id else (second_id, first_id)
+        shared = self.shared_counts[kind].get(key, 0)
+        return self.make_similarity(kind, first_id, second_id, shared)
+
+    def make_similarity(self, kind: str, first_id: int, second_id: int, shared: int) -> PAC_file_similarity:
+        union = self.distinct_counts[kind][first_id] + self.distinct_counts[kind][second_id] - shared
+        return PAC_file_similarity(
+            self.file_names[first_id], self.file_names[second_id], shared, shared / union if union else 0.0
+        )
+
+    def get_all_similarities(self, kind: str, min_jaccard: float = 0.0, min_shared: int = 1) \
+            -> List[PAC_file_similarity]:
+        """
+        Lists the similar pairs of files, only the pairs that share something are visited\n
+        :param kind: "bytes", "instructions" or "data"
+        :param min_jaccard: the pairs with a smaller Jaccard index are left out
+        :param min_shared: the pairs with fewer shared hashes are left out
+        :return: the pairs sorted by the Jaccard index (the most similar first)
+        """
+        similarities = []
+        for (first_id, second_id), shared in self.shared_counts[kind].items():
+            if shared < min_shared:
+                continue
+            similarity = self.make_similarity(kind, first_id, second_id, shared)
+            if similarity.jaccard >= min_jaccard:
+                similarities.append(similarity)
+        similarities.sort(key=lambda s: s.jaccard, reverse=True)
+        return similarities
+
+    def save(self, path: Path):
+        state = (
+            BLOCK_INDEX_VERSION, self.settings, self.file_ids, self.file_checksums, self.next_file_id,
+            self.postings, self.file_hashes, self.distinct_counts, self.shared_counts
+        )
+        with open(path, "wb") as output:
+            pickle.dump(state, output, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: Path) -> "PAC_BlockIndex":
+        with open(path, "rb") as source:
+            state = pickle.load(source)
+        if state[0] != BLOCK_INDEX_VERSION:
+            raise ValueError(f"Unsupported block index version: {state[0]}")
+
+        index = PAC_BlockIndex(state[1])
+        (
+            index.file_ids, index.file_checksums, index.next_file_id,
+            index.postings, index.file_hashes, index.distinct_counts, index.shared_counts
+        ) = state[2:]
+        index.file_names = {file_id: file_name for file_name, file_id in index.file_ids.items()}
+        return index
@@ -0,0 +1,153 @@
+
+from Core.decompiler.pac_decompiler import (
+    PAC_Decompiler, DecompilerSettings
+)
+from Core.decompiler.decompiler_paths import (
+    instructions_info_path
+)
+from Core.PAC.pac_file import (
+    PAC_file
+)
+from Core.PAC.pac_parser import (
+    PAC_parser
+)
+from Core.PAC.instruction_set_reader import (
+    InstructionSetReader
+)
+from Utils.utils import (
+    load_file_by_path
+)
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple, Dict, List, Tuple, Optional, Iterable, Any
+import json
+import time
+
+
+P2_INXJMP_SIGNATURE = 0x25002D00
+P3_INXJMP_SIGNATURE = 0x25002F00
+
+
+class PAC_corpus(NamedTuple):
+    directory: Path
+    instruction_set: Path
+    cmd_inxJmp_signature: int
+
+
+def read_reference_signature_to_name(corpus: PAC_corpus) -> Optional[Dict[int, str]]:
+    """
+    The control flow tables of the resources list the P3 signatures, the other games get them translated
+    by the instruction names (see PAC_Decompiler.setResources)\n
+    :return: the P3 instruction names, None if the corpus uses the P3 instruction set
+    """
+    if corpus.instruction_set.resolve() == Path(instructions_info_path).resolve():
+        return None
+    instr_set_reader = InstructionSetReader()
+    instr_set_reader.read_instruction_set(instructions_info_path)
+    return instr_set_reader.PAC_signature_to_name
+
+
+class PAC_CorpusWorker:
+    """
+    Decompiles the files of the corpora, one worker lives in every process of the pool (see PAC_CorpusBatch)
+    """
+    def __init__(self, corpora: Tuple[PAC_corpus, ...]):
+        self.corpora = corpora
+        self.parsers: List[PAC_parser] = []
+        self.signature_to_name: List[Dict[int, str]] = []
+        self.reference_signature_to_name: List[Optional[Dict[int, str]]] = []
+        for corpus in self.corpora:
+            instr_set_reader = InstructionSetReader()
+            instr_set_reader.read_instruction_set(str(corpus.instruction_set))
+            pac_parser = PAC_parser()
+            pac_parser.setTemplates(instr_set_reader.PAC_instruction_templates)
+            pac_parser.cmd_inxJmp_signature = corpus.cmd_inxJmp_signature
+            self.parsers.append(pac_parser)
+            self.signature_to_name.append(instr_set_reader.PAC_signature_to_name)
+            self.reference_signature_to_name.append(read_reference_signature_to_name(corpus))
+
+        self.decompiler_settings = DecompilerSettings()
+        self.decompiler_settings.make_dot_file = False
+        self.decompiler_settings.include_callbacks = False
+        self.decompiler_settings.verbose_level = 4  # The workers stay silent
+
+    def decompile(self, path: Path, corpus_index: int = 0) -> PAC_Decompiler:
+        file = PAC_file()
+        file.name = path.name
+        file.initialize_by_raw_data(load_file_by_path(str(path)))
+
+        pac_parser = self.parsers[corpus_index]
+        pac_parser.reset(file)
+        pac_parser.parse()
+
+        decompiler = PAC_Decompiler()
+        decompiler.setResources(
+            self.signature_to_name[corpus_index], self.reference_signature_to_name[corpus_index]
+        )
+        decompiler.reset(file)
+        decompiler.decompile(self.decompiler_settings)
+        return decompiler
+
+
+# The worker of the current process (see init_worker)
+process_worker: Optional[PAC_CorpusWorker] = None
+
+
+def init_worker(worker_class: type, *args):
+    global process_worker
+    process_worker = worker_class(*args)
+
+
+def call_worker(method: str, *args):
+    return getattr(process_worker, method)(*args)
+
+
+class PAC_CorpusBatch:
+    """
+    Runs the tasks in the worker processes and writes their reports as JSON Lines: a record per task
+    in the order of completion, then a summary record
+    """
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self.verbose_level = 2
+
+    def describe(self, report: NamedTuple) -> str:
+        """
+        :return: the line printed when the task is done
+        """
+        raise NotImplementedError
+
+    def summarize(self, reports: List[NamedTuple], wall_time: float) -> Dict[str, Any]:
+        """
+        :return: the fields of the summary record
+        """
+        raise NotImplementedError
+
+    def run_in_pool(self, report_path: Path, kind: str, worker_class: type, worker_args: tuple, method: str,
+                    tasks: Iterable[tuple]) -> List[NamedTuple]:
+        """
+        :param report_path: the path of the report file
+        :param kind: the kind of the task records
+        :param worker_class: PAC_CorpusWorker or its subclass, it's constructed from worker_args in every process
+        :param method: the method of the worker that turns the task arguments into the report
+        :param tasks: the arguments of the tasks
+        :return: the reports in the order of completion
+        """
+        reports: List[NamedTuple] = []
+        start = time.perf_counter()
+        with open(report_path, "w", encoding="utf-8") as output, ProcessPoolExecutor(
+                max_workers=self.workers, initializer=init_worker, initargs=(worker_class, *worker_args)
+        ) as executor:
+            futures = [executor.submit(call_worker, method, *task) for task in tasks]
+            for future in as_completed(futures):
+                report = future.result()
+                reports.append(report)
+                output.write(json.dumps({"kind": kind, **report._asdict()}) + "\n")
+                if self.verbose_level <= 2:
+                    print(self.describe(report))
+
+            output.write(json.dumps({
+                "kind": "summary", **self.summarize(reports, time.perf_counter() - start)
+            }) + "\n")
+        return reports
@@ -0,0 +1,236 @@
+
+from Core.decompiler.pac_decompiler import (
+    PAC_Decompiler
+)
+from Core.decompiler.pac_vt_session import (
+    PAC_Correlator, PAC_match_record, VTSettings, digest_to_int
+)
+from Core.decompiler.code_blocs.base_pac_code_blocks import (
+    RawDataBlock
+)
+
+from typing import NamedTuple, Dict, List, Tuple, Iterator, Hashable, Set, Callable
+import random
+import unicodedata
+
+
+# Content-defined chunking: a chunk ends where the rolling gear hash has CHUNK_MASK bits set to zero
+CHUNK_MASK = (1 << 4) - 1
+MIN_CHUNK_SIZE = 4
+MAX_CHUNK_SIZE = 64
+GEAR_RANDOM = random.Random(0x50AC)
+GEAR_TABLE = [GEAR_RANDOM.getrandbits(64) for _ in range(256)]
+# The chunks that occur in more blocks than this are too common to tell anything
+MAX_CHUNK_OCCURRENCES = 16
+
+
+def normalize_shift_jis(text: str) -> str:
+    """
+    Makes the slightly different strings equal: full-width and half-width forms are unified,
+    the trailing zero bytes are removed and the whitespace runs become single spaces\n
+    :param text: a decoded Shift-JIS string
+    :return: the normalized string
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).rstrip("\x00").split())
+
+
+def split_into_chunks(data: bytes) -> List[bytes]:
+    """
+    Splits the data where the rolling hash of the last bytes says so, which makes the chunk boundaries depend
+    on the content only: an insertion changes the chunks around it and leaves the rest of them intact\n
+    :param data: the bytes to split
+    :return: the chunks (their concatenation is the data)
+    """
+    chunks = []
+    gear = GEAR_TABLE
+    chunk_start = 0
+    rolling = 0
+    for i, byte in enumerate(data):
+        rolling = ((rolling << 1) + gear[byte]) & 0xFFFFFFFFFFFFFFFF
+        size = i + 1 - chunk_start
+        if size >= MAX_CHUNK_SIZE or size >= MIN_CHUNK_SIZE and not rolling & CHUNK_MASK:
+            chunks.append(data[chunk_start: i + 1])
+            chunk_start = i + 1
+            rolling = 0
+    if chunk_start < len(data):
+        chunks.append(data[chunk_start:])
+    return chunks
+
+
+class MatchedData(NamedTuple):
+    first: PAC_Decompiler
+    second: PAC_Decompiler
+    first_address: int
+    second_address: int
+    kind: str  # "data", "message_table" or "switch_table"
+    similarity: float
+
+    def __repr__(self):
+        return f"Matched {self.kind}: 0x{self.first_address:X} <-> 0x{self.second_address:X} ({self.similarity:.2f})"
+
+
+class PAC_data_features(NamedTuple):
+    digest: int
+    chunks: Tuple[int, ...]  # the distinct chunk digests
+
+
+class DataSimilarityMatcher:
+    @staticmethod
+    def get_normalized_data(block: RawDataBlock) -> bytes:
+        if block.shift_jis is not None:
+            return normalize_shift_jis(block.shift_jis).encode("utf-8")
+        return block.data
+
+    @staticmethod
+    def get_features(decompiler: PAC_Decompiler, settings: VTSettings) -> Dict[int, PAC_data_features]:
+        features = {}
+        for block in decompiler.data.data_blocks.values():
+            if block.size < settings.min_block_size:
+                continue
+            data = DataSimilarityMatcher.get_normalized_data(block)
+            chunks = tuple({digest_to_int(chunk) for chunk in split_into_chunks(data)})
+            features[block.start] = PAC_data_features(digest_to_int(data), chunks)
+        return features
+
+    @staticmethod
+    def pair_unique(first_groups: Dict[Hashable, List[int]], second_groups: Dict[Hashable, List[int]]) \
+            -> List[Tuple[int, int]]:
+        """
+        Pairs the offsets whose keys occur the same number of times in both files (in the order of the offsets)\n
+        :return: the list of (first offset, second offset)
+        """
+        pairs = []
+        for key, first_offsets in first_groups.items():
+            second_offsets = second_groups.get(key)
+            if second_offsets is not None and len(first_offsets) == len(second_offsets):
+                pairs.extend(zip(sorted(first_offsets), sorted(second_offsets)))
+        return pairs
+
+    @staticmethod
+    def match_data(first: PAC_Decompiler, second: PAC_Decompiler, settings: VTSettings) -> List[MatchedData]:
+        first_features = DataSimilarityMatcher.get_features(first, settings)
+        second_features = DataSimilarityMatcher.get_features(second, settings)
+
+        # Equal after the normalization
+        first_digests: Dict[int, List[int]] = {}
+        for offset, features in first_features.items():
+            first_digests.setdefault(features.digest, []).append(offset)
+        second_digests: Dict[int, List[int]] = {}
+        for offset, features in second_features.items():
+            second_digests.setdefault(features.digest, []).append(offset)
+
+        matches: List[MatchedData] = []
+        matched_first = set()
+        matched_second = set()
+        for first_offset, second_offset in DataSimilarityMatcher.pair_unique(first_digests, second_digests):
+            matches.append(MatchedData(first, second, first_offset, second_offset, "data", 1.0))
+            matched_first.add(first_offset)
+            matched_second.add(second_offset)
+
+        # Partially shared: count the shared chunks through an inverted index
+        chunk_index: Dict[int, List[int]] = {}
+        for offset, features in first_features.items():
+            if offset in matched_first:
+                continue
+            for chunk in features.chunks:
+                chunk_index.setdefault(chunk, []).append(offset)
+
+        scored: List[Tuple[float, int, int]] = []
+        for second_offset, features in second_features.items():
+            if second_offset in matched_second:
+                continue
+            shared: Dict[int, int] = {}
+            for chunk in features.chunks:
+                offsets = chunk_index.get(chunk, ())
+                if len(offsets) > MAX_CHUNK_OCCURRENCES:
+                    continue
+                for first_offset in offsets:
+                    shared[first_offset] = shared.get(first_offset, 0) + 1
+            for first_offset, count in shared.items():
+                similarity = count / (len(first_features[first_offset].chunks) + len(features.chunks) - count)
+                if similarity >= settings.min_data_similarity:
+                    scored.append((similarity, first_offset, second_offset))
+
+        # Pair every block at most once, the most similar pairs first
+        scored.sort(key=lambda item: (-item[0], item[1], item[2]))
+        for similarity, first_offset, second_offset in scored:
+            if first_offset in matched_first or second_offset in matched_second:
+                continue
+            matched_first.add(first_offset)
+            matched_second.add(second_offset)
+            matches.append(MatchedData(first, second, first_offset, second_offset, "data", similarity))
+        return matches
+
+    @staticmethod
+    def match_message_tables(first: PAC_Decompiler, second: PAC_Decompiler) -> List[MatchedData]:
+        first_groups: Dict[int, List[int]] = {}
+        for offset, table in first.file.msg_tables.items():
+            first_groups.setdefault(table.msg_count, []).append(offset)
+        second_groups: Dict[int, List[int]] = {}
+        for offset, table in second.file.msg_tables.items():
+            second_groups.setdefault(table.msg_count, []).append(offset)
+        return [
+            MatchedData(first, second, first_offset, second_offset, "message_table", 1.0)
+            for first_offset, second_offset in DataSimilarityMatcher.pair_unique(first_groups, second_groups)
+        ]
+
+    @staticmethod
+    def get_branch_structure(branches: List[int]) -> Tuple[int, ...]:
+        """
+        The branches relative to the lowest one stay the same when the code around the switch moves\n
+        :return: the relative branch offsets
+        """
+        if not branches:
+            return ()
+        lowest = min(branches)
+        return tuple(branch - lowest for branch in branches)
+
+    @staticmethod
+    def group_switch_tables(decompiler: PAC_Decompiler, get_key: Callable[[List[int]], Hashable],
+                            skip: Set[int]) -> Dict[Hashable, List[int]]:
+        groups: Dict[Hashable, List[int]] = {}
+        for offset, table in decompiler.file.switch_case_tables.items():
+            if offset not in skip:
+                groups.setdefault(get_key(table.branches), []).append(offset)
+        return groups
+
+    @staticmethod
+    def match_switch_tables(first: PAC_Decompiler, second: PAC_Decompiler) -> List[MatchedData]:
+        matches: List[MatchedData] = []
+        matched_first: Set[int] = set()
+        matched_second: Set[int] = set()
+        # The same relative structure first, then the same number of branches
+        for get_key, similarity in ((DataSimilarityMatcher.get_branch_structure, 1.0), (len, 0.5)):
+            pairs = DataSimilarityMatcher.pair_unique(
+                DataSimilarityMatcher.group_switch_tables(first, get_key, matched_first),
+                DataSimilarityMatcher.group_switch_tables(second, get_key, matched_second)
+            )
+            for first_offset, second_offset in pairs:
+                matches.append(MatchedData(first, second, first_offset, second_offset, "switch_table", similarity))
+                matched_first.add(first_offset)
+                matched_second.add(second_offset)
+        return matches
+
+    @staticmethod
+    def match(first: PAC_Decompiler, second: PAC_Decompiler, settings: VTSettings) -> List[MatchedData]:
+        return (
+            DataSimilarityMatcher.match_data(first, second, settings)
+            + DataSimilarityMatcher.match_message_tables(first, second)
+            + DataSimilarityMatcher.match_switch_tables(first, second)
+        )
+
+
+class DataSimilarityCorrelator(PAC_Correlator):
+    def __init__(self):
+        super().__init__()
+
+    def correlate(self):
+        res = DataSimilarityMatcher.match(self.first, self.second, self.settings)
+        return res
+
+    def iter_records(self) -> Iterator[PAC_match_record]:
+        entities = self.first.file.entities
+        for match in self.correlate():
+            yield PAC_match_record(
+                match.first_address, match.second_address, entities[match.first_address].size * match.similarity
+            )
@@ -0,0 +1,716 @@
+
+from Core.decompiler.code_blocs.base_pac_code_blocks import (
+    BasePacCodeBlocks, ContiguousCodeBlock
+)
+from Core.PAC.pac_file import (
+    PAC_instruction, PAC_variable
+)
+
+from collections import deque
+from heapq import heappush, heappop
+from typing import NamedTuple, Dict, List, Tuple, Iterator, Optional, Set, FrozenSet, Any
+
+
+# IntLocal, IntGlobal, FloatLocal, FloatGlobal (the prefixes of the resolved argument types)
+VARIABLE_TYPE_PREFIXES = ("0x4", "0x8", "0x20", "0x40")
+
+# Instruction name -> the indices of the arguments it writes to (the names are the same in P2 and P3)
+WRITTEN_ARGUMENTS: Dict[str, Tuple[int, ...]] = {
+    "cmd_mov": (0,), "cmd_add": (0,), "cmd_sub": (0,), "cmd_mul": (0,), "cmd_div": (0,), "cmd_mod": (0,),
+    "cmd_inc": (0,), "cmd_dec": (0,), "cmd_loop": (0,), "cmd_rand": (0,),
+    "cmd_iand": (0,), "cmd_ior": (0,), "cmd_ixor": (0,), "cmd_irol": (0,), "cmd_iror": (0,),
+    "cmd_sinf": (0,), "cmd_cosf": (0,), "cmd_atan2f": (0,), "cmd_abs": (0,), "cmd_sqrt": (0,),
+    "cmd_F32toF16": (0,), "cmd_F16toF32": (0,), "cmd_getElapsedTime": (0,),
+    "getGateInfo": (3,),
+}
+# The instructions that read the old value of the written arguments as well
+UPDATING_INSTRUCTIONS = {
+    "cmd_add", "cmd_sub", "cmd_mul", "cmd_div", "cmd_mod", "cmd_inc", "cmd_dec", "cmd_loop",
+    "cmd_iand", "cmd_ior", "cmd_ixor", "cmd_irol", "cmd_iror",
+}
+
+
+class PAC_def_use(NamedTuple):
+    defined: List[PAC_variable]
+    used: List[PAC_variable]
+
+
+def get_def_use(instruction: PAC_instruction) -> PAC_def_use:
+    """
+    Lists the variables the instruction writes and reads (see WRITTEN_ARGUMENTS), every variable argument
+    of an unknown instruction is considered to be read\n
+    :param instruction: a PAC instruction
+    :return: the defined and the used variables
+    """
+    written = WRITTEN_ARGUMENTS.get(instruction.name, ())
+    is_updating = instruction.name in UPDATING_INSTRUCTIONS
+    res = PAC_def_use([], [])
+    for index, (param, value) in enumerate(instruction.ordered_PAC_params):
+        if not param.type.startswith(VARIABLE_TYPE_PREFIXES):
+            continue
+        variable = PAC_variable(param.type, value)
+        if index in written:
+            res.defined.append(variable)
+            if is_updating:
+                res.used.append(variable)
+        else:
+            res.used.append(variable)
+    return res
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class PAC_DataflowProblem:
+    """
+    A bit-vector dataflow problem: every instruction has a GEN and a KILL set, out = gen | (in & ~kill)
+    for the forward problems (in = gen | (out & ~kill) for the backward ones)\n
+    The sets are Python integers, the bit meanings are up to the problem
+    """
+    forward: bool = True
+    union: bool = True  # the meet operator, the intersection otherwise
+
+    def prepare(self, code: BasePacCodeBlocks):
+        """
+        Called once before the problem is solved: that's where the bits should be assigned
+        """
+        pass
+
+    def get_gen_kill(self, location: int, instruction: PAC_instruction) -> Tuple[int, int]:
+        raise NotImplementedError
+
+    def get_boundary(self) -> int:
+        """
+        :return: the state on the entry of the root blocks (on the exit of the sinks for the backward problems)
+        """
+        return 0
+
+    def get_initial(self) -> int:
+        """
+        :return: the optimistic state every block starts with (the top of the lattice)
+        """
+        return 0
+
+
+class ReachingDefinitions(PAC_DataflowProblem):
+    """
+    A bit per (location, variable) definition
+    """
+    forward = True
+    union = True
+
+    def __init__(self):
+        self.definitions: List[Tuple[int, PAC_variable]] = []
+        self.definition_bits: Dict[Tuple[int, PAC_variable], int] = {}
+        self.variable_masks: Dict[PAC_variable, int] = {}  # variable -> all of its definitions
+
+    def prepare(self, code: BasePacCodeBlocks):
+        self.definitions = []
+        self.definition_bits = {}
+        self.variable_masks = {}
+        for location, instruction in code.file.ordered_instructions.items():
+            for variable in get_def_use(instruction).defined:
+                bit = len(self.definitions)
+                self.definitions.append((location, variable))
+                self.definition_bits[(location, variable)] = bit
+                self.variable_masks[variable] = self.variable_masks.get(variable, 0) | 1 << bit
+
+    def get_gen_kill(self, location: int, instruction: PAC_instruction) -> Tuple[int, int]:
+        gen = kill = 0
+        for variable in get_def_use(instruction).defined:
+            gen |= 1 << self.definition_bits[(location, variable)]
+            kill |= self.variable_masks[variable]
+        return gen, kill
+
+    def decode(self, state: int) -> List[Tuple[int, PAC_variable]]:
+        return [self.definitions[bit] for bit in iter_bits(state)]
+
+
+class LiveVariables(PAC_DataflowProblem):
+    """
+    A bit per variable, a variable is live if it may be read before it is written again
+    """
+    forward = False
+    union = True
+
+    def __init__(self):
+        self.variables: List[PAC_variable] = []
+        self.variable_bits: Dict[PAC_variable, int] = {}
+
+    def prepare(self, code: BasePacCodeBlocks):
+        self.variables = []
+        self.variable_bits = {}
+        for instruction in code.file.ordered_instructions.values():
+            def_use = get_def_use(instruction)
+            for variable in def_use.defined + def_use.used:
+                if variable not in self.variable_bits:
+                    self.variable_bits[variable] = len(self.variables)
+                    self.variables.append(variable)
+
+    def get_gen_kill(self, location: int, instruction: PAC_instruction) -> Tuple[int, int]:
+        def_use = get_def_use(instruction)
+        gen = kill = 0
+        for variable in def_use.used:
+            gen |= 1 << self.variable_bits[variable]
+        for variable in def_use.defined:
+            kill |= 1 << self.variable_bits[variable]
+        # The read happens before the write
+        return gen, kill & ~gen
+
+    def decode(self, state: int) -> List[PAC_variable]:
+        return [self.variables[bit] for bit in iter_bits(state)]
+
+
+class AvailableValues(PAC_DataflowProblem):
+    """
+    A bit per (variable, value) pair of the cmd_mov instructions that put an immediate value (an integer,
+    a float or a 0x1 value) into a variable: the pair is available if it holds on every path
+    """
+    forward = True
+    union = False
+
+    def __init__(self):
+        self.values: List[Tuple[PAC_variable, PAC_variable]] = []  # (variable, the typed immediate value)
+        self.value_bits: Dict[Tuple[PAC_variable, PAC_variable], int] = {}
+        self.variable_masks: Dict[PAC_variable, int] = {}
+
+    @staticmethod
+    def get_assigned_value(instruction: PAC_instruction) -> Optional[Tuple[PAC_variable, PAC_variable]]:
+        if instruction.name != "cmd_mov" or len(instruction.ordered_PAC_params) != 2:
+            return None
+        (destination, index), (source, value) = instruction.ordered_PAC_params
+        if not destination.type.startswith(VARIABLE_TYPE_PREFIXES) or source.type.startswith(VARIABLE_TYPE_PREFIXES):
+            return None
+        return PAC_variable(destination.type, index), PAC_variable(source.type, value)
+
+    def prepare(self, code: BasePacCodeBlocks):
+        self.values = []
+        self.value_bits = {}
+        self.variable_masks = {}
+        for instruction in code.file.ordered_instructions.values():
+            for variable in get_def_use(instruction).defined:
+                self.variable_masks.setdefault(variable, 0)
+            assigned = self.get_assigned_value(instruction)
+            if assigned is not None and assigned not in self.value_bits:
+                bit = len(self.values)
+                self.values.append(assigned)
+                self.value_bits[assigned] = bit
+                self.variable_masks[assigned[0]] |= 1 << bit
+
+    def get_gen_kill(self, location: int, instruction: PAC_instruction) -> Tuple[int, int]:
+        kill = 0
+        for variable in get_def_use(instruction).defined:
+            kill |= self.variable_masks[variable]
+        assigned = self.get_assigned_value(instruction)
+        gen = 1 << self.value_bits[assigned] if assigned is not None else 0
+        return gen, kill & ~gen
+
+    def get_initial(self) -> int:
+        return (1 << len(self.values)) - 1
+
+    def decode(self, state: int) -> List[Tuple[PAC_variable, PAC_variable]]:
+        return [self.values[bit] for bit in iter_bits(state)]
+
+
+class PAC_dataflow_result(NamedTuple):
+    block_in: Dict[int, int]
+    block_out: Dict[int, int]
+    """
+    Block start -> the state before / after the block in the direction of the problem (for the backward problems
+    block_in is the state at the end of the block)
+    """
+    visits: int
+    """
+    How many times the blocks were evaluated
+    """
+
+
+class PAC_Dataflow:
+    """
+    Solves the bit-vector dataflow problems over the code blocks with a worklist ordered by the reverse postorder
+    (the postorder for the backward problems), so the acyclic parts converge in a single pass\n
+    The callback edges are left out by default: a callback does not run where it is registered
+    """
+    def __init__(self, code: BasePacCodeBlocks, include_callbacks: bool = False):
+        self.code = code
+        self.include_callbacks = include_callbacks
+        self.successors: Dict[int, List[int]] = {}
+        self.predecessors: Dict[int, List[int]] = {}
+        self.order: List[int] = []  # reverse postorder
+        self.init_graph()
+
+    def init_graph(self):
+        code_blocks = self.code.code_blocks
+        successors = {start: [] for start in code_blocks}
+        predecessors = {start: [] for start in code_blocks}
+        for start, block in code_blocks.items():
+            for edge in block.exit_point.where_to:
+                if edge.properties.callback and not self.include_callbacks:
+                    continue
+                destination = edge.entry.code_block.start
+                if destination not in successors:
+                    continue
+                successors[start].append(destination)
+                predecessors[destination].append(start)
+        self.successors = successors
+        self.predecessors = predecessors
+
+        # Iterative DFS, the blocks without predecessors go first
+        postorder = []
+        visited = set()
+        roots = [start for start in code_blocks if not predecessors[start]]
+        for root in roots + list(code_blocks):
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(successors[root]))]
+            while stack:
+                vertex, children = stack[-1]
+                for child in children:
+                    if child not in visited:
+                        visited.add(child)
+                        stack.append((child, iter(successors[child])))
+                        break
+                else:
+                    stack.pop()
+                    postorder.append(vertex)
+        postorder.reverse()
+        self.order = postorder
+
+    def get_block_gen_kill(self, problem: PAC_DataflowProblem, block: ContiguousCodeBlock) -> Tuple[int, int]:
+        """
+        Composes the GEN/KILL sets of the block's instructions in the direction of the problem
+        """
+        gen = kill = 0
+        instructions = list(block.instructions.items())
+        if not problem.forward:
+            instructions.reverse()
+        for location, instruction in instructions:
+            instruction_gen, instruction_kill = problem.get_gen_kill(location, instruction)
+            gen = instruction_gen | (gen & ~instruction_kill)
+            kill |= instruction_kill
+        return gen, kill
+
+    def solve(self, problem: PAC_DataflowProblem) -> PAC_dataflow_result:
+        """
+        :param problem: the dataflow problem
+        :return: the fixed point
+        """
+        problem.prepare(self.code)
+        code_blocks = self.code.code_blocks
+        gen_kill = {start: self.get_block_gen_kill(problem, block) for start, block in code_blocks.items()}
+
+        if problem.forward:
+            order = self.order
+            sources, targets = self.predecessors, self.successors
+        else:
+            order = self.order[::-1]
+            sources, targets = self.successors, self.predecessors
+        priority = {start: index for index, start in enumerate(order)}
+
+        boundary = problem.get_boundary()
+        initial = problem.get_initial()
+        union = problem.union
+        block_in = {start: boundary if not sources[start] else initial for start in order}
+        block_out = {start: initial for start in order}
+
+        worklist = [(index, start) for index, start in enumerate(order)]  # already a heap
+        queued = set(order)
+        visits = 0
+        while worklist:
+            _, start = heappop(worklist)
+            queued.discard(start)
+            visits += 1
+
+            incoming = sources[start]
+            if incoming:
+                state = block_out[incoming[0]]
+                for source in incoming[1:]:
+                    state = state | block_out[source] if union else state & block_out[source]
+                block_in[start] = state
+            gen, kill = gen_kill[start]
+            out = gen | (block_in[start] & ~kill)
+            if out == block_out[start]:
+                continue
+            block_out[start] = out
+            for target in targets[start]:
+                if target not in queued:
+                    queued.add(target)
+                    heappush(worklist, (priority[target], target))
+
+        return PAC_dataflow_result(block_in, block_out, visits)
+
+    def get_state_at(self, problem: PAC_DataflowProblem, result: PAC_dataflow_result, location: int) -> int:
+        """
+        Replays the block's instructions up to the given one\n
+        :param problem: the solved problem
+        :param result: the solution
+        :param location: the offset of an instruction
+        :return: the state right before the instruction (right after it for the backward problems)
+        """
+        start, block = self.code.get_block_by_offset(location)
+        state = result.block_in[start]
+        instructions = list(block.instructions.items())
+        if not problem.forward:
+            instructions.reverse()
+        for offset, instruction in instructions:
+            if offset == location:
+                break
+            gen, kill = problem.get_gen_kill(offset, instruction)
+            state = gen | (state & ~kill)
+        return state
+
+
+class PAC_SegmentAnalysis:
+    """
+    A forward analysis over the blocks that haven't been normalized: they are cut into segments at their entry
+    points and the states are kept at the segment starts\n
+    The analysis starts from the blocks without incoming edges; the code that can't be reached (yet) is studied
+    on its own afterwards, its states never leak into the reachable code\n
+    The subclasses define the states and how they are joined and transferred
+    """
+    def __init__(self, code: BasePacCodeBlocks):
+        self.code = code
+        self.segment_states: Dict[int, Any] = {}  # segment start -> the state at its start
+        self.segments: Dict[int, List[int]] = {}  # segment start -> the instruction offsets
+        self.next_segment: Dict[int, int] = {}  # segment start -> the next segment of the same block
+        self.last_segments: Dict[int, ContiguousCodeBlock] = {}  # segment start -> the block it ends
+        self.visits = 0
+
+    def get_empty_state(self) -> Any:
+        raise NotImplementedError
+
+    def join(self, first: Any, second: Any) -> Any:
+        raise NotImplementedError
+
+    def transfer(self, state: Any, location: int, instruction: PAC_instruction) -> Any:
+        raise NotImplementedError
+
+    def get_successors(self, state: Any, block: ContiguousCodeBlock) -> List[int]:
+        return [edge.entry.position for edge in block.exit_point.where_to if not edge.properties.callback]
+
+    def init_segments(self) -> List[int]:
+        """
+        :return: the starts of the segments that have no incoming edges
+        """
+        self.segments = {}
+        self.next_segment = {}
+        self.last_segments = {}
+        roots = []
+        for block in self.code.code_blocks.values():
+            positions = sorted(block.entry_points)
+            if not block.entry_points[positions[0]].where_from:
+                roots.append(positions[0])
+            index = 0
+            for i, position in enumerate(positions):
+                end = positions[i + 1] if i + 1 < len(positions) else block.start + block.size
+                offsets = []
+                while index < len(block.instructions_offsets) and block.instructions_offsets[index] < end:
+                    offsets.append(block.instructions_offsets[index])
+                    index += 1
+                self.segments[position] = offsets
+                if i + 1 < len(positions):
+                    self.next_segment[position] = positions[i + 1]
+                else:
+                    self.last_segments[position] = block
+        return roots
+
+    def propagate(self, states: Dict[int, Any], worklist: deque, region: Optional[Set[int]] = None):
+        """
+        Runs the worklist until the states stop changing\n
+        :param states: segment start -> the state at its start, updated in place
+        :param worklist: the segments to visit
+        :param region: if given, the states are only pushed into these segments
+        """
+        instructions = self.code.file.ordered_instructions
+        queued = set(worklist)
+        while worklist:
+            position = worklist.popleft()
+            queued.discard(position)
+            self.visits += 1
+
+            state = states[position]
+            for offset in self.segments[position]:
+                state = self.transfer(state, offset, instructions[offset])
+
+            if position in self.next_segment:
+                successors = [self.next_segment[position]]
+            else:
+                successors = self.get_successors(state, self.last_segments[position])
+
+            for successor in successors:
+                if region is not None and successor not in region:
+                    continue
+                current = states.get(successor)
+                new = state if current is None else self.join(current, state)
+                if current is not None and new == current:
+                    continue
+                states[successor] = new
+                if successor not in queued:
+                    queued.add(successor)
+                    worklist.append(successor)
+
+    def solve(self):
+        roots = self.init_segments()
+        states: Dict[int, Any] = {root: self.get_empty_state() for root in roots}
+        self.visits = 0
+        self.propagate(states, deque(roots))
+
+        unreached = [position for position in sorted(self.segments) if position not in states]
+        states.update((position, self.get_empty_state()) for position in unreached)
+        self.propagate(states, deque(unreached), set(unreached))
+        self.segment_states = states
+
+    def get_segment(self, location: int) -> int:
+        _, block = self.code.get_block_by_offset(location)
+        return max(position for position in block.entry_points if position <= location)
+
+    def get_state_at(self, location: int) -> Any:
+        """
+        :param location: the offset of an instruction
+        :return: the state right before the instruction
+        """
+        position = self.get_segment(location)
+        state = self.segment_states[position]
+        instructions = self.code.file.ordered_instructions
+        for offset in self.segments[position]:
+            if offset == location:
+                break
+            state = self.transfer(state, offset, instructions[offset])
+        return state
+
+
+# A variable that may hold more values than this is unknown
+MAX_VALUE_SET_SIZE = 16
+# The conditional jumps whose outcome can be decided when both operands are known
+DECIDABLE_CONDITIONS: Dict[str, bool] = {"cmd_ifEQ": True, "cmd_ifNE": False}  # name -> jumps if equal
+
+ValueSetState = Dict[int, Optional[FrozenSet[int]]]
+"""
+IntLocal index -> the values it may hold (None if it's unknown); the missing variables weren't assigned on any path
+"""
+
+
+def join_value_sets(first: ValueSetState, second: ValueSetState) -> ValueSetState:
+    res = dict(first)
+    for variable, values in second.items():
+        if variable not in res:
+            res[variable] = values
+            continue
+        current = res[variable]
+        if current is None or values is None:
+            res[variable] = None
+        elif not values <= current:
+            merged = current | values
+            res[variable] = merged if len(merged) <= MAX_VALUE_SET_SIZE else None
+    return res
+
+
+class PAC_ValueSetAnalysis(PAC_SegmentAnalysis):
+    """
+    Propagates the finite sets of the immediate values (integers and 0x1 offsets) that the tracked IntLocals
+    may hold: the cmd_ifEQ / cmd_ifNE jumps with known operands only follow the branch they can take,
+    so the values of the dead branches don't reach the rest of the code
+    """
+    def __init__(self, code: BasePacCodeBlocks, variables: Set[int]):
+        super().__init__(code)
+        self.variables = variables
+
+    @staticmethod
+    def get_tracked_variables(file_instructions: Dict[int, PAC_instruction], variables: Set[int]) -> Set[int]:
+        """
+        Adds the IntLocals that the given ones are copied from (cmd_mov) to the set\n
+        Only the conditions on the tracked variables can be decided: tracking all the compared variables
+        would make every change of them affect the recovered jumps\n
+        :return: the closure
+        """
+        copies: Dict[int, Set[int]] = {}
+        for instruction in file_instructions.values():
+            params = instruction.ordered_PAC_params
+            if instruction.name == "cmd_mov" and len(params) == 2:
+                (destination, index), (source, value) = params
+                if destination.type.startswith("0x4") and source.type.startswith("0x4"):
+                    copies.setdefault(index, set()).add(value)
+
+        res = set(variables)
+        stack = list(variables)
+        while stack:
+            for source in copies.get(stack.pop(), ()):
+                if source not in res:
+                    res.add(source)
+                    stack.append(source)
+        return res
+
+    def get_empty_state(self) -> ValueSetState:
+        return {}
+
+    def join(self, first: ValueSetState, second: ValueSetState) -> ValueSetState:
+        return join_value_sets(first, second)
+
+    def get_operand(self, state: ValueSetState, param_type: str, value: int) -> Optional[FrozenSet[int]]:
+        if param_type == "uint32_t" or param_type.startswith("0x1"):
+            return frozenset((value,))
+        if param_type.startswith("0x4") and value in self.variables:
+            return state.get(value)
+        return None
+
+    def transfer(self, state: ValueSetState, location: int, instruction: PAC_instruction) -> ValueSetState:
+        written = WRITTEN_ARGUMENTS.get(instruction.name)
+        if written is None:
+            return state
+        params = instruction.ordered_PAC_params
+        for index in written:
+            if index >= len(params):
+                continue
+            param, variable = params[index]
+            if not param.type.startswith("0x4") or variable not in self.variables:
+                continue
+            state = dict(state)
+            if instruction.name == "cmd_mov" and len(params) == 2:
+                source, value = params[1]
+                if source.type.startswith("0x4") and value in self.variables and value not in state:
+                    # Copying a variable that wasn't assigned on this path
+                    state.pop(variable, None)
+                    continue
+                state[variable] = self.get_operand(state, source.type, value)
+            else:
+                state[variable] = None
+        return state
+
+    def get_successors(self, state: ValueSetState, block: ContiguousCodeBlock) -> List[int]:
+        instruction = block.exit_point.instruction
+        edges = block.exit_point.where_to
+        jumps_if_equal = DECIDABLE_CONDITIONS.get(instruction.name) if instruction is not None else None
+        if jumps_if_equal is not None and len(instruction.ordered_PAC_params) >= 2:
+            (first_param, first_value), (second_param, second_value) = instruction.ordered_PAC_params[:2]
+            first = self.get_operand(state, first_param.type, first_value)
+            second = self.get_operand(state, second_param.type, second_value)
+            if first and second:
+                outcomes = {(a == b) == jumps_if_equal for a in first for b in second}
+                if len(outcomes) == 1:
+                    jumps = outcomes.pop()
+                    edges = [edge for edge in edges if edge.properties.fallthrough != jumps]
+        return [edge.entry.position for edge in edges if not edge.properties.callback]
+
+    def get_values_at(self, location: int, variable: int) -> Optional[FrozenSet[int]]:
+        """
+        :param location: the offset of an instruction
+        :param variable: a tracked IntLocal index
+        :return: the values the variable may hold right before the instruction (empty if the variable is never
+        assigned, None if the values are unknown)
+        """
+        return self.get_state_at(location).get(variable, frozenset())
+
+    def get_defining_move(self, location: int, variable: int) -> Optional[int]:
+        """
+        Nothing but the code between this cmd_mov and the location decides the value of the variable there\n
+        :param location: the offset of an instruction
+        :param variable: a tracked IntLocal index
+        :return: the offset of the cmd_mov of an immediate value to the variable that precedes the location in its
+        segment or None if there's no such cmd_mov (or the variable is written after it)
+        """
+        instructions = self.code.file.ordered_instructions
+        res = None
+        for offset in self.segments[self.get_segment(location)]:
+            if offset == location:
+                break
+            instruction = instructions[offset]
+            params = instruction.ordered_PAC_params
+            written = WRITTEN_ARGUMENTS.get(instruction.name, ())
+            if not any(
+                    index < len(params) and params[index][0].type.startswith("0x4") and params[index][1] == variable
+                    for index in written
+            ):
+                continue
+            res = None
+            if instruction.name == "cmd_mov" and len(params) == 2:
+                source = params[1][0].type
+                if source == "uint32_t" or source.startswith("0x1"):
+                    res = offset
+        return res
+
+
+GateKey = Tuple[Tuple[str, int], ...]
+"""
+The arguments that select a gate: (type, value) of every argument but the last one
+"""
+
+
+class PAC_GateFact(NamedTuple):
+    location: int  # the offset of setGateInfo
+    key: GateKey
+    destination: int  # the stored 0x1 offset
+
+
+class PAC_GatePropagation(PAC_SegmentAnalysis):
+    """
+    Pushes the destinations stored by all the setGateInfo instructions through the CFG at once, so that
+    the getGateInfo -> cmd_jmpLabel / cmd_callLabel jumps learn where they may lead\n
+    A state is the bitset of the facts (see PAC_GateFact) that reach it; setGateInfo kills the facts of
+    the same gate if its key is made of the immediate values only
+    """
+    def __init__(self, code: BasePacCodeBlocks, facts: List[PAC_GateFact]):
+        super().__init__(code)
+        self.facts = facts
+        self.fact_index: Dict[int, int] = {fact.location: i for i, fact in enumerate(facts)}
+        self.key_masks: Dict[GateKey, int] = {}  # the facts of each immediate key
+        self.wildcard_mask = 0  # the facts whose keys contain variables
+        for i, fact in enumerate(facts):
+            if self.is_immediate_key(fact.key):
+                self.key_masks[fact.key] = self.key_masks.get(fact.key, 0) | 1 << i
+            else:
+                self.wildcard_mask |= 1 << i
+
+    @staticmethod
+    def get_gate_key(instruction: PAC_instruction) -> GateKey:
+        return tuple((param.type, value) for param, value in instruction.ordered_PAC_params[:-1])
+
+    @staticmethod
+    def is_immediate_key(key: GateKey) -> bool:
+        return all(param_type == "uint32_t" for param_type, _ in key)
+
+    @staticmethod
+    def get_facts(file_instructions: Dict[int, PAC_instruction], signature: int) -> List[PAC_GateFact]:
+        """
+        :param file_instructions: the instructions of the file
+        :param signature: the signature of setGateInfo
+        :return: the setGateInfo instructions that store a 0x1 offset
+        """
+        res = []
+        for location, instruction in file_instructions.items():
+            if instruction.signature != signature or not instruction.ordered_PAC_params:
+                continue
+            last_param, destination = instruction.ordered_PAC_params[-1]
+            if last_param.type.startswith("0x1"):
+                res.append(PAC_GateFact(location, PAC_GatePropagation.get_gate_key(instruction), destination))
+        return res
+
+    def get_empty_state(self) -> int:
+        return 0
+
+    def join(self, first: int, second: int) -> int:
+        return first | second
+
+    def transfer(self, state: int, location: int, instruction: PAC_instruction) -> int:
+        index = self.fact_index.get(location)
+        if index is None:
+            return state
+        key = self.facts[index].key
+        if key in self.key_masks:
+            state &= ~self.key_masks[key]
+        return state | 1 << index
+
+    def get_destinations(self, location: int, key: GateKey) -> Set[int]:
+        """
+        :param location: the offset of getGateInfo
+        :param key: the gate it reads
+        :return: the offsets that the gate may hold there
+        """
+        state = self.get_state_at(location)
+        if self.is_immediate_key(key):
+            state &= self.key_masks.get(key, 0) | self.wildcard_mask
+        return {self.facts[i].destination for i in iter_bits(state)}
@@ -1,27 +1,50 @@
 
-from typing import Callable, List, Dict, Tuple, NamedTuple, Set, Optional
+from typing import Callable, List, Dict, Tuple, NamedTuple, Set, Optional, Iterable
 
 from Core.decompiler.code_blocs.base_pac_code_blocks import (
     ContiguousCodeBlock, EntryPoint, PAC_Edge,
     ExitPoint, RawDataBlock
 )
 from Core.decompiler.code_blocs.pac_code_blocks import (
-    PAC_CodeBlocks
+    PAC_CodeBlocks, PAC_CFG_diff
 )
 from Core.decompiler.code_blocs.pac_function_blocks import (
-    PAC_FunctionBlocks
+    PAC_FunctionBlocks, get_subroutines
+)
+from Core.decompiler.pac_ir import (
+    PAC_IR_writer
+)
+from Core.decompiler.pac_dot_writer import (
+    PAC_DotWriter
+)
+from Core.decompiler.pac_reachability import (
+    PAC_ReachabilityIndex
+)
+from Core.decompiler.pac_loops import (
+    PAC_LoopForest
+)
+from Core.decompiler.pac_dominators import (
+    PAC_DominatorTree
+)
+from Core.decompiler.pac_ssa import (
+    PAC_SSA
+)
+from Core.decompiler.pac_dataflow import (
+    PAC_Dataflow, PAC_DataflowProblem, PAC_dataflow_result, PAC_GatePropagation, get_def_use
 )
 from Utils.utils import (
     binary_search, read_shift_jis_from_bytes, print_hex
 )
 from Core.PAC.pac_file import (
-    PAC_file, PAC_instruction
+    PAC_file, PAC_instruction, Memory_entity, PAC_entity_diff, PAC_variable
 )
 
 from dataclasses import dataclass, field
+from collections import Counter, deque
 
 from pathlib import Path
-import graphviz
+from xml.sax.saxutils import escape, quoteattr
+import json
 
 # Resources
 from Core.decompiler.decompiler_paths import *
@@ -55,13 +78,87 @@ def read_returning_instructions(path: str) -> List[int]:
     return returning_instr_info
 
 
+DOT_BUFFER_SIZE = 1 << 16
+
+
 class GVSettings(NamedTuple):
     fontsize: int
     nslimit: Optional[int]
+    nest_loops: bool = False  # draw the loop nesting forest instead of the SCCs
 
 
 class PAC_Subroutine:
-    pass
+    def __init__(self, start: int, end: int):
+        self.start: int = start
+        self.end: int = end  # the end of its last range, exclusive
+        self.ranges: List[int] = []  # the starts of its blocks of PAC_FunctionBlocks (usually there's one)
+        self.blocks: List[int] = []  # the starts of its CFG blocks (see get_subroutines)
+        self.edges_count: int = 0  # the edges between the blocks of the function (calls excluded)
+        self.instruction_histogram: Dict[int, int] = {}  # signature -> count
+        self.call_sites: List[Tuple[int, int]] = []  # (calling instruction's offset, callee start), ordered
+        self.callback_sites: List[Tuple[int, int]] = []  # (callback instruction's offset, callback start)
+        self.transfers: List[int] = []  # the starts of the functions it jumps / falls to without saving the RA
+        self.callers: List[int] = []  # the starts of the calling functions
+        self.shape: int = 0  # see compute_shape
+        self.fingerprint: int = 0
+
+    def __repr__(self):
+        return f"Subroutine 0x{self.start:X}-0x{self.end:X} (blocks = {len(self.blocks)})"
+
+    def get_callees(self) -> List[int]:
+        return sorted({callee for _, callee in self.call_sites})
+
+    def get_call_graph_successors(self) -> List[int]:
+        """
+        :return: the starts of the functions that can run while this one is active: the callees,
+        the callbacks it sets and the functions it transfers the control to
+        """
+        res = {callee for _, callee in self.call_sites}
+        res.update(callback for _, callback in self.callback_sites)
+        res.update(self.transfers)
+        return sorted(res)
+
+    def compute_shape(self):
+        """
+        Sums up the function's own shape in one number: the block and edge counts and the instruction histogram\n
+        :return: None
+        """
+        self.shape = hash((len(self.blocks), self.edges_count, tuple(sorted(self.instruction_histogram.items()))))
+
+    def compute_fingerprint(self, functions: Dict[int, "PAC_Subroutine"]):
+        """
+        Sums up the function's shape and the shapes of the functions it calls (one per call site) in one number,
+        the offsets are left out, so the moved functions keep the fingerprint, while the same code calling
+        different routines doesn't\n
+        :param functions: start -> function, their shapes are already computed
+        :return: None
+        """
+        self.fingerprint = hash((
+            self.shape, tuple(sorted(functions[callee].shape for _, callee in self.call_sites))
+        ))
+
+
+class PAC_FunctionSummary:
+    """
+    What a function can do, its callees and the functions it transfers the control to included\n
+    The functions of a call graph SCC share the variable and the callee sets
+    """
+    def __init__(self, start: int):
+        self.start: int = start
+        self.read: Set[PAC_variable] = set()
+        self.written: Set[PAC_variable] = set()
+        self.callees: Set[int] = set()  # the starts of all the functions that can run while this one is active
+        self.is_recursive: bool = False
+        # The stack effect
+        self.may_return: bool = False  # reaches cmd_end without calling
+        self.pops_frame: bool = False  # reaches cmd_stkDec without calling (drops the return address)
+        self.clears_stack: bool = False  # cmd_stkClr can be executed, in the callees as well
+
+    def __repr__(self):
+        return (
+            f"Summary 0x{self.start:X} (read = {len(self.read)}, written = {len(self.written)}, "
+            f"callees = {len(self.callees)}, may return = {self.may_return})"
+        )
 
 
 class PAC_DataBlocks:
@@ -77,19 +174,22 @@ class PAC_DataBlocks:
 
     def init_blocks(self):
         for location, entity in self.file.raw_entities.items():
-            data_block = RawDataBlock()
-            data_block.start = location
-            data_block.data = entity.raw_data
-            data_block.size = entity.size
-            try:
-                data_block.shift_jis = read_shift_jis_from_bytes(entity.raw_data, 0, entity.size)
-            except UnicodeDecodeError:
-                pass
-
-            self.data_blocks[location] = data_block
+            self.data_blocks[location] = self.make_block(location, entity)
 
         self.block_start_offsets = sorted(self.data_blocks.keys())
 
+    @staticmethod
+    def make_block(location: int, entity: Memory_entity) -> RawDataBlock:
+        data_block = RawDataBlock()
+        data_block.start = location
+        data_block.data = entity.raw_data
+        data_block.size = entity.size
+        try:
+            data_block.shift_jis = read_shift_jis_from_bytes(entity.raw_data, 0, entity.size)
+        except UnicodeDecodeError:
+            pass
+        return data_block
+
     def get_block_by_offset(self, offset: int):
         """
             This function returns the block which contains the offset\n
@@ -120,12 +220,220 @@ class PAC_Functions:
         self.functions: Dict[int, PAC_Subroutine] = {}
         self.code_blocks: PAC_FunctionBlocks = PAC_FunctionBlocks()
         self.entry_points: List[int] = []
+        self.block_to_function: Dict[int, int] = {}  # CFG block start -> function start
+        self.is_outdated: bool = False  # the CFG has changed since the functions were made
+        self.summaries: Dict[int, PAC_FunctionSummary] = {}  # function start -> summary, filled lazily
+        # The flow truncators
+        self.cmd_end: int = 0
+        self.cmd_stkDec: int = 0
+        self.cmd_stkClr: int = 0
 
         # self.saving_RA_instructions: Set[int] = set()
 
     def reset(self, file: PAC_file):
         self.file = file
+        self.functions = {}
         self.code_blocks.reset(file)
+        self.block_to_function = {}
+        self.summaries = {}
+
+    def get_function_by_offset(self, offset: int) -> Optional[PAC_Subroutine]:
+        starts = self.code_blocks.block_start_offsets
+        if not starts:
+            return None
+        index = binary_search(starts, offset)
+        if index == -1:
+            return None
+        block = self.code_blocks.code_blocks[starts[index]]
+        if offset >= block.start + block.size:
+            return None
+        return self.functions[self.code_blocks.block_to_subroutine[block.start]]
+
+    def init_functions(self, code: PAC_CodeBlocks):
+        """
+        Makes a PAC_Subroutine for every subroutine of self.code_blocks (see PAC_FunctionBlocks.break_into_blocks)
+        and assigns the CFG blocks, the edges and the call sites to them\n
+        :param code: the CFG blocks
+        :return: None
+        """
+        self.functions = {}
+        self.block_to_function = {}
+        self.summaries = {}
+        self.cmd_end, self.cmd_stkDec, self.cmd_stkClr = code.cmd_end, code.cmd_stkDec, code.cmd_stkClr
+        ranges = self.code_blocks.block_start_offsets
+        for range_start in ranges:
+            block = self.code_blocks.code_blocks[range_start]
+            start = self.code_blocks.block_to_subroutine[range_start]
+            function = self.functions.get(start)
+            if function is None:
+                function = self.functions[start] = PAC_Subroutine(start, block.start + block.size)
+            function.end = block.start + block.size
+            function.ranges.append(range_start)
+        if not ranges:
+            return
+
+        # Both lists are sorted => merge them
+        index = -1
+        for block_start in code.block_start_offsets:
+            while index + 1 < len(ranges) and ranges[index + 1] <= block_start:
+                index += 1
+            if index == -1:
+                continue
+            function = self.functions[self.code_blocks.block_to_subroutine[ranges[index]]]
+            function.blocks.append(block_start)
+            self.block_to_function[block_start] = function.start
+
+        for function in self.functions.values():
+            histogram = Counter()
+            for block_start in function.blocks:
+                block = code.code_blocks[block_start]
+                histogram.update([instruction.signature for instruction in block.ordered_instructions])
+
+                for edge in block.exit_point.where_to:
+                    target = self.block_to_function.get(edge.entry.code_block.start)
+                    if edge.properties.save_address:
+                        if target is not None:
+                            function.call_sites.append((edge.exit.position, target))
+                    elif target == function.start:
+                        function.edges_count += 1
+                    elif target is not None:
+                        if edge.properties.callback:
+                            function.callback_sites.append((edge.exit.position, target))
+                        else:
+                            function.transfers.append(target)
+            function.call_sites.sort()
+            function.callback_sites.sort()
+            function.transfers = sorted(set(function.transfers))
+            function.instruction_histogram = dict(histogram)
+
+            for callee in function.get_callees():
+                self.functions[callee].callers.append(function.start)
+
+        for function in self.functions.values():
+            function.compute_shape()
+        for function in self.functions.values():
+            function.compute_fingerprint(self.functions)
+
+    def get_summary(self, start: int) -> PAC_FunctionSummary:
+        """
+        Summarizes the function and everything it can run: the call graph SCCs are visited bottom-up
+        (in the order Tarjan's algorithm finishes them), the summaries made along the way are memoized\n
+        :param start: the start of a function
+        :return: the summary
+        """
+        if start in self.summaries:
+            return self.summaries[start]
+
+        index: Dict[int, int] = {start: 0}
+        low: Dict[int, int] = {start: 0}
+        stack: List[int] = [start]
+        on_stack: Set[int] = {start}
+        work = [(start, iter(self.functions[start].get_call_graph_successors()))]
+        while work:
+            v, successors = work[-1]
+            for to in successors:
+                if to in self.summaries:
+                    continue  # a finished component
+                if to not in index:
+                    index[to] = low[to] = len(index)
+                    stack.append(to)
+                    on_stack.add(to)
+                    work.append((to, iter(self.functions[to].get_call_graph_successors())))
+                    break
+                if to in on_stack:
+                    low[v] = min(low[v], index[to])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    self.summarize_component(component)
+        return self.summaries[start]
+
+    def summarize_component(self, component: List[int]):
+        """
+        Makes the summaries of a call graph SCC, the summaries of its successors must be ready\n
+        :param component: the starts of the functions
+        :return: None
+        """
+        members = set(component)
+        summaries = {start: PAC_FunctionSummary(start) for start in component}
+        read: Set[PAC_variable] = set()
+        written: Set[PAC_variable] = set()
+        callees: Set[int] = set()
+        is_recursive = len(component) > 1
+
+        for start in component:
+            function, summary = self.functions[start], summaries[start]
+            for range_start in function.ranges:
+                for instruction in self.code_blocks.code_blocks[range_start].ordered_instructions:
+                    defined, used = get_def_use(instruction)
+                    written.update(defined)
+                    read.update(used)
+                    if instruction.signature == self.cmd_end:
+                        summary.may_return = True
+                    elif instruction.signature == self.cmd_stkDec:
+                        summary.pops_frame = True
+                    elif instruction.signature == self.cmd_stkClr:
+                        summary.clears_stack = True
+
+            for to in function.get_call_graph_successors():
+                callees.add(to)
+                if to in members:
+                    is_recursive |= to == start
+                    continue
+                other = self.summaries[to]
+                read.update(other.read)
+                written.update(other.written)
+                callees.update(other.callees)
+                summary.clears_stack |= other.clears_stack
+            for to in function.transfers:
+                if to not in members:
+                    other = self.summaries[to]
+                    summary.may_return |= other.may_return
+                    summary.pops_frame |= other.pops_frame
+
+        # The stack effect goes backwards along the transfers within the component
+        changed = True
+        while changed:
+            changed = False
+            for start in component:
+                summary = summaries[start]
+                for to in self.functions[start].get_call_graph_successors():
+                    if to not in members:
+                        continue
+                    other = summaries[to]
+                    new_clears_stack = summary.clears_stack or other.clears_stack
+                    new_may_return, new_pops_frame = summary.may_return, summary.pops_frame
+                    if to in self.functions[start].transfers:
+                        new_may_return |= other.may_return
+                        new_pops_frame |= other.pops_frame
+                    if (new_clears_stack, new_may_return, new_pops_frame) != (
+                            summary.clears_stack, summary.may_return, summary.pops_frame
+                    ):
+                        summary.clears_stack, summary.may_return, summary.pops_frame = (
+                            new_clears_stack, new_may_return, new_pops_frame
+                        )
+                        changed = True
+
+        for summary in summaries.values():
+            summary.read, summary.written, summary.callees = read, written, callees
+            summary.is_recursive = is_recursive
+        self.summaries.update(summaries)
+
+    def may_modify(self, start: int, variable: PAC_variable) -> bool:
+        """
+        :return: True if the variable can be written while the function is active
+        """
+        return variable in self.get_summary(start).written
 
     # def set_instructions_info(self, saving_RA: Set[int]):
     #     self.saving_RA_instructions = saving_RA
@@ -209,20 +517,36 @@ class CondensedGraph:
         pass
 
 
-def edge_to_color_style(edge: PAC_Edge):
+# The edge categories in the order of priority and the way they are drawn
+EDGE_CATEGORY_STYLES: Dict[str, Tuple[str, str]] = {
+    "callback": ("orange", "solid"),
+    "special": ("violet", "solid"),
+    "potential": ("black", "dotted"),
+    "split": ("blue", "solid"),
+    "call": ("green", "solid"),
+    "fallthrough": ("black", "dashed"),
+    "jump": ("black", "solid"),
+}
+
+
+def edge_to_category(edge: PAC_Edge) -> str:
     if edge.properties.callback:
-        return "orange", "solid"
+        return "callback"
     if edge.properties.special:
-        return "violet", "solid"
+        return "special"
     if edge.properties.potential:
-        return "black", "dotted"
+        return "potential"
     if edge.exit.code_block.is_split:
-        return "blue", "solid"
+        return "split"
     if edge.properties.save_address:
-        return "green", "solid"
+        return "call"
     if edge.properties.fallthrough:
-        return "black", "dashed"
-    return "black", "solid"
+        return "fallthrough"
+    return "jump"
+
+
+def edge_to_color_style(edge: PAC_Edge):
+    return EDGE_CATEGORY_STYLES[edge_to_category(edge)]
 
 
 def block_to_color(block: ContiguousCodeBlock, vertex: int, roots: Dict[int, None], matched: Set[int]):
@@ -278,6 +602,7 @@ class PAC_Visitor:
 
         self.size: int = len(pac_code.block_start_offsets)
         self.edges_count: int = 0
+        self.index_to_offset: List[int] = list(pac_code.block_start_offsets)
         self.offset_to_index: Dict[int, int] = {offset: i for i, offset in enumerate(pac_code.block_start_offsets)}
         self.color: List[int] = [0] * self.size
         self.parent: List[int] = [0] * self.size
@@ -286,13 +611,16 @@ class PAC_Visitor:
         self.timer: int = 0
         self.topsort: List[int] = []
         self.is_DAG = True
+        self.self_loops: Set[int] = set()
         self.multiple_entrypoint_loops: List[int] = []
 
         self.components_buffer: List[int] = []
         self.non_trivial_components: Dict[int, Set[int]] = {}
         self.condensed: Optional[CondensedGraph] = None
         self.belongs_to_cycle: List[bool] = []
-        self.dominator_tree: Optional[OrdinaryGraph] = None
+        self.dominator_tree: Optional[PAC_DominatorTree] = None
+        self.reachability: Optional[PAC_ReachabilityIndex] = None  # built by the first query
+        self.loops: Optional[PAC_LoopForest] = None  # built by the first query
 
         self.isolated: List[int] = []
         self.sources: List[int] = []
@@ -303,47 +631,82 @@ class PAC_Visitor:
     def set_matched_blocks(self, matched: Set[int]):
         self.matched = matched
 
-    def declare_dot_nodes(self, dot: graphviz.Digraph, skip: SkipCriterion):
-        for address, block in self.all_code.code_blocks.items():
+    def declare_dot_nodes(self, writer: PAC_DotWriter, skip: SkipCriterion, vertices: Iterable[int]):
+        for vertex in vertices:
             # Maybe we should skip it?
-            vertex = self.offset_to_index[address]
-
             if skip(self.color[vertex]):
                 continue
 
+            address = self.all_code.block_start_offsets[vertex]
+            block = self.all_code.code_blocks[address]
             node_text = block.to_dot_str()
 
             color = block_to_color(block, vertex, self.roots, self.matched)
 
-            dot.node(f"{address}", node_text, fillcolor=color)
+            writer.node(f"{address}", node_text, fillcolor=color)
 
-    def declare_dot_edges(self, dot: graphviz.Digraph, skip: SkipCriterion):
-        for address, block in self.all_code.code_blocks.items():
+    def declare_dot_edges(self, writer: PAC_DotWriter, skip: SkipCriterion, vertices: Iterable[int],
+                          shard: Optional[Set[int]] = None) -> Set[int]:
+        """
+        Declares the edges that lead to the vertices (and the edges that leave the shard if it is specified)\n
+        :param writer: the DOT writer
+        :param skip: the criterion for skipping the vertices by their color
+        :param vertices: the vertices whose edges to declare
+        :param shard: None or the set of vertices that the output file contains
+        :return: the vertices outside the shard that are connected to it
+        """
+        outside: Set[int] = set()
+        for vertex in vertices:
             # Maybe we should skip it?
-            vertex = self.offset_to_index[address]
-            # if self.color[vertex] == 0:
-            #     continue
             if skip(self.color[vertex]):
                 continue
 
+            address = self.all_code.block_start_offsets[vertex]
+            block = self.all_code.code_blocks[address]
             for entry_point in block.entry_points.values():
                 for edge in entry_point.where_from:
                     # maybe some edges go from the non-existent blocks?
                     from_block = edge.exit.code_block
                     parent = self.offset_to_index[from_block.start]
-                    # if self.color[parent] == 0:
-                    #     continue
                     if skip(self.color[parent]):
                         continue
+                    if shard is not None and parent not in shard:
+                        outside.add(parent)
 
                     color, style = edge_to_color_style(edge)
 
-                    dot.edge(f"{from_block.start}", f"{address}", color=color, style=style)
+                    writer.edge(f"{from_block.start}", f"{address}", color=color, style=style)
                     # Add ,tailport="s", headport="n" to make a "forced" version of the graph
 
-    def declare_dot_SCC_subgraphs(self, dot: graphviz.Digraph, skip: SkipCriterion, settings: GVSettings):
-        for color_id, vertices in self.non_trivial_components.items():
-            subgraph = graphviz.Digraph(
+            if shard is None:
+                continue
+
+            # The edges that leave the shard
+            for edge in block.exit_point.where_to:
+                to_block = edge.entry.code_block
+                to = self.offset_to_index[to_block.start]
+                if to in shard or skip(self.color[to]):
+                    continue
+                outside.add(to)
+                color, style = edge_to_color_style(edge)
+                writer.edge(f"{address}", f"{to_block.start}", color=color, style=style)
+
+        return outside
+
+    def declare_dot_outside_nodes(self, writer: PAC_DotWriter, outside: Set[int]):
+        for vertex in sorted(outside):
+            address = self.all_code.block_start_offsets[vertex]
+            writer.node(f"{address}", f"0x{address:X}", shape="ellipse", style="dashed")
+
+    def declare_dot_SCC_subgraphs(self, writer: PAC_DotWriter, skip: SkipCriterion, settings: GVSettings,
+                                  components: Optional[Iterable[Tuple[int, Set[int]]]] = None,
+                                  shard: Optional[Set[int]] = None):
+        if components is None:
+            components = self.non_trivial_components.items()
+        for color_id, vertices in components:
+            writer.begin_subgraph(
+                f"cluster_color_{color_id}",
+                graph_attr={"bgcolor": "grey"},
                 node_attr={
                     "fontname": "courier",
                     "fontsize": f"{settings.fontsize}",
@@ -351,20 +714,51 @@ class PAC_Visitor:
                     "colorscheme": "paired6",
                     "style": "filled"
                 },
-                edge_attr={"fontname": "courier"},
-                graph_attr={"bgcolor": "grey"},
-                name=f"cluster_color_{color_id}"
+                edge_attr={"fontname": "courier"}
             )
             for v in vertices:
                 # Maybe we should skip it?
-                if skip(self.color[v]):
+                if skip(self.color[v]) or shard is not None and v not in shard:
                     continue
                 offset = self.all_code.block_start_offsets[v]
-                subgraph.node(f"{offset}")
-            dot.subgraph(subgraph)
+                writer.node(f"{offset}")
+            writer.end_subgraph()
 
-    def declare_dot_fallthrough_subgraphs(self, dot: graphviz.Digraph, skip: SkipCriterion, settings: GVSettings):
-        for start_offset, offsets in self.all_code.split_blocks.items():
+    def declare_dot_loop_subgraphs(self, writer: PAC_DotWriter, skip: SkipCriterion, settings: GVSettings):
+        """
+        Declares a cluster for every loop of the loop nesting forest, the inner loops are nested
+        in the outer ones (the irreducible loops are drawn darker)
+        """
+        work = [(loop, False) for loop in reversed(self.get_loops().top_level)]
+        while work:
+            loop, is_closing = work.pop()
+            if is_closing:
+                writer.end_subgraph()
+                continue
+            writer.begin_subgraph(
+                f"cluster_loop_{loop.header}",
+                graph_attr={"bgcolor": "grey" if loop.is_reducible else "dimgrey"},
+                node_attr={
+                    "fontname": "courier",
+                    "fontsize": f"{settings.fontsize}",
+                    "shape": "box",
+                    "colorscheme": "paired6",
+                    "style": "filled"
+                },
+                edge_attr={"fontname": "courier"}
+            )
+            for v in loop.blocks:
+                if not skip(self.color[v]):
+                    writer.node(f"{self.all_code.block_start_offsets[v]}")
+            work.append((loop, True))
+            work.extend((child, False) for child in reversed(loop.children))
+
+    def declare_dot_fallthrough_subgraphs(self, writer: PAC_DotWriter, skip: SkipCriterion, settings: GVSettings,
+                                          split_blocks: Optional[Dict[int, List[int]]] = None,
+                                          shard: Optional[Set[int]] = None):
+        if split_blocks is None:
+            split_blocks = self.all_code.split_blocks
+        for start_offset, offsets in split_blocks.items():
             # Let's see if it is even worth declaring a subgraph
 
             # Note: the list "offsets" is in an ascending order which means
@@ -392,7 +786,12 @@ class PAC_Visitor:
                 # Only one node left out
                 continue
 
-            subgraph = graphviz.Digraph(
+            writer.begin_subgraph(
+                f"cluster_{start_offset:X}",
+                graph_attr={
+                    # "bgcolor": "grey"
+                    "style": "dotted"
+                },
                 node_attr={
                     "fontname": "courier",
                     "fontsize": f"{settings.fontsize}",
@@ -400,23 +799,23 @@ class PAC_Visitor:
                     "colorscheme": "paired6",
                     # "style": "dashed"
                 },
-                edge_attr={"fontname": "courier"},
-                graph_attr={
-                    # "bgcolor": "grey"
-                    "style": "dotted"
-                },
-                name=f"cluster_{start_offset:X}"
+                edge_attr={"fontname": "courier"}
             )
 
             for v in range(start, first_cycle_vertex):
-                if skip(self.color[v]):
+                if skip(self.color[v]) or shard is not None and v not in shard:
                     continue
-                subgraph.node(f"{self.all_code.block_start_offsets[v]}")
+                writer.node(f"{self.all_code.block_start_offsets[v]}")
 
-            dot.subgraph(subgraph)
+            writer.end_subgraph()
 
-    def make_dot_file(self, name_suffix: str, dir_path: Path, settings: GVSettings, skip: SkipCriterion):
-        dot = graphviz.Digraph(
+    @staticmethod
+    def begin_dot_graph(writer: PAC_DotWriter, settings: GVSettings):
+        graph_attr = {}
+        if settings.nslimit is not None:
+            graph_attr["nslimit"] = f"{settings.nslimit}"
+        writer.begin_graph(
+            graph_attr=graph_attr,
             node_attr={
                 "fontname": "courier",
                 "fontsize": f"{settings.fontsize}",
@@ -426,31 +825,217 @@ class PAC_Visitor:
             },
             edge_attr={"fontname": "courier"},
         )
-        if settings.nslimit is not None:
-            dot.graph_attr["nslimit"] = f"{settings.nslimit}"
 
-        # Declare the nodes
-        self.declare_dot_nodes(dot, skip)
+    def get_dot_file_path(self, name_suffix: str, dir_path: Path) -> Path:
+        new_name = self.all_code.file.name + "_" + name_suffix
+        suffix = (dir_path / new_name).suffix
+        return (dir_path / new_name).with_suffix(suffix + ".gv")  # Looks a little ugly
+
+    def make_dot_file(self, name_suffix: str, dir_path: Path, settings: GVSettings, skip: SkipCriterion):
+        file_path = self.get_dot_file_path(name_suffix, dir_path)
+        with open(file_path, "w", buffering=DOT_BUFFER_SIZE) as dot_output:
+            writer = PAC_DotWriter(dot_output)
+            self.begin_dot_graph(writer, settings)
 
-        # Declare the edges
-        self.declare_dot_edges(dot, skip)
+            # Declare the nodes
+            self.declare_dot_nodes(writer, skip, range(self.size))
 
-        # Declare the subgraphs for the non-trivial components
-        self.declare_dot_SCC_subgraphs(dot, skip, settings)
+            # Declare the edges
+            self.declare_dot_edges(writer, skip, range(self.size))
 
-        # Try to group the split blocks together
-        self.declare_dot_fallthrough_subgraphs(dot, skip, settings)
+            # Declare the subgraphs for the non-trivial components (or the nested loops)
+            if settings.nest_loops:
+                self.declare_dot_loop_subgraphs(writer, skip, settings)
+            else:
+                self.declare_dot_SCC_subgraphs(writer, skip, settings)
 
-        new_name = self.all_code.file.name + "_" + name_suffix
-        suffix = (dir_path / new_name).suffix
-        file_path = (dir_path / new_name).with_suffix(suffix + ".gv")  # Looks a little ugly
-        with open(file_path, "w") as dot_output:
-            dot_output.write(dot.source)
+            # Try to group the split blocks together
+            self.declare_dot_fallthrough_subgraphs(writer, skip, settings)
+
+            writer.end_graph()
 
         new_path = file_path.with_suffix(".svg")
         # print(f"dot -Tsvg {file_path} -o {new_path}")
         return f"dot -Tsvg {file_path} -o {new_path}"
 
+    def get_dot_shards(self, sharding: str) -> Dict[int, List[int]]:
+        """
+        Splits the vertices into the groups that get their own DOT files\n
+        :param sharding: "SCC" (every non-trivial component), "function" (the vertices of a subroutine,
+        see get_subroutines) or "root" (the vertices reachable from a flowgraph root, but not from the previous roots)
+        :return: the offset that names the shard -> the sorted vertices of the shard
+        """
+        shards: Dict[int, List[int]] = {}
+        if sharding == "SCC":
+            for vertices in self.non_trivial_components.values():
+                shard = sorted(vertices)
+                shards[self.all_code.block_start_offsets[shard[0]]] = shard
+        elif sharding == "function":
+            subroutine_of = get_subroutines(self.all_code)
+            for v, offset in enumerate(self.all_code.block_start_offsets):
+                shards.setdefault(subroutine_of[offset], []).append(v)
+        elif sharding == "root":
+            assigned = [False] * self.size
+            for root in self.roots:
+                if assigned[root]:
+                    continue
+                shard = [root]
+                assigned[root] = True
+                for v in shard:
+                    for to in self.get_successors(v):
+                        if not assigned[to]:
+                            assigned[to] = True
+                            shard.append(to)
+                shards[self.all_code.block_start_offsets[root]] = sorted(shard)
+        else:
+            raise ValueError(f"Unknown DOT sharding mode: {sharding}")
+        return shards
+
+    def make_dot_shards(self, sharding: str, name_suffix: str, dir_path: Path, settings: GVSettings,
+                        skip: SkipCriterion) -> List[str]:
+        """
+        Writes many small DOT files instead of one (see get_dot_shards), the edges that cross the shard boundary
+        lead to (or come from) the dashed ellipses\n
+        :return: the console commands that render the files (they don't depend on each other)
+        """
+        vertex_to_component = self.get_vertex_to_component()
+        commands: List[str] = []
+        for shard_offset, vertices in self.get_dot_shards(sharding).items():
+            shard = set(vertices)
+            components = sorted({vertex_to_component[v] for v in vertices if v in vertex_to_component})
+            split_blocks = {
+                offset: self.all_code.split_blocks[offset]
+                for offset in (self.all_code.block_start_offsets[v] for v in vertices)
+                if offset in self.all_code.split_blocks
+            }
+
+            file_path = self.get_dot_file_path(f"{name_suffix}_{sharding}_{shard_offset:X}", dir_path)
+            with open(file_path, "w", buffering=DOT_BUFFER_SIZE) as dot_output:
+                writer = PAC_DotWriter(dot_output)
+                self.begin_dot_graph(writer, settings)
+                self.declare_dot_nodes(writer, skip, vertices)
+                outside = self.declare_dot_edges(writer, skip, vertices, shard)
+                self.declare_dot_outside_nodes(writer, outside)
+                self.declare_dot_SCC_subgraphs(
+                    writer, skip, settings,
+                    [(color_id, self.non_trivial_components[color_id]) for color_id in components],
+                    shard
+                )
+                self.declare_dot_fallthrough_subgraphs(writer, skip, settings, split_blocks, shard)
+                writer.end_graph()
+
+            commands.append(f"dot -Tsvg {file_path} -o {file_path.with_suffix('.svg')}")
+        return commands
+
+    def get_vertex_to_component(self) -> Dict[int, int]:
+        return {v: color_id for color_id, vertices in self.non_trivial_components.items() for v in vertices}
+
+    def export_jsonl(self, output_path: Path):
+        """
+        Writes the CFG as JSON Lines: a "file" record, then a record per block and a record per edge\n
+        The edges are typed by the same categories that make_dot_file uses for their colors
+        :param output_path: the path of the output file
+        :return: None
+        """
+        vertex_to_component = self.get_vertex_to_component()
+        names: Dict[int, str] = {}
+        with open(output_path, "w", encoding="utf-8", buffering=DOT_BUFFER_SIZE) as output:
+            write = output.write
+            self.count_edges()
+            write(json.dumps({
+                "kind": "file", "name": self.all_code.file.name, "blocks": self.size, "edges": self.edges_count
+            }) + "\n")
+
+            for v, address in enumerate(self.all_code.block_start_offsets):
+                block = self.all_code.code_blocks[address]
+                instructions = []
+                for offset, instruction in block.instructions.items():
+                    name = names.get(instruction.signature)
+                    if name is None:
+                        name = json.dumps(getattr(instruction, "name", f"0x{instruction.signature:08X}"))
+                        names[instruction.signature] = name
+                    instructions.append(f"[{offset},{instruction.signature},{name}]")
+                component = vertex_to_component.get(v)
+                write(
+                    f'{{"kind":"block","id":{address},"size":{block.size},'
+                    f'"source":{"true" if block.is_source else "false"},'
+                    f'"split":{"true" if block.is_split else "false"},'
+                    f'"dummy":{"true" if block.is_dummy else "false"},'
+                    f'"root":{"true" if v in self.roots else "false"},'
+                    f'"component":{"null" if component is None else component},'
+                    f'"entry_points":[{",".join(str(offset) for offset in block.entry_points)}],'
+                    f'"instructions":[{",".join(instructions)}]}}\n'
+                )
+
+            for address in self.all_code.block_start_offsets:
+                for edge in self.all_code.code_blocks[address].exit_point.where_to:
+                    write(
+                        f'{{"kind":"edge","from":{address},"to":{edge.entry.code_block.start},'
+                        f'"exit":{edge.exit.position},"entry":{edge.entry.position},'
+                        f'"category":"{edge_to_category(edge)}"}}\n'
+                    )
+
+    def export_graphml(self, output_path: Path):
+        """
+        Writes the CFG as GraphML (the node ids are the block offsets, the edges are typed like in export_jsonl)\n
+        :param output_path: the path of the output file
+        :return: None
+        """
+        vertex_to_component = self.get_vertex_to_component()
+        names: Dict[int, str] = {}
+        with open(output_path, "w", encoding="utf-8", buffering=DOT_BUFFER_SIZE) as output:
+            write = output.write
+            write(
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                '<key id="size" for="node" attr.name="size" attr.type="long"/>\n'
+                '<key id="source" for="node" attr.name="source" attr.type="boolean"/>\n'
+                '<key id="split" for="node" attr.name="split" attr.type="boolean"/>\n'
+                '<key id="dummy" for="node" attr.name="dummy" attr.type="boolean"/>\n'
+                '<key id="root" for="node" attr.name="root" attr.type="boolean"/>\n'
+                '<key id="component" for="node" attr.name="component" attr.type="long">'
+                '<default>-1</default></key>\n'
+                '<key id="instructions" for="node" attr.name="instructions" attr.type="string"/>\n'
+                '<key id="category" for="edge" attr.name="category" attr.type="string"/>\n'
+                '<key id="exit" for="edge" attr.name="exit" attr.type="long"/>\n'
+                '<key id="entry" for="edge" attr.name="entry" attr.type="long"/>\n'
+                f'<graph id={quoteattr(self.all_code.file.name)} edgedefault="directed">\n'
+            )
+
+            for v, address in enumerate(self.all_code.block_start_offsets):
+                block = self.all_code.code_blocks[address]
+                instructions = []
+                for offset, instruction in block.instructions.items():
+                    name = names.get(instruction.signature)
+                    if name is None:
+                        name = escape(getattr(instruction, "name", f"0x{instruction.signature:08X}"))
+                        names[instruction.signature] = name
+                    instructions.append(f"0x{offset:X} {name}")
+                component = vertex_to_component.get(v)
+                write(
+                    f'<node id="{address}">'
+                    f'<data key="size">{block.size}</data>'
+                    f'<data key="source">{"true" if block.is_source else "false"}</data>'
+                    f'<data key="split">{"true" if block.is_split else "false"}</data>'
+                    f'<data key="dummy">{"true" if block.is_dummy else "false"}</data>'
+                    f'<data key="root">{"true" if v in self.roots else "false"}</data>'
+                    + ("" if component is None else f'<data key="component">{component}</data>') +
+                    f'<data key="instructions">{"&#10;".join(instructions)}</data>'
+                    '</node>\n'
+                )
+
+            for address in self.all_code.block_start_offsets:
+                for edge in self.all_code.code_blocks[address].exit_point.where_to:
+                    write(
+                        f'<edge source="{address}" target="{edge.entry.code_block.start}">'
+                        f'<data key="category">{edge_to_category(edge)}</data>'
+                        f'<data key="exit">{edge.exit.position}</data>'
+                        f'<data key="entry">{edge.entry.position}</data>'
+                        '</edge>\n'
+                    )
+
+            write("</graph>\n</graphml>\n")
+
     def reset_color(self):
         self.color = [0] * self.size
 
@@ -536,9 +1121,12 @@ class PAC_Visitor:
     def find_reachable_from(self, offsets: List[int], *, maxdepth: int = -1):
         # No checks made beforehand
         self.reset_color()
-        for i, offset in enumerate(offsets):
-            if not self.find_reachable(offset, i+1, maxdepth=maxdepth):
-                print(f"The offset 0x{offset:X} does not correspond to any of the blocks!")
+        if maxdepth == -1:
+            # No DFS per offset: the closure knows everything
+            self.color_by_index(offsets, PAC_ReachabilityIndex.get_descendants)
+        else:
+            # The blocks at most maxdepth - 1 edges away (maxdepth counts the blocks on the way, like in DFS)
+            self.color_by_hops(offsets, maxdepth - 1, reverse=False)
 
     def find_parents(self, offset: int, color: int = 1, *, maxdepth: int = -1):
         if self.warning_imperfect_block_start:
@@ -558,9 +1146,193 @@ class PAC_Visitor:
     def find_parents_of(self, offsets: List[int], *, maxdepth: int = -1):
         # No checks made beforehand
         self.reset_color()
+        if maxdepth == -1:
+            self.color_by_index(offsets, PAC_ReachabilityIndex.get_ancestors)
+        else:
+            self.color_by_hops(offsets, maxdepth - 1, reverse=True)
+
+    def get_vertex(self, offset: int) -> Optional[int]:
+        """
+        :param offset: a PAC offset
+        :return: the index of the block that contains the offset (or goes right after it), None if there's none
+        """
+        if self.warning_imperfect_block_start and offset not in self.all_code.code_blocks:
+            return None
+        res = self.all_code.get_block_by_offset(offset)
+        if res is None:
+            return None
+        return self.offset_to_index[res[0]]
+
+    def get_reachability(self) -> PAC_ReachabilityIndex:
+        if self.reachability is None:
+            components = self.tarjan_algorithm(set(range(self.size)))
+            self.reachability = PAC_ReachabilityIndex(self.size, self.get_successors, components)
+        return self.reachability
+
+    def get_loops(self) -> PAC_LoopForest:
+        """
+        The DFS of the loop forest starts from the flowgraph roots, so find_roots should be called first\n
+        :return: the loop nesting forest of the CFG
+        """
+        if self.loops is None:
+            self.loops = PAC_LoopForest(self.size, self.get_successors, self.get_predecessors, self.roots)
+        return self.loops
+
+    def is_reachable(self, source: int, destination: int) -> bool:
+        """
+        :param source: the offset of a block
+        :param destination: the offset of a block
+        :return: True if there's a path between the blocks that contain the offsets
+        """
+        u, v = self.get_vertex(source), self.get_vertex(destination)
+        if u is None or v is None:
+            return False
+        return self.get_reachability().is_reachable(u, v)
+
+    def color_by_index(self, offsets: List[int], query: Callable[[PAC_ReachabilityIndex, List[int]], List[int]]):
+        """
+        Colors the vertices the query returns for every offset with its number (starting with 1),
+        the vertices that several offsets share keep the first color, just like after find_reachable_from\n
+        :param offsets: the offsets of the blocks
+        :param query: get_descendants or get_ancestors
+        """
+        reachability = self.get_reachability()
+        for i, offset in enumerate(offsets):
+            v = self.get_vertex(offset)
+            if v is None:
+                print(f"The offset 0x{offset:X} does not correspond to any of the blocks!")
+                continue
+            for u in query(reachability, [v]):
+                if self.color[u] == 0:
+                    self.color[u] = i + 1
+
+    def get_neighbours(self, v: int, reverse: bool = False, edge_kinds: Optional[Set[str]] = None) -> List[int]:
+        """
+        :param v: a vertex
+        :param reverse: False for the successors, True for the predecessors
+        :param edge_kinds: the categories of the edges to follow (see EDGE_CATEGORY_STYLES),
+        None to follow the ones the visitor doesn't ignore
+        :return: the neighbouring vertices
+        """
+        if edge_kinds is None:
+            return self.get_predecessors(v) if reverse else self.get_successors(v)
+        block = self.all_code.code_blocks[self.index_to_offset[v]]
+        if reverse:
+            return [
+                self.offset_to_index[edge.exit.code_block.start]
+                for edge in block.get_incoming() if edge_to_category(edge) in edge_kinds
+            ]
+        return [
+            self.offset_to_index[edge.entry.position]
+            for edge in block.get_outgoing() if edge_to_category(edge) in edge_kinds
+        ]
+
+    def get_neighbourhood(self, vertices: List[int], hops: int, reverse: bool = False,
+                          edge_kinds: Optional[Set[str]] = None) -> Dict[int, int]:
+        """
+        Breadth-first search from all the vertices at once\n
+        :param vertices: the starting vertices
+        :param hops: the maximal number of edges to go through (-1 for no limit)
+        :param reverse: True to go against the edges
+        :param edge_kinds: see get_neighbours
+        :return: vertex -> the number of edges between it and the closest starting vertex
+        """
+        distance = {v: 0 for v in vertices}
+        queue = deque(vertices)
+        while queue:
+            v = queue.popleft()
+            if distance[v] == hops:
+                continue
+            for to in self.get_neighbours(v, reverse, edge_kinds):
+                if to not in distance:
+                    distance[to] = distance[v] + 1
+                    queue.append(to)
+        return distance
+
+    def color_by_hops(self, offsets: List[int], hops: int, reverse: bool):
+        """
+        Like color_by_index, but only the vertices at most 'hops' edges away from the offset are colored
+        """
         for i, offset in enumerate(offsets):
-            if not self.find_parents(offset, i+1, maxdepth=maxdepth):
+            v = self.get_vertex(offset)
+            if v is None:
                 print(f"The offset 0x{offset:X} does not correspond to any of the blocks!")
+                continue
+            for u in self.get_neighbourhood([v], hops, reverse):
+                if self.color[u] == 0:
+                    self.color[u] = i + 1
+
+    def find_shortest_path(self, source: int, destination: int,
+                           edge_kinds: Optional[Set[str]] = None) -> Optional[List[int]]:
+        """
+        Bidirectional breadth-first search: the smaller frontier makes a step until the searches meet\n
+        :param source: a vertex
+        :param destination: a vertex
+        :param edge_kinds: see get_neighbours
+        :return: the vertices of a path with the fewest edges or None if there's no path
+        """
+        if source == destination:
+            return [source]
+        if edge_kinds is None and not self.get_reachability().is_reachable(source, destination):
+            return None
+
+        # vertex -> the previous vertex on the way from the source / the next one on the way to the destination
+        forward: Dict[int, int] = {source: -1}
+        backward: Dict[int, int] = {destination: -1}
+        forward_frontier = [source]
+        backward_frontier = [destination]
+        meeting = -1
+        while forward_frontier and backward_frontier and meeting == -1:
+            reverse = len(backward_frontier) < len(forward_frontier)
+            frontier, visited, other = (
+                (backward_frontier, backward, forward) if reverse else (forward_frontier, forward, backward)
+            )
+            next_frontier = []
+            for v in frontier:
+                for to in self.get_neighbours(v, reverse, edge_kinds):
+                    if to in visited:
+                        continue
+                    visited[to] = v
+                    next_frontier.append(to)
+                    if to in other:
+                        # Every vertex of the frontier is as far, so the first meeting is as good as any
+                        meeting = to
+                        break
+                if meeting != -1:
+                    break
+            if reverse:
+                backward_frontier = next_frontier
+            else:
+                forward_frontier = next_frontier
+        if meeting == -1:
+            return None
+
+        path = []
+        v = meeting
+        while v != -1:
+            path.append(v)
+            v = forward[v]
+        path.reverse()
+        v = backward[meeting]
+        while v != -1:
+            path.append(v)
+            v = backward[v]
+        return path
+
+    def get_path(self, source: int, destination: int, edge_kinds: Optional[Set[str]] = None) -> Optional[List[int]]:
+        """
+        :param source: the offset of a block
+        :param destination: the offset of a block
+        :param edge_kinds: see get_neighbours
+        :return: the start offsets of the blocks on a shortest path or None if there's no path
+        """
+        u, v = self.get_vertex(source), self.get_vertex(destination)
+        if u is None or v is None:
+            return None
+        path = self.find_shortest_path(u, v, edge_kinds)
+        if path is None:
+            return None
+        return [self.index_to_offset[w] for w in path]
 
     def topsort_DFS(self, vertex: EntryPoint, color: int):
         v = self.offset_to_index[vertex.position]
@@ -576,6 +1348,8 @@ class PAC_Visitor:
             if self.color[to] == -1:
                 # found_cycle = True
                 self.is_DAG = False
+                if to == v:
+                    self.self_loops.add(v)
                 continue  # technically we can comment this line out
             if self.color[to] == 0:
                 # found_cycle = self.topsort_DFS(edge.entry, color) or found_cycle
@@ -632,6 +1406,11 @@ class PAC_Visitor:
             for address, block in self.all_code.code_blocks.items():
                 v = self.offset_to_index[address]
                 for edge in block.exit_point.where_to:
+                    # The edges that the SCCs ignore would make cycles in the condensed graph
+                    if self.ignore_callbacks and edge.properties.callback:
+                        continue
+                    if self.ignore_special and edge.properties.special:
+                        continue
                     to = self.offset_to_index[edge.entry.position]
                     if to_root_node[v] != to_root_node[to]:
                         # Different SCC => let's make an edge
@@ -709,8 +1488,213 @@ class PAC_Visitor:
             self.edges_count += len(block.get_outgoing()) + len(block.get_incoming())
         self.edges_count //= 2
 
-    def build_dominator_tree(self):
-        pass
+    def get_successors(self, v: int) -> List[int]:
+        offset = self.all_code.block_start_offsets[v]
+        successors = []
+        for edge in self.all_code.code_blocks[offset].get_outgoing():
+            if self.ignore_callbacks and edge.properties.callback:
+                continue
+            if self.ignore_special and edge.properties.special:
+                continue
+            successors.append(self.offset_to_index[edge.entry.position])
+        return successors
+
+    def get_predecessors(self, v: int) -> List[int]:
+        offset = self.all_code.block_start_offsets[v]
+        predecessors = []
+        for edge in self.all_code.code_blocks[offset].get_incoming():
+            if self.ignore_callbacks and edge.properties.callback:
+                continue
+            if self.ignore_special and edge.properties.special:
+                continue
+            predecessors.append(self.offset_to_index[edge.exit.code_block.start])
+        return predecessors
+
+    def tarjan_algorithm(self, vertices: Set[int]) -> List[List[int]]:
+        """
+        Finds the SCCs of the subgraph induced by the vertices (iteratively, the subgraph can be large)\n
+        :param vertices: the vertices of the subgraph
+        :return: the list of SCCs
+        """
+        index: Dict[int, int] = {}
+        low: Dict[int, int] = {}
+        stack: List[int] = []
+        on_stack: Set[int] = set()
+        components: List[List[int]] = []
+        for root in sorted(vertices):
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.get_successors(root)))]
+            while work:
+                v, successors = work[-1]
+                for to in successors:
+                    if to not in vertices:
+                        continue
+                    if to not in index:
+                        index[to] = low[to] = len(index)
+                        stack.append(to)
+                        on_stack.add(to)
+                        work.append((to, iter(self.get_successors(to))))
+                        break
+                    if to in on_stack:
+                        low[v] = min(low[v], index[to])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[v])
+                    if low[v] == index[v]:
+                        component = []
+                        while True:
+                            w = stack.pop()
+                            on_stack.discard(w)
+                            component.append(w)
+                            if w == v:
+                                break
+                        components.append(component)
+        return components
+
+    def apply_cfg_diff(self, diff: PAC_CFG_diff):
+        """
+        Updates the vertex indexes, the SCCs, the sources, the sinks and the roots after
+        PAC_CodeBlocks.apply_entity_diff\n
+        Only the SCCs that could have changed are computed again: the ones that contained the changed blocks
+        and the ones that go through them (every vertex there can reach a changed block and be reached from one)\n
+        Note: the representatives of the new non-trivial components are their first blocks,
+        so roots may differ from the ones find_roots would choose\n
+        :param diff: the changes made to the code blocks
+        :return: None
+        """
+        old_index_to_offset = self.index_to_offset
+        removed = set(diff.removed_blocks)
+        was_DAG = self.is_DAG
+
+        self.index_to_offset = list(self.all_code.block_start_offsets)
+        self.offset_to_index = {offset: i for i, offset in enumerate(self.index_to_offset)}
+        self.size = len(self.index_to_offset)
+
+        def remap(vertices):
+            return [
+                self.offset_to_index[old_index_to_offset[v]]
+                for v in vertices if old_index_to_offset[v] not in removed
+            ]
+
+        affected = {self.offset_to_index[offset] for offset in diff.added_blocks}
+        affected.update(self.offset_to_index[offset] for offset in diff.touched_blocks)
+
+        # 1) The old components: the ones with the changed blocks fall apart
+        dissolved: Set[int] = set()
+        components: Dict[int, List[int]] = {}
+        for color, vertices in self.non_trivial_components.items():
+            new_vertices = remap(vertices)
+            if len(new_vertices) != len(vertices) or not affected.isdisjoint(new_vertices):
+                dissolved.update(new_vertices)
+            else:
+                components[color] = new_vertices
+
+        # 2) The vertices that can reach the changed blocks and can be reached from them
+        backward = set(affected)
+        queue = list(affected)
+        while queue:
+            for v in self.get_predecessors(queue.pop()):
+                if v not in backward:
+                    backward.add(v)
+                    queue.append(v)
+        region = set(affected)
+        queue = list(affected)
+        while queue:
+            for v in self.get_successors(queue.pop()):
+                if v in backward and v not in region:
+                    region.add(v)
+                    queue.append(v)
+        region.update(dissolved)
+        next_color = max(self.non_trivial_components, default=0) + 1
+        self.non_trivial_components = {}
+        for color, vertices in components.items():
+            if region.isdisjoint(vertices):
+                self.non_trivial_components[color] = set(vertices)
+            else:
+                region.update(vertices)
+        new_components = self.tarjan_algorithm(region)
+
+        # 3) Components, cycles and self-loops
+        for vertices in new_components:
+            if len(vertices) > 1:
+                self.non_trivial_components[next_color] = set(vertices)
+                next_color += 1
+
+        self.self_loops = set(remap(self.self_loops)) - affected
+        for v in affected:
+            if v in self.get_successors(v):
+                self.self_loops.add(v)
+
+        self.is_DAG = not self.non_trivial_components and not self.self_loops
+        self.belongs_to_cycle = [] if self.is_DAG else [False] * self.size
+        for vertices in self.non_trivial_components.values():
+            for v in vertices:
+                self.belongs_to_cycle[v] = True
+
+        # 4) Sources, sinks and isolated blocks
+        sources, sinks, isolated = remap(self.sources), remap(self.sinks), remap(self.isolated)
+        sources = [v for v in sources if v not in affected]
+        sinks = [v for v in sinks if v not in affected]
+        isolated = [v for v in isolated if v not in affected]
+        for v in affected:
+            block = self.all_code.code_blocks[self.index_to_offset[v]]
+            if block.is_source:
+                if block.exit_point.where_to:
+                    sources.append(v)
+                else:
+                    isolated.append(v)
+            elif not block.exit_point.where_to:
+                sinks.append(v)
+        self.sources, self.sinks, self.isolated = sorted(sources), sorted(sinks), sorted(isolated)
+
+        # 5) Roots: the components without incoming edges
+        if self.is_DAG:
+            self.roots = {v: None for v in self.isolated}
+            self.roots.update({v: None for v in self.sources})
+        else:
+            if was_DAG:
+                # The roots used to be the sources, now they come from the condensed graph
+                candidates = [list(vertices) for vertices in self.non_trivial_components.values()]
+                candidates.extend([v] for v in range(self.size) if not self.belongs_to_cycle[v])
+                old_roots = set()
+                roots = set()
+            else:
+                candidates = new_components
+                old_roots = set(remap(self.roots))
+                roots = old_roots - region
+            for vertices in candidates:
+                members = set(vertices)
+                if all(u in members for v in vertices for u in self.get_predecessors(v)):
+                    representatives = old_roots & members
+                    roots.add(min(representatives) if representatives else min(members))
+            self.roots = {v: None for v in sorted(roots)}
+
+        self.edges_count += diff.edges_delta
+        self.condensed = None
+        self.reachability = None
+        self.loops = None
+        self.dominator_tree = None
+        self.topsort = []
+        self.multiple_entrypoint_loops = []
+        self.color = [0] * self.size
+        self.parent = [0] * self.size
+        self.tin = [0] * self.size
+        self.tout = [0] * self.size
+
+    def build_dominator_tree(self) -> PAC_DominatorTree:
+        """
+        The DFS starts from the flowgraph roots, so find_roots should be called first\n
+        :return: the dominator tree of the CFG
+        """
+        if self.dominator_tree is None:
+            self.dominator_tree = PAC_DominatorTree(self.size, self.get_successors, self.get_predecessors, self.roots)
+        return self.dominator_tree
 
 
 @dataclass
@@ -724,6 +1708,7 @@ class DecompilerSettings:
     dot_settings: GVSettings = GVSettings(fontsize=10, nslimit=12)
     default_dot_name_suffix: str = "svg"
     SVG_path: str = ""
+    dot_sharding: Optional[str] = None  # None (a single file), "SCC", "function" or "root"
 
 
 @dataclass
@@ -738,6 +1723,44 @@ class PAC_stats:
     use_4_byte_values: Dict[int, Dict[int, PAC_instruction]] = field(default_factory=dict)
     use_flags: Dict[int, Dict[int, PAC_instruction]] = field(default_factory=dict)
 
+    def get_usage_tables(self, instruction: PAC_instruction):
+        """
+        Pairs the tables with the values the instruction uses\n
+        :param instruction: a PAC instruction
+        :return: the generator function
+        """
+        used_vars = instruction.get_used_pac_vars()
+        used_consts = instruction.get_used_constants()
+        # Variables
+        yield self.use_IntLocals, used_vars.var_0x4
+        yield self.use_FloatLocals, used_vars.var_0x20
+        yield self.use_IntGlobals, used_vars.var_0x8
+        yield self.use_FloatGlobals, used_vars.var_0x40
+        # Constants
+        yield self.use_IntConstants, used_consts.const_0x2
+        yield self.use_FloatConstants, used_consts.const_0x10
+        # 0x1 values
+        yield self.use_0x1_values, instruction.get_used_0x1_values()
+        # 4 byte values
+        yield self.use_4_byte_values, instruction.get_used_4_byte_values()
+
+    def add_instruction(self, location: int, instruction: PAC_instruction):
+        for table, values in self.get_usage_tables(instruction):
+            for value in sorted(values):
+                if value not in table:
+                    table[value] = {}
+                table[value][location] = instruction
+
+    def remove_instruction(self, location: int, instruction: PAC_instruction):
+        for table, values in self.get_usage_tables(instruction):
+            for value in values:
+                users = table.get(value)
+                if users is None:
+                    continue
+                users.pop(location, None)
+                if not users:
+                    del table[value]
+
 
 class PAC_Decompiler:
     def __init__(self):
@@ -748,10 +1771,20 @@ class PAC_Decompiler:
         self.settings = DecompilerSettings()
         self.stats = PAC_stats()
         self.CFG_visitor: Optional[PAC_Visitor] = None
+        self.dataflow: Optional[PAC_Dataflow] = None  # built when it's needed
+        self.ssa: Optional[PAC_SSA] = None  # built when it's needed
         self.console_dot_command: str = ""
+        self.console_dot_commands: List[str] = []
         self.matched_offsets: Set[int] = set()
 
-    def setResources(self, signature_to_name: Optional[Dict[int, str]] = None):
+    def setResources(self, signature_to_name: Optional[Dict[int, str]] = None,
+                     reference_signature_to_name: Optional[Dict[int, str]] = None):
+        """
+        Reads the control flow tables of the resources, they list the signatures of P3\n
+        :param signature_to_name: the instruction names of the decompiled files
+        :param reference_signature_to_name: the instruction names of P3, pass them when the files use another
+        instruction set: the tables are translated by the instruction names then
+        """
         self.code.read_instructions_info(
             cond_jump_instructions_path,
             uncond_jump_instructions_path,
@@ -763,67 +1796,21 @@ class PAC_Decompiler:
         self.code.read_important_signatures(important_instructions_path)
         if signature_to_name is not None:
             self.code.set_signature_to_name(signature_to_name)
+            if reference_signature_to_name is not None:
+                self.code.translate_instructions_info(reference_signature_to_name, signature_to_name)
 
     def reset(self, file: PAC_file):
         self.file = file
         self.code.reset(self.file)
         self.data.reset(self.file)
         self.functions.reset(self.file)
+        self.dataflow = None
+        self.ssa = None
 
     def gather_stats(self):
         stats = PAC_stats()
-
-        def update_stats():
-            # Variables
-            for var in sorted(used_vars.var_0x4):
-                if var not in stats.use_IntLocals:
-                    stats.use_IntLocals[var] = {}
-                stats.use_IntLocals[var][location] = instruction
-
-            for var in sorted(used_vars.var_0x20):
-                if var not in stats.use_FloatLocals:
-                    stats.use_FloatLocals[var] = {}
-                stats.use_FloatLocals[var][location] = instruction
-
-            for var in sorted(used_vars.var_0x8):
-                if var not in stats.use_IntGlobals:
-                    stats.use_IntGlobals[var] = {}
-                stats.use_IntGlobals[var][location] = instruction
-
-            for var in sorted(used_vars.var_0x40):
-                if var not in stats.use_FloatGlobals:
-                    stats.use_FloatGlobals[var] = {}
-                stats.use_FloatGlobals[var][location] = instruction
-
-            # Constants
-            for value in sorted(used_consts.const_0x2):
-                if value not in stats.use_IntConstants:
-                    stats.use_IntConstants[value] = {}
-                stats.use_IntConstants[value][location] = instruction
-
-            for value in sorted(used_consts.const_0x10):
-                if value not in stats.use_FloatConstants:
-                    stats.use_FloatConstants[value] = {}
-                stats.use_FloatConstants[value][location] = instruction
-
-            # 0x1 values
-            for value in sorted(_0x1_values):
-                if value not in stats.use_0x1_values:
-                    stats.use_0x1_values[value] = {}
-                stats.use_0x1_values[value][location] = instruction
-
-            # 4 byte values
-            for value in sorted(used_4_byte_values):
-                if value not in stats.use_4_byte_values:
-                    stats.use_4_byte_values[value] = {}
-                stats.use_4_byte_values[value][location] = instruction
-
         for location, instruction in self.file.ordered_instructions.items():
-            used_vars = instruction.get_used_pac_vars()
-            _0x1_values = instruction.get_used_0x1_values()
-            used_consts = instruction.get_used_constants()
-            used_4_byte_values = instruction.get_used_4_byte_values()
-            update_stats()
+            stats.add_instruction(location, instruction)
 
         # Here we may do something about the flags, but it's much harder
         self.stats = stats
@@ -833,78 +1820,46 @@ class PAC_Decompiler:
             print("Aggressive label cracker launched...")
         # Reserved for cracking 4:0 runtime labels
 
-        # Let's find all setGateInfo instructions that fit our case
-        instructions = self.file.getInstructions(0x2516bd00)
-        instructions = {
-            offset: instr
-            for offset, instr in instructions.items()
-            if instr.ordered_PAC_params[-1][0].type.startswith("0x1")
-        }
-
-        # This struct maps instruction locations to the values of relevant args
-        setGateInfoOffsets = {}
-        for location, instruction in instructions.items():
-            last_arg = instruction.ordered_PAC_params[-1]
-            before_the_last_arg = instruction.ordered_PAC_params[-2]
-            if before_the_last_arg[0].type != "uint32_t":
-                if self.settings.verbose_level <= 2:
-                    print(f"The 3rd argument of setGateInfo at {location:X} is not an integer!")
-                continue
-
-            setGateInfoOffsets[location] = before_the_last_arg[1], last_arg[1]
-
+        # The unrecovered runtime jumps whose variable is read from a gate right before them
+        gate_jumps: Dict[int, Tuple[int, PAC_instruction]] = {}  # jump offset -> the location of getGateInfo, itself
+        for offset, location in self.code.getGateInfo_jumps.items():
+            getGateInfo = self.file.ordered_instructions[location]
+            jumping_arg = self.file.ordered_instructions[offset].ordered_PAC_params[0]
+            written_arg = getGateInfo.ordered_PAC_params[-1]
+            if jumping_arg[0].type == written_arg[0].type and jumping_arg[1] == written_arg[1]:
+                gate_jumps[offset] = location, getGateInfo
+            elif self.settings.verbose_level <= 2:
+                print(f"getGateInfo at 0x{location:X} doesn't write the variable of the jump at 0x{offset:X}")
+
+        facts = PAC_GatePropagation.get_facts(self.file.ordered_instructions, 0x2516BD00)  # setGateInfo
         if self.settings.verbose_level <= 2:
-            print(f"{setGateInfoOffsets=}")
-            print_hex(list(setGateInfoOffsets.keys()))
-
-        # Now let's see if the destinations correspond to the start offsets of the blocks
-        destinations = {args[-1] for args in setGateInfoOffsets.values()}
-        current_destinations = set(self.code.code_blocks.keys())
-        difference = destinations - current_destinations
-        if not difference:
-            # They do! We don't have to split blocks any more!
-            pass
-        else:
-            # We have to split some more blocks... If the destinations are valid, of course
-            print("WARNING, deduced new code block starts! Not implemented => aborting!")
-            raise RuntimeError
-
-        # Now let's see which blocks are reachable by the values set by setGateInfo
-        visitor = PAC_Visitor(self.code)
-
-        # vertices = {visitor.offset_to_index[offset] for offset in self.code.getGateInfo_jumps}
-        def test_this_setGateInfo(start: ContiguousCodeBlock, args):
-            visitor.reset_color()
-
-            def special_DFS(entrypoint: EntryPoint):
-                v = visitor.offset_to_index[entrypoint.position]
-                visitor.color[v] = -1
-                for edge in entrypoint.code_block.get_outgoing():
-                    to_offset = edge.entry.position
-                    to = visitor.offset_to_index[to_offset]
-                    if visitor.color[to] == 0:
-                        if to_offset in setGateInfoOffsets:
-                            # We don't want to go there...
-                            continue
-                        if to_offset in self.code.getGateInfo_block_offsets:
-                            # Good! We've reached the block with cmd_jmp/callLabel!
-                            _, block = self.code.get_block_by_offset(to_offset)
-                            if not hasattr(block, "dataflow_input"):
-                                block.dataflow_input = set()
-                            block.dataflow_input.add(args)
-                            continue
-                        special_DFS(edge.entry)
-
-            special_DFS(start.get_entry_point())
-
-        for offset, args in setGateInfoOffsets.items():
-            _, start_block = self.code.get_block_by_offset(offset)
-            test_this_setGateInfo(start_block, args)
-            pass
+            print(f"{len(facts)} setGateInfo instructions store a 0x1 offset, {len(gate_jumps)} jumps read them")
+        if not facts or not gate_jumps:
+            return
 
-        #     visitor.color[v] = 2
+        # All the facts go through the CFG at once, the new edges are added in one go (the blocks are split
+        # at the new destinations by normalize_entrypoints) and it's repeated until nothing changes
+        iterations = 0
+        while True:
+            iterations += 1
+            propagation = PAC_GatePropagation(self.code, facts)
+            propagation.solve()
+            new_destinations = {
+                offset: propagation.get_destinations(location, PAC_GatePropagation.get_gate_key(getGateInfo))
+                for offset, (location, getGateInfo) in gate_jumps.items()
+            }
+            added = 0
+            for offset, destinations in new_destinations.items():
+                added += self.code.add_recovered_destinations(offset, destinations)
+            if not added:
+                break
 
-        pass
+        recovered = [offset for offset in gate_jumps if offset in self.code.recovered_jumps]
+        for offset in recovered:
+            self.code.forget_unrecovered_jump(offset)
+        if self.settings.verbose_level <= 2:
+            print(f"Gate propagation: {iterations} iterations, {len(recovered)} jumps recovered")
+            print_hex(recovered)
 
     def make_IR(self):
         self.code.break_into_blocks(self.settings.include_callbacks)
@@ -927,6 +1882,29 @@ class PAC_Decompiler:
             print_all()
         )
 
+    def make_dot_shards(self):
+        self.CFG_visitor.set_matched_blocks(self.matched_offsets)
+        return self.CFG_visitor.make_dot_shards(
+            self.settings.dot_sharding,
+            self.settings.default_dot_name_suffix,
+            Path(self.settings.SVG_path),
+            self.settings.dot_settings,
+            print_all()
+        )
+
+    def export_CFG(self, output_path: Path):
+        """
+        Exports the CFG for the external tools, the format is chosen by the suffix (.jsonl or .graphml)\n
+        :param output_path: the path of the output file
+        :return: None
+        """
+        if output_path.suffix == ".jsonl":
+            self.CFG_visitor.export_jsonl(output_path)
+        elif output_path.suffix == ".graphml":
+            self.CFG_visitor.export_graphml(output_path)
+        else:
+            raise ValueError(f"Unknown CFG export format: {output_path.suffix}")
+
     def analyze_data(self):
         self.data.init_blocks()
         if not self.data.data_blocks:
@@ -1005,7 +1983,18 @@ class PAC_Decompiler:
                 f"{visitor.edges_count - visitor.size + 2}",
             )
 
-        # Examine loop entrypoints
+        if self.settings.verbose_level <= 2:
+            loops = visitor.get_loops()
+            print(
+                f"{len(loops.loops)} loops ({len(loops.get_irreducible_loops())} irreducible),",
+                f"the nesting depth is {max((loop.depth for loop in loops.loops), default=0)}"
+            )
+
+        self.examine_loop_entrypoints(visitor)
+        # Kind of done...
+        self.CFG_visitor = visitor
+
+    def examine_loop_entrypoints(self, visitor: PAC_Visitor):
         next_component = False
         for i, vertices in enumerate(visitor.non_trivial_components.values()):
             found_one = False
@@ -1032,11 +2021,46 @@ class PAC_Decompiler:
 
         if self.settings.verbose_level <= 2 and not next_component:
             print("Every loop has no more than one entrypoint!")
-        # Kind of done...
-        self.CFG_visitor = visitor
 
     def create_functions(self):
         self.functions.code_blocks.break_into_blocks(self.code)
+        self.functions.init_functions(self.code)
+        self.functions.is_outdated = False
+
+    def get_functions(self) -> Dict[int, PAC_Subroutine]:
+        if self.functions.is_outdated:
+            self.create_functions()
+        return self.functions.functions
+
+    def get_function_summary(self, offset: int) -> Optional[PAC_FunctionSummary]:
+        """
+        :param offset: an offset within a function
+        :return: the summary of the function or None if there's no function there
+        """
+        if self.functions.is_outdated:
+            self.create_functions()
+        function = self.functions.get_function_by_offset(offset)
+        return self.functions.get_summary(function.start) if function is not None else None
+
+    def solve_dataflow(self, problem: PAC_DataflowProblem) -> PAC_dataflow_result:
+        """
+        Solves a dataflow problem (e.g. ReachingDefinitions, LiveVariables or AvailableValues) over the code blocks\n
+        :param problem: the problem, it keeps the meaning of the bits
+        :return: the states before and after every block
+        """
+        if self.dataflow is None:
+            self.dataflow = PAC_Dataflow(self.code)
+        return self.dataflow.solve(problem)
+
+    def get_SSA(self) -> PAC_SSA:
+        """
+        :return: the SSA form of the local variables over the same graph solve_dataflow uses
+        """
+        if self.ssa is None:
+            if self.dataflow is None:
+                self.dataflow = PAC_Dataflow(self.code)
+            self.ssa = PAC_SSA(self.dataflow)
+        return self.ssa
 
     def decompile(self, settings: DecompilerSettings):
         self.settings = settings
@@ -1049,7 +2073,92 @@ class PAC_Decompiler:
         self.study_CFG()
         self.create_functions()
         if settings.make_dot_file:
-            self.console_dot_command = self.make_dot_file()
+            if settings.dot_sharding is None:
+                self.console_dot_command = self.make_dot_file()
+            else:
+                self.console_dot_commands = self.make_dot_shards()
+
+    def write_IR(self, output_path: Path):
+        """
+        Saves the CFG and the data references in the binary IR format (see PAC_IR_reader)\n
+        :param output_path: the path of the IR file
+        :return: None
+        """
+        writer = PAC_IR_writer()
+        writer.reset(self.code, {
+            start: (block.size, list(block.references_from)) for start, block in self.data.data_blocks.items()
+        })
+        writer.write_to_file(output_path)
+
+    def update_data_blocks(self, diff: PAC_entity_diff):
+        """
+        Updates the data blocks and their references after a part of the file has been reparsed\n
+        :param diff: the change notification from PAC_parser
+        :return: None
+        """
+        data = self.data
+        for location, entity in diff.removed.items():
+            if type(entity) is PAC_instruction:
+                for value in set(entity.get_used_0x1_values()).union(entity.get_used_4_byte_values()):
+                    if value in data.data_blocks:
+                        data.data_blocks[value].references_from.pop(location, None)
+            elif type(entity) is Memory_entity and location in data.data_blocks:
+                del data.data_blocks[location]
+
+        for location, entity in diff.added.items():
+            if type(entity) is PAC_instruction:
+                for value in set(entity.get_used_0x1_values()).union(entity.get_used_4_byte_values()):
+                    if value in data.data_blocks:
+                        data.data_blocks[value].references_from[location] = entity
+            elif self.file.raw_entities.get(location) is entity:
+                block = data.make_block(location, entity)
+                data.data_blocks[location] = block
+                # The references are already known from the stats
+                for table in (self.stats.use_0x1_values, self.stats.use_4_byte_values):
+                    block.references_from.update(table.get(location, {}))
+        data.block_start_offsets = sorted(data.data_blocks.keys())
+
+    def apply_entity_diff(self, diff: PAC_entity_diff) -> bool:
+        """
+        Updates the decompiled file after a part of it has been reparsed (see PAC_parser.patch)\n
+        Only the affected blocks, edges and SCCs are updated. Changing the labels, the runtime jumps,
+        the gates or the switch-case tables makes the decompiler start from scratch (without making the DOT file)\n
+        :param diff: the change notification from PAC_parser
+        :return: True if the update was incremental
+        """
+        if self.CFG_visitor is None:
+            # Nothing to update
+            return False
+
+        for location, entity in diff.removed.items():
+            if type(entity) is PAC_instruction:
+                self.stats.remove_instruction(location, entity)
+        for location, entity in diff.added.items():
+            if type(entity) is PAC_instruction:
+                self.stats.add_instruction(location, entity)
+
+        self.dataflow = None
+        self.ssa = None
+        cfg_diff = self.code.apply_entity_diff(diff)
+        if cfg_diff is None:
+            if self.settings.verbose_level <= 2:
+                print("The change affects the whole file, decompiling it again...")
+            self.code.reset(self.file)
+            self.data.reset(self.file)
+            self.functions.reset(self.file)
+            self.make_IR()
+            self.analyze_data()
+            self.study_CFG()
+            self.create_functions()
+            return False
+
+        self.update_data_blocks(diff)
+        self.CFG_visitor.apply_cfg_diff(cfg_diff)
+        self.examine_loop_entrypoints(self.CFG_visitor)
+        # The function boundaries depend on the edges all over the file => rebuild them when they are needed
+        self.functions.reset(self.file)
+        self.functions.is_outdated = True
+        return True
 
     def draw_reachable(self, offsets: Set[int], *, name: str = "", maxdepth: int = -1):
         self.CFG_visitor.find_reachable_from(list(offsets), maxdepth=maxdepth)
@@ -1068,3 +2177,22 @@ class PAC_Decompiler:
             self.settings.dot_settings,
             print_reached()
         )
+
+    def draw_path(self, source_offset: int, destination_offset: int, *, name: str = "",
+                  edge_kinds: Optional[Set[str]] = None):
+        """
+        Draws the shortest path between two blocks, nothing is drawn if there's no path\n
+        :return: the dot command or None
+        """
+        path = self.CFG_visitor.get_path(source_offset, destination_offset, edge_kinds)
+        if path is None:
+            return None
+        self.CFG_visitor.color = [0] * self.CFG_visitor.size
+        for offset in path:
+            self.CFG_visitor.color[self.CFG_visitor.offset_to_index[offset]] = 1
+        return self.CFG_visitor.make_dot_file(
+            self.settings.default_dot_name_suffix if not name else name,
+            Path(self.settings.SVG_path),
+            self.settings.dot_settings,
+            print_reached()
+        )
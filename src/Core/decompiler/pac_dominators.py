@@ -0,0 +1,97 @@
+
+from typing import Callable, Iterable, List, Set
+
+
+class PAC_DominatorTree:
+    """
+    The dominator tree found by the iterative algorithm of Cooper, Harvey and Kennedy over the reverse postorder\n
+    A virtual root precedes the vertices the DFS starts from, so the vertices that aren't reachable from the given
+    roots get dominators as well (the virtual root is the vertex number size)
+    """
+    def __init__(self, size: int, get_successors: Callable[[int], List[int]],
+                 get_predecessors: Callable[[int], List[int]], roots: Iterable[int]):
+        """
+        :param size: the number of the vertices
+        :param get_successors: vertex -> the vertices its edges lead to
+        :param get_predecessors: vertex -> the vertices whose edges lead to it
+        :param roots: the vertices to start the DFS from (the rest of the vertices become roots later)
+        """
+        self.size = size
+        self.root = size
+        self.get_predecessors = get_predecessors
+        self.dfs_roots: Set[int] = set()
+
+        # The reverse postorder, the virtual root goes first
+        visited = [False] * size
+        postorder: List[int] = []
+        for root in list(roots) + list(range(size)):
+            if visited[root]:
+                continue
+            visited[root] = True
+            self.dfs_roots.add(root)
+            work = [(root, iter(get_successors(root)))]
+            while work:
+                v, successors = work[-1]
+                for to in successors:
+                    if not visited[to]:
+                        visited[to] = True
+                        work.append((to, iter(get_successors(to))))
+                        break
+                else:
+                    work.pop()
+                    postorder.append(v)
+        postorder.append(self.root)
+        self.order: List[int] = postorder[::-1]
+        self.order_index: List[int] = [0] * (size + 1)
+        for i, v in enumerate(self.order):
+            self.order_index[v] = i
+
+        self.idom: List[int] = [-1] * (size + 1)
+        self.idom[self.root] = self.root
+        order_index, idom = self.order_index, self.idom
+
+        def intersect(a: int, b: int) -> int:
+            while a != b:
+                while order_index[a] > order_index[b]:
+                    a = idom[a]
+                while order_index[b] > order_index[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for v in self.order[1:]:
+                new_idom = self.root if v in self.dfs_roots else -1
+                for p in get_predecessors(v):
+                    if idom[p] == -1:
+                        continue
+                    new_idom = p if new_idom == -1 else intersect(p, new_idom)
+                if idom[v] != new_idom:
+                    idom[v] = new_idom
+                    changed = True
+
+        self.children: List[List[int]] = [[] for _ in range(size + 1)]
+        for v in self.order[1:]:
+            self.children[idom[v]].append(v)
+
+    def dominates(self, a: int, b: int) -> bool:
+        """
+        :return: True if every path from the roots to b goes through a (a vertex dominates itself)
+        """
+        while self.order_index[b] > self.order_index[a]:
+            b = self.idom[b]
+        return a == b
+
+    def get_frontiers(self) -> List[List[int]]:
+        """
+        :return: vertex -> its dominance frontier (the vertices where its dominance ends)
+        """
+        frontiers: List[Set[int]] = [set() for _ in range(self.size)]
+        for v in range(self.size):
+            for p in self.get_predecessors(v):
+                runner = p
+                while runner != self.idom[v]:
+                    frontiers[runner].add(v)
+                    runner = self.idom[runner]
+        return [sorted(frontier) for frontier in frontiers]
@@ -0,0 +1,73 @@
+
+from typing import Dict, Optional, TextIO
+import re
+
+
+DOT_ID_RE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*|-?(?:\.\d+|\d+(?:\.\d*)?)")
+DOT_KEYWORDS = {"node", "edge", "graph", "digraph", "subgraph", "strict"}
+
+
+def quote_dot_id(identifier: str) -> str:
+    """
+    Quotes the identifier the same way the graphviz package does it\n
+    :param identifier: a node name, an attribute name or value, etc.
+    :return: the identifier ready to be written into a DOT file
+    """
+    if DOT_ID_RE.fullmatch(identifier) and identifier.lower() not in DOT_KEYWORDS:
+        return identifier
+    return "\"" + identifier.replace("\"", "\\\"") + "\""
+
+
+def format_dot_attributes(attributes: Dict[str, Optional[str]]) -> str:
+    return " ".join(
+        f"{quote_dot_id(name)}={quote_dot_id(value)}" for name, value in attributes.items() if value is not None
+    )
+
+
+class PAC_DotWriter:
+    """
+    Writes a DOT graph straight into a text stream, so the graph never has to be kept in memory\n
+    The output mirrors the source that graphviz.Digraph would produce for the same calls
+    """
+    def __init__(self, output: TextIO):
+        self.output = output
+        self.indent = ""
+
+    def write_statement(self, statement: str, attributes: Optional[Dict[str, Optional[str]]] = None):
+        if attributes:
+            statement += f" [{format_dot_attributes(attributes)}]"
+        self.output.write(f"{self.indent}{statement}\n")
+
+    def write_default_attributes(self, graph_attr: Optional[Dict[str, str]], node_attr: Optional[Dict[str, str]],
+                                 edge_attr: Optional[Dict[str, str]]):
+        for kind, attributes in (("graph", graph_attr), ("node", node_attr), ("edge", edge_attr)):
+            if attributes:
+                self.write_statement(kind, dict(sorted(attributes.items())))
+
+    def begin_graph(self, graph_attr: Optional[Dict[str, str]] = None, node_attr: Optional[Dict[str, str]] = None,
+                    edge_attr: Optional[Dict[str, str]] = None):
+        self.output.write("digraph {\n")
+        self.indent = "\t"
+        self.write_default_attributes(graph_attr, node_attr, edge_attr)
+
+    def end_graph(self):
+        self.indent = ""
+        self.output.write("}\n")
+
+    def begin_subgraph(self, name: str, graph_attr: Optional[Dict[str, str]] = None,
+                       node_attr: Optional[Dict[str, str]] = None, edge_attr: Optional[Dict[str, str]] = None):
+        self.output.write(f"{self.indent}subgraph {quote_dot_id(name)} {{\n")
+        self.indent += "\t"
+        self.write_default_attributes(graph_attr, node_attr, edge_attr)
+
+    def end_subgraph(self):
+        self.indent = self.indent[:-1]
+        self.output.write(f"{self.indent}}}\n")
+
+    def node(self, name: str, label: Optional[str] = None, **attributes: Optional[str]):
+        if label is not None:
+            attributes = {"label": label, **attributes}
+        self.write_statement(quote_dot_id(name), attributes)
+
+    def edge(self, tail: str, head: str, **attributes: Optional[str]):
+        self.write_statement(f"{quote_dot_id(tail)} -> {quote_dot_id(head)}", attributes)
@@ -0,0 +1,342 @@
+
+from typing import NamedTuple, List, Dict, Optional, Sequence, Tuple
+from Core.decompiler.code_blocs.base_pac_code_blocks import (
+    PAC_transition, PAC_Edge
+)
+from Core.decompiler.code_blocs.pac_code_blocks import (
+    PAC_CodeBlocks
+)
+from pathlib import Path
+from array import array
+from bisect import bisect_right
+import mmap
+import struct
+import sys
+import zlib
+
+
+# The file starts with the header, then goes the section directory (offset, record count and record size
+# measured in uint32_t for every section), then the sections themselves. Every record is a tuple of uint32_t
+IR_MAGIC = b"PACIR\x00"
+IR_VERSION = 1
+IR_HEADER = struct.Struct("<6sHIIII")  # magic, version, flags, PAC file size, PAC file crc32, sections count
+IR_FLAG_INCLUDE_CALLBACKS = 1
+
+# Sections
+IR_BLOCKS = 0  # start, size, exit position, first instruction, instructions count, first entry point,
+#                entry points count, first outgoing edge, outgoing edges count, flags
+IR_BLOCK_STARTS = 1  # start (a copy of the first column of IR_BLOCKS for the binary search)
+IR_ENTRY_POINTS = 2  # position, block index, first incoming edge, incoming edges count
+IR_EDGES = 3  # exit block index, exit position, entry block index, entry position, PAC_transition flags
+IR_INCOMING_EDGES = 4  # edge index (grouped by entry points)
+IR_INSTRUCTIONS = 5  # offset, signature
+IR_SPLIT_CHAINS = 6  # block start, first chain item, chain items count
+IR_SPLIT_CHAIN_ITEMS = 7  # block start
+IR_CALLBACK_DESTINATIONS = 8  # callback location, destination
+IR_DATA_BLOCKS = 9  # start, size, first reference, references count
+IR_DATA_REFERENCES = 10  # the location of the referencing instruction
+IR_SECTIONS_COUNT = 11
+
+IR_RECORD_SIZES = (10, 1, 4, 5, 1, 2, 3, 1, 2, 4, 1)
+
+# Block flags
+IR_BLOCK_SPLIT = 1
+IR_BLOCK_SOURCE = 2
+IR_BLOCK_DUMMY = 4
+
+
+def transition_to_flags(transition: PAC_transition) -> int:
+    flags = 0
+    for i, value in enumerate(transition):
+        if value:
+            flags |= 1 << i
+    return flags
+
+
+def flags_to_transition(flags: int) -> PAC_transition:
+    return PAC_transition(*[(flags >> i) & 1 == 1 for i in range(len(PAC_transition._fields))])
+
+
+class PAC_IR_block(NamedTuple):
+    index: int
+    start: int
+    size: int
+    exit_position: int
+    is_split: bool
+    is_source: bool
+    is_dummy: bool
+
+
+class PAC_IR_edge(NamedTuple):
+    exit_block: int
+    exit_position: int
+    entry_block: int
+    entry_position: int
+    properties: PAC_transition
+
+
+class PAC_IR_data_block(NamedTuple):
+    start: int
+    size: int
+    references_from: List[int]
+
+
+class PAC_IR_writer:
+    """
+    Serializes the CFG of a decompiled PAC file (and the references to its data blocks) into the binary IR
+    """
+    def __init__(self):
+        self.code: PAC_CodeBlocks = PAC_CodeBlocks()
+        self.data_references: Dict[int, Tuple[int, Sequence[int]]] = {}
+
+    def reset(self, code: PAC_CodeBlocks, data_references: Dict[int, Tuple[int, Sequence[int]]]):
+        """
+        :param code: the code blocks after the entrypoints normalization
+        :param data_references: data block start -> (data block size, the locations of the referencing instructions)
+        :return: None
+        """
+        self.code = code
+        self.data_references = data_references
+
+    def make_sections(self) -> List[List[int]]:
+        code = self.code
+        sections: List[List[int]] = [[] for _ in range(IR_SECTIONS_COUNT)]
+        blocks, block_starts, entry_points, edges, incoming, instructions = sections[IR_BLOCKS:IR_SPLIT_CHAINS]
+
+        offset_to_index = {offset: index for index, offset in enumerate(code.code_blocks)}
+        edge_to_index: Dict[int, int] = {}
+        entry_points_count = 0
+        for offset, block in code.code_blocks.items():
+            flags = (
+                (IR_BLOCK_SPLIT if block.is_split else 0) |
+                (IR_BLOCK_SOURCE if block.is_source else 0) |
+                (IR_BLOCK_DUMMY if block.is_dummy else 0)
+            )
+            outgoing = block.exit_point.where_to
+            blocks += (
+                offset, block.size, block.exit_point.position,
+                len(instructions) // 2, len(block.instructions),
+                entry_points_count, len(block.entry_points),
+                len(edges) // 5, len(outgoing),
+                flags
+            )
+            block_starts.append(offset)
+            entry_points_count += len(block.entry_points)
+            for location, instruction in block.instructions.items():
+                instructions += (location, instruction.signature)
+            for edge in outgoing:
+                edge_to_index[id(edge)] = len(edges) // 5
+                edges += (
+                    offset_to_index[edge.exit.code_block.start], edge.exit.position,
+                    offset_to_index[edge.entry.code_block.start], edge.entry.position,
+                    transition_to_flags(edge.properties)
+                )
+
+        # The incoming edges can only be enumerated once every outgoing edge has its index
+        for index, block in enumerate(code.code_blocks.values()):
+            for position, entry_point in block.entry_points.items():
+                entry_points += (position, index, len(incoming), len(entry_point.where_from))
+                incoming += (edge_to_index[id(edge)] for edge in entry_point.where_from)
+
+        for offset, chain in sorted(code.split_blocks.items()):
+            sections[IR_SPLIT_CHAINS] += (offset, len(sections[IR_SPLIT_CHAIN_ITEMS]), len(chain))
+            sections[IR_SPLIT_CHAIN_ITEMS] += chain
+        for location, destination in sorted(code.callback_destinations.items()):
+            sections[IR_CALLBACK_DESTINATIONS] += (location, destination)
+        for start, (size, references) in sorted(self.data_references.items()):
+            sections[IR_DATA_BLOCKS] += (start, size, len(sections[IR_DATA_REFERENCES]), len(references))
+            sections[IR_DATA_REFERENCES] += sorted(references)
+
+        return sections
+
+    def to_bytes(self) -> bytes:
+        sections = self.make_sections()
+        flags = IR_FLAG_INCLUDE_CALLBACKS if self.code.include_callbacks else 0
+        header = IR_HEADER.pack(
+            IR_MAGIC, IR_VERSION, flags, self.code.file.size, zlib.crc32(self.code.file.raw_data), IR_SECTIONS_COUNT
+        )
+
+        directory = array("I")
+        payload: List[bytes] = []
+        offset = len(header) + 4 * 3 * IR_SECTIONS_COUNT
+        for values, record_size in zip(sections, IR_RECORD_SIZES):
+            table = array("I", values)
+            if sys.byteorder != "little":
+                table.byteswap()
+            directory.extend((offset, len(values) // record_size, record_size))
+            payload.append(table.tobytes())
+            offset += len(payload[-1])
+        if sys.byteorder != "little":
+            directory.byteswap()
+
+        return b"".join([header, directory.tobytes()] + payload)
+
+    def write_to_file(self, output_path: Path):
+        with open(output_path, "wb") as output:
+            output.write(self.to_bytes())
+
+
+class PAC_IR_reader:
+    """
+    Reads the binary IR lazily: the file is mapped into memory and the records are only decoded on request
+    """
+    def __init__(self, path: Path):
+        self.source = open(path, "rb")
+        try:
+            self.buffer = mmap.mmap(self.source.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            self.source.close()
+            raise ValueError(f"{path} is not a PAC IR file")
+
+        if len(self.buffer) < IR_HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a PAC IR file")
+        magic, version, flags, self.file_size, self.file_crc32, sections_count = IR_HEADER.unpack_from(self.buffer)
+        if magic != IR_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a PAC IR file")
+        if version != IR_VERSION or sections_count != IR_SECTIONS_COUNT:
+            self.close()
+            raise ValueError(f"Unsupported PAC IR version {version} ({path})")
+        self.version: int = version
+        self.include_callbacks: bool = flags & IR_FLAG_INCLUDE_CALLBACKS != 0
+
+        self.sections: List[Sequence[int]] = []
+        self.counts: List[int] = []
+        directory = struct.unpack_from(f"<{3 * sections_count}I", self.buffer, IR_HEADER.size)
+        for i in range(sections_count):
+            offset, count, record_size = directory[3 * i:3 * i + 3]
+            self.sections.append(self.get_table(offset, count * record_size))
+            self.counts.append(count)
+
+    def get_table(self, offset: int, length: int) -> Sequence[int]:
+        if sys.byteorder == "little":
+            return memoryview(self.buffer)[offset:offset + 4 * length].cast("I")
+        table = array("I", self.buffer[offset:offset + 4 * length])
+        table.byteswap()
+        return table
+
+    def close(self):
+        # The views must be released before the map can be closed
+        for section in getattr(self, "sections", []):
+            if isinstance(section, memoryview):
+                section.release()
+        self.sections = []
+        self.buffer.close()
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def is_up_to_date(self, raw_data: bytes) -> bool:
+        """
+        :param raw_data: the contents of the PAC file
+        :return: True if the IR was made from this exact file
+        """
+        return len(raw_data) == self.file_size and zlib.crc32(raw_data) == self.file_crc32
+
+    @property
+    def block_count(self) -> int:
+        return self.counts[IR_BLOCKS]
+
+    @property
+    def edge_count(self) -> int:
+        return self.counts[IR_EDGES]
+
+    def get_record(self, section: int, index: int) -> Sequence[int]:
+        if not 0 <= index < self.counts[section]:
+            raise IndexError(f"Record index {index} is out of range")
+        size = IR_RECORD_SIZES[section]
+        return self.sections[section][size * index:size * (index + 1)]
+
+    def get_block(self, index: int) -> PAC_IR_block:
+        start, size, exit_position, *_, flags = self.get_record(IR_BLOCKS, index)
+        return PAC_IR_block(
+            index, start, size, exit_position,
+            flags & IR_BLOCK_SPLIT != 0, flags & IR_BLOCK_SOURCE != 0, flags & IR_BLOCK_DUMMY != 0
+        )
+
+    def get_block_index(self, offset: int) -> int:
+        """
+        :param offset: a PAC file offset
+        :return: the index of the block that contains the offset or -1 if there is none
+        """
+        index = bisect_right(self.sections[IR_BLOCK_STARTS], offset) - 1
+        if index == -1:
+            return -1
+        start, size = self.get_record(IR_BLOCKS, index)[0:2]
+        return index if offset < start + size else -1
+
+    def get_block_by_offset(self, offset: int) -> Optional[PAC_IR_block]:
+        index = self.get_block_index(offset)
+        return self.get_block(index) if index != -1 else None
+
+    def get_instructions(self, index: int) -> List[Tuple[int, int]]:
+        """
+        :param index: the block index
+        :return: the list of (offset, signature) pairs
+        """
+        first, count = self.get_record(IR_BLOCKS, index)[3:5]
+        table = self.sections[IR_INSTRUCTIONS][2 * first:2 * (first + count)]
+        return list(zip(table[0::2], table[1::2]))
+
+    def get_entry_points(self, index: int) -> List[int]:
+        first, count = self.get_record(IR_BLOCKS, index)[5:7]
+        return list(self.sections[IR_ENTRY_POINTS][4 * first:4 * (first + count):4])
+
+    def get_edge(self, index: int) -> PAC_IR_edge:
+        exit_block, exit_position, entry_block, entry_position, flags = self.get_record(IR_EDGES, index)
+        return PAC_IR_edge(exit_block, exit_position, entry_block, entry_position, flags_to_transition(flags))
+
+    def get_outgoing(self, index: int) -> List[PAC_IR_edge]:
+        first, count = self.get_record(IR_BLOCKS, index)[7:9]
+        return [self.get_edge(i) for i in range(first, first + count)]
+
+    def get_incoming(self, index: int) -> List[PAC_IR_edge]:
+        first_entry, entries_count = self.get_record(IR_BLOCKS, index)[5:7]
+        edges: List[PAC_IR_edge] = []
+        for entry in range(first_entry, first_entry + entries_count):
+            first, count = self.get_record(IR_ENTRY_POINTS, entry)[2:4]
+            edges += [self.get_edge(i) for i in self.sections[IR_INCOMING_EDGES][first:first + count]]
+        return edges
+
+    def get_successors(self, index: int) -> List[int]:
+        first, count = self.get_record(IR_BLOCKS, index)[7:9]
+        return list(self.sections[IR_EDGES][5 * first + 2:5 * (first + count):5])
+
+    def find_record(self, section: int, key: int) -> int:
+        """
+        :param section: a section sorted by the first column
+        :param key: the value of the first column
+        :return: the index of the record or -1 if there is none
+        """
+        size = IR_RECORD_SIZES[section]
+        keys = self.sections[section][0::size]
+        index = bisect_right(keys, key) - 1
+        return index if index != -1 and keys[index] == key else -1
+
+    def get_split_chain(self, offset: int) -> List[int]:
+        """
+        :param offset: the start of a block that was split during the normalization
+        :return: the starts of the blocks it was split into (empty if it wasn't split)
+        """
+        index = self.find_record(IR_SPLIT_CHAINS, offset)
+        if index == -1:
+            return []
+        first, count = self.get_record(IR_SPLIT_CHAINS, index)[1:3]
+        return list(self.sections[IR_SPLIT_CHAIN_ITEMS][first:first + count])
+
+    def get_callback_destination(self, location: int) -> Optional[int]:
+        index = self.find_record(IR_CALLBACK_DESTINATIONS, location)
+        return self.get_record(IR_CALLBACK_DESTINATIONS, index)[1] if index != -1 else None
+
+    def get_data_block(self, start: int) -> Optional[PAC_IR_data_block]:
+        index = self.find_record(IR_DATA_BLOCKS, start)
+        if index == -1:
+            return None
+        start, size, first, count = self.get_record(IR_DATA_BLOCKS, index)
+        return PAC_IR_data_block(start, size, list(self.sections[IR_DATA_REFERENCES][first:first + count]))
@@ -0,0 +1,168 @@
+
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class PAC_Loop:
+    def __init__(self, header: int):
+        self.header: int = header
+        self.blocks: List[int] = [header]  # the vertices that belong to no inner loop, the header goes first
+        self.children: List[PAC_Loop] = []
+        self.parent: Optional[PAC_Loop] = None
+        self.depth: int = 1  # the top-level loops have the depth of 1
+        self.is_reducible: bool = True
+        self.back_edges: List[Tuple[int, int]] = []  # (the latch, the header)
+
+    def __repr__(self):
+        kind = "reducible" if self.is_reducible else "irreducible"
+        return f"Loop {self.header} ({kind}, depth = {self.depth}, blocks = {len(self.blocks)})"
+
+    def get_all_blocks(self) -> List[int]:
+        """
+        :return: the vertices of the loop, the ones of the inner loops included
+        """
+        res = []
+        loops = [self]
+        while loops:
+            loop = loops.pop()
+            res.extend(loop.blocks)
+            loops.extend(loop.children)
+        return res
+
+
+class PAC_LoopForest:
+    """
+    The loop nesting forest found by Havlak's algorithm (with Ramalingam's fix for the irreducible loops):
+    a DFS numbers the vertices, then the headers are processed from the last one to the first and every loop
+    is collapsed into its header with a union-find, so the inner loops are found first\n
+    It takes O(E * a(V)), the loop of an irreducible region is headed by the vertex the DFS entered it through
+    """
+    def __init__(self, size: int, get_successors: Callable[[int], List[int]],
+                 get_predecessors: Callable[[int], List[int]], roots: Iterable[int]):
+        """
+        :param size: the number of the vertices
+        :param get_successors: vertex -> the vertices its edges lead to
+        :param get_predecessors: vertex -> the vertices whose edges lead to it
+        :param roots: the vertices to start the DFS from (the rest of the vertices become roots later)
+        """
+        self.size = size
+        self.loops: List[PAC_Loop] = []  # the inner loops go first
+        self.top_level: List[PAC_Loop] = []
+        self.loop_of: List[Optional[PAC_Loop]] = [None] * size  # vertex -> the innermost loop that contains it
+        self.header_to_loop: Dict[int, PAC_Loop] = {}
+
+        # Step 1: the DFS preorder numbers and the last number in every subtree
+        number = [-1] * size
+        last = [-1] * size
+        order: List[int] = []
+        for root in list(roots) + list(range(size)):
+            if number[root] != -1:
+                continue
+            number[root] = len(order)
+            order.append(root)
+            work = [(root, iter(get_successors(root)))]
+            while work:
+                v, successors = work[-1]
+                for to in successors:
+                    if number[to] == -1:
+                        number[to] = len(order)
+                        order.append(to)
+                        work.append((to, iter(get_successors(to))))
+                        break
+                else:
+                    work.pop()
+                    last[number[v]] = len(order) - 1
+
+        # Everything below works with the preorder numbers
+        def is_ancestor(w: int, v: int) -> bool:
+            return w <= v <= last[w]
+
+        # Step 2: the back edges come from the descendants
+        back_predecessors: List[List[int]] = [[] for _ in range(size)]
+        other_predecessors: List[Set[int]] = [set() for _ in range(size)]
+        for w, vertex in enumerate(order):
+            for predecessor in get_predecessors(vertex):
+                v = number[predecessor]
+                if is_ancestor(w, v):
+                    back_predecessors[w].append(v)
+                else:
+                    other_predecessors[w].add(v)
+
+        union_find = list(range(size))
+
+        def find(v: int) -> int:
+            root = v
+            while union_find[root] != root:
+                root = union_find[root]
+            while union_find[v] != root:
+                union_find[v], v = root, union_find[v]
+            return root
+
+        # Step 3: collapse the loops from the innermost ones
+        loop_by_number: Dict[int, PAC_Loop] = {}
+        for w in reversed(range(size)):
+            if not back_predecessors[w]:
+                continue
+            loop = PAC_Loop(order[w])
+            body: List[int] = []
+            in_body: Set[int] = set()
+            for v in back_predecessors[w]:
+                loop.back_edges.append((order[v], order[w]))
+                if v != w:
+                    representative = find(v)
+                    if representative not in in_body:
+                        in_body.add(representative)
+                        body.append(representative)
+
+            worklist = list(body)
+            while worklist:
+                x = worklist.pop()
+                for y in list(other_predecessors[x]):
+                    representative = find(y)
+                    if not is_ancestor(w, representative):
+                        # The loop is entered bypassing the header
+                        loop.is_reducible = False
+                        other_predecessors[w].add(representative)
+                    elif representative != w and representative not in in_body:
+                        in_body.add(representative)
+                        body.append(representative)
+                        worklist.append(representative)
+
+            for x in body:
+                union_find[x] = w
+                inner = loop_by_number.get(x)
+                if inner is not None:
+                    inner.parent = loop
+                    loop.children.append(inner)
+                else:
+                    loop.blocks.append(order[x])
+            loop.back_edges.sort()
+            loop_by_number[w] = loop
+            self.loops.append(loop)
+
+        # Step 4: the depths and the innermost loops of the vertices (the outer loops go first)
+        for loop in reversed(self.loops):
+            self.header_to_loop[loop.header] = loop
+            if loop.parent is None:
+                self.top_level.append(loop)
+            else:
+                loop.depth = loop.parent.depth + 1
+            loop.children.sort(key=lambda child: child.header)
+            for v in loop.blocks:
+                self.loop_of[v] = loop
+        self.top_level.sort(key=lambda top: top.header)
+
+    def get_depth(self, vertex: int) -> int:
+        """
+        :return: the number of the loops that contain the vertex
+        """
+        loop = self.loop_of[vertex]
+        return loop.depth if loop is not None else 0
+
+    def is_header(self, vertex: int) -> bool:
+        return vertex in self.header_to_loop
+
+    def get_back_edges(self) -> List[Tuple[int, int]]:
+        return sorted(edge for loop in self.loops for edge in loop.back_edges)
+
+    def get_irreducible_loops(self) -> List[PAC_Loop]:
+        return [loop for loop in reversed(self.loops) if not loop.is_reducible]
@@ -0,0 +1,91 @@
+
+from Core.decompiler.pac_corpus_batch import (
+    PAC_corpus, PAC_CorpusWorker, PAC_CorpusBatch
+)
+from Core.decompiler.pac_structurer import (
+    PAC_Structurer, PAC_PseudocodeSettings
+)
+
+from pathlib import Path
+from typing import NamedTuple, Dict, List, Optional, Any
+import time
+
+
+class PAC_pseudocode_report(NamedTuple):
+    name: str
+    functions: int
+    blocks: int
+    gotos: int
+    decompile_time: float
+    structure_time: float
+    error: Optional[str] = None
+
+
+class PAC_PseudocodeWorker(PAC_CorpusWorker):
+    """
+    Decompiles the files and writes their pseudocode, one worker lives in every process of the pool
+    """
+    def __init__(self, corpus: PAC_corpus, save_to: Path, settings: PAC_PseudocodeSettings):
+        super().__init__((corpus,))
+        self.save_to = save_to
+        self.settings = settings
+
+    def write_pseudocode(self, path: Path) -> PAC_pseudocode_report:
+        try:
+            start = time.perf_counter()
+            decompiler = self.decompile(path)
+            decompiled = time.perf_counter()
+
+            structurer = PAC_Structurer(decompiler, self.settings)
+            with open(self.save_to / f"{path.stem}.txt", "w", encoding="utf-8") as output:
+                gotos = structurer.write_pseudocode(output)
+            structured = time.perf_counter()
+        except Exception as e:
+            return PAC_pseudocode_report(path.name, 0, 0, 0, 0.0, 0.0, repr(e))
+
+        return PAC_pseudocode_report(
+            path.name, len(structurer.functions), len(decompiler.code.code_blocks), gotos,
+            decompiled - start, structured - decompiled
+        )
+
+
+class PAC_PseudocodeBatch(PAC_CorpusBatch):
+    """
+    Writes the pseudocode of every file of the corpus to <name>.txt, the files are decompiled and structured
+    in the worker processes
+    """
+    def __init__(self, corpus: PAC_corpus, settings: Optional[PAC_PseudocodeSettings] = None,
+                 workers: Optional[int] = None):
+        super().__init__(workers)
+        self.corpus = corpus
+        self.settings = settings if settings is not None else PAC_PseudocodeSettings()
+
+    def describe(self, report: PAC_pseudocode_report) -> str:
+        status = report.error if report.error is not None else f"{report.gotos} gotos"
+        return f"{report.name}: {status}"
+
+    def summarize(self, reports: List[PAC_pseudocode_report], wall_time: float) -> Dict[str, Any]:
+        return {
+            "files": len(reports),
+            "failed": sum(report.error is not None for report in reports),
+            "functions": sum(report.functions for report in reports),
+            "gotos": sum(report.gotos for report in reports),
+            "wall_time": wall_time,
+            "file_time": sum(report.decompile_time + report.structure_time for report in reports),
+        }
+
+    def run(self, save_to: Path, report_path: Path) -> List[PAC_pseudocode_report]:
+        """
+        Writes the report as JSON Lines: a record per file in the order of completion, then a summary record\n
+        :param save_to: the directory for the pseudocode files
+        :param report_path: the path of the report file
+        :return: the reports sorted by the name
+        """
+        save_to.mkdir(parents=True, exist_ok=True)
+        paths = [path for path in sorted(self.corpus.directory.glob("*.pac")) if path.is_file()]
+        reports = self.run_in_pool(
+            report_path, "file", PAC_PseudocodeWorker, (self.corpus, save_to, self.settings),
+            "write_pseudocode", [(path,) for path in paths]
+        )
+        reports.sort(key=lambda r: r.name)
+        return reports
@@ -0,0 +1,93 @@
+
+from typing import Callable, Iterable, List
+
+
+def get_set_bits(mask: int) -> List[int]:
+    """
+    :param mask: a bitset
+    :return: the indices of the set bits in the increasing order
+    """
+    bits = bin(mask)[:1:-1]  # the least significant bit goes first
+    res = []
+    i = bits.find("1")
+    while i != -1:
+        res.append(i)
+        i = bits.find("1", i + 1)
+    return res
+
+
+class PAC_ReachabilityIndex:
+    """
+    The transitive closure of the CFG built over its SCC condensation: every component stores the bitsets
+    of the components it reaches and of the components that reach it\n
+    It's built once in O(V + E * C / 64), where C is the number of the components; then "is B reachable from A"
+    takes O(1) and the descendants / ancestors take O(C / 64 + output)\n
+    A vertex is considered reachable from itself
+    """
+    def __init__(self, size: int, get_successors: Callable[[int], List[int]], components: List[List[int]]):
+        """
+        :param size: the number of the vertices
+        :param get_successors: vertex -> the vertices its edges lead to
+        :param components: the SCCs in the reverse topological order (the order Tarjan's algorithm finds them in)
+        """
+        self.components = components
+        self.component_of: List[int] = [-1] * size
+        for c, vertices in enumerate(components):
+            for v in vertices:
+                self.component_of[v] = c
+
+        # The successors of a component were found before it
+        predecessors: List[List[int]] = [[] for _ in components]
+        self.descendants: List[int] = [0] * len(components)
+        for c, vertices in enumerate(components):
+            mask = 1 << c
+            for v in vertices:
+                for to in get_successors(v):
+                    d = self.component_of[to]
+                    if d != c and not mask >> d & 1:
+                        mask |= self.descendants[d]
+                        predecessors[d].append(c)
+            self.descendants[c] = mask
+
+        self.ancestors: List[int] = [0] * len(components)
+        for c in reversed(range(len(components))):
+            mask = 1 << c
+            for p in predecessors[c]:
+                mask |= self.ancestors[p]
+            self.ancestors[c] = mask
+
+    def is_reachable(self, source: int, destination: int) -> bool:
+        """
+        :param source: a vertex
+        :param destination: a vertex
+        :return: True if there's a path from the source to the destination
+        """
+        return bool(self.descendants[self.component_of[source]] >> self.component_of[destination] & 1)
+
+    def expand(self, mask: int) -> List[int]:
+        """
+        :param mask: a bitset of the components
+        :return: the vertices of these components
+        """
+        res = []
+        for c in get_set_bits(mask):
+            res.extend(self.components[c])
+        return res
+
+    def get_descendants(self, vertices: Iterable[int]) -> List[int]:
+        """
+        :return: the vertices reachable from any of the given ones
+        """
+        mask = 0
+        for v in vertices:
+            mask |= self.descendants[self.component_of[v]]
+        return self.expand(mask)
+
+    def get_ancestors(self, vertices: Iterable[int]) -> List[int]:
+        """
+        :return: the vertices that reach any of the given ones
+        """
+        mask = 0
+        for v in vertices:
+            mask |= self.ancestors[self.component_of[v]]
+        return self.expand(mask)
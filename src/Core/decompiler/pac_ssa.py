@@ -0,0 +1,231 @@
+
+from Core.decompiler.pac_dataflow import (
+    PAC_Dataflow, get_def_use
+)
+from Core.decompiler.pac_dominators import (
+    PAC_DominatorTree
+)
+from Core.PAC.pac_file import (
+    PAC_variable
+)
+
+from typing import Dict, List, Tuple
+
+
+# IntLocal and FloatLocal
+LOCAL_VARIABLE_TYPE_PREFIXES = ("0x4 ", "0x20 ")
+
+# The kinds of the SSA definitions
+ENTRY_DEFINITION = 0  # the value a variable has before the code runs
+INSTRUCTION_DEFINITION = 1
+PHI_DEFINITION = 2
+
+
+def is_local_variable(variable: PAC_variable) -> bool:
+    return variable.type.startswith(LOCAL_VARIABLE_TYPE_PREFIXES)
+
+
+class PAC_SSA:
+    """
+    The SSA form of the local variables over the dataflow graph (see PAC_Dataflow): the phi functions are placed
+    on the iterated dominance frontiers of the definitions, only for the variables that are read before being
+    written in some block (semi-pruned SSA), then the uses are renamed in one walk over the dominator tree\n
+    The definitions and the uses are numbered, their properties are kept in flat lists and the def-use chains
+    are stored like a CSR matrix: the uses of the definition d are def_uses[def_uses_start[d]:def_uses_start[d + 1]]\n
+    Every variable has an entry definition, it reaches the uses that can be executed before any assignment
+    """
+    def __init__(self, dataflow: PAC_Dataflow):
+        self.dataflow = dataflow
+        code_blocks = dataflow.code.code_blocks
+        self.block_starts: List[int] = list(dataflow.order)
+        block_index = {start: i for i, start in enumerate(self.block_starts)}
+        self.successors: List[List[int]] = [
+            [block_index[to] for to in dataflow.successors[start]] for start in self.block_starts
+        ]
+        self.predecessors: List[List[int]] = [
+            [block_index[source] for source in dataflow.predecessors[start]] for start in self.block_starts
+        ]
+        roots = [i for i, predecessors in enumerate(self.predecessors) if not predecessors]
+        self.dominators = PAC_DominatorTree(
+            len(self.block_starts), self.successors.__getitem__, self.predecessors.__getitem__, roots
+        )
+
+        self.variables: List[PAC_variable] = []
+        self.variable_index: Dict[PAC_variable, int] = {}
+
+        # Definitions
+        self.def_variable: List[int] = []
+        self.def_kind: List[int] = []
+        self.def_location: List[int] = []  # the instruction offset, the block start for phi, -1 for entry
+        self.phi_arguments: Dict[int, List[int]] = {}  # phi -> the definitions, in the order of the predecessors
+        self.instruction_defs: Dict[Tuple[int, PAC_variable], int] = {}
+
+        # Uses
+        self.use_definition: List[int] = []
+        self.use_location: List[int] = []  # the instruction offset or -1 for the phi arguments
+        self.use_phi: List[int] = []  # the phi definition or -1 for the instructions
+        self.instruction_uses: Dict[Tuple[int, PAC_variable], int] = {}
+
+        # The def-use chains
+        self.def_uses_start: List[int] = []
+        self.def_uses: List[int] = []
+
+        # Block -> (location, the used variables, the defined variables) of the instructions with locals
+        accesses: List[List[Tuple[int, List[int], List[int]]]] = []
+        for start in self.block_starts:
+            block_accesses = []
+            for location, instruction in code_blocks[start].instructions.items():
+                defined, used = get_def_use(instruction)
+                used = [self.get_variable_index(v) for v in used if is_local_variable(v)]
+                defined = [self.get_variable_index(v) for v in defined if is_local_variable(v)]
+                if used or defined:
+                    block_accesses.append((location, used, defined))
+            accesses.append(block_accesses)
+
+        for v in range(len(self.variables)):
+            self.add_definition(v, ENTRY_DEFINITION, -1)
+
+        phis = self.place_phis(accesses)
+        self.rename(accesses, phis)
+        self.link_uses()
+
+    def get_variable_index(self, variable: PAC_variable) -> int:
+        index = self.variable_index.get(variable)
+        if index is None:
+            index = len(self.variables)
+            self.variable_index[variable] = index
+            self.variables.append(variable)
+        return index
+
+    def add_definition(self, variable: int, kind: int, location: int) -> int:
+        self.def_variable.append(variable)
+        self.def_kind.append(kind)
+        self.def_location.append(location)
+        return len(self.def_variable) - 1
+
+    def add_use(self, definition: int, location: int, phi: int):
+        self.use_definition.append(definition)
+        self.use_location.append(location)
+        self.use_phi.append(phi)
+
+    def place_phis(self, accesses: List[List[Tuple[int, List[int], List[int]]]]) -> List[List[int]]:
+        """
+        :return: block -> the variables that need a phi function there
+        """
+        size = len(self.block_starts)
+        defining_blocks: List[List[int]] = [[] for _ in self.variables]
+        is_global = [False] * len(self.variables)  # read before being written in some block
+        for block, block_accesses in enumerate(accesses):
+            written = set()
+            for _, used, defined in block_accesses:
+                for v in used:
+                    if v not in written:
+                        is_global[v] = True
+                for v in defined:
+                    if v not in written:
+                        written.add(v)
+                        defining_blocks[v].append(block)
+
+        frontiers = self.dominators.get_frontiers()
+        phis: List[List[int]] = [[] for _ in range(size)]
+        has_phi = [-1] * size  # the last variable that got a phi in the block
+        queued = [-1] * size
+        for v, blocks in enumerate(defining_blocks):
+            if not is_global[v]:
+                continue
+            for block in blocks:
+                queued[block] = v
+            worklist = list(blocks)
+            while worklist:
+                block = worklist.pop()
+                for frontier in frontiers[block]:
+                    if has_phi[frontier] == v:
+                        continue
+                    has_phi[frontier] = v
+                    phis[frontier].append(v)
+                    if queued[frontier] != v:
+                        queued[frontier] = v
+                        worklist.append(frontier)
+        return phis
+
+    def rename(self, accesses: List[List[Tuple[int, List[int], List[int]]]], phis: List[List[int]]):
+        stacks: List[List[int]] = [[v] for v in range(len(self.variables))]  # the entry definitions
+        block_phis: List[List[int]] = [[] for _ in self.block_starts]
+        for block, variables in enumerate(phis):
+            for v in variables:
+                phi = self.add_definition(v, PHI_DEFINITION, self.block_starts[block])
+                block_phis[block].append(phi)
+                self.phi_arguments[phi] = [-1] * len(self.predecessors[block])
+
+        work = [(child, False) for child in reversed(self.dominators.children[self.dominators.root])]
+        pushed: List[List[int]] = [[] for _ in self.block_starts]  # block -> the variables it pushed
+        while work:
+            block, is_leaving = work.pop()
+            if is_leaving:
+                for v in pushed[block]:
+                    stacks[v].pop()
+                continue
+
+            for phi in block_phis[block]:
+                v = self.def_variable[phi]
+                stacks[v].append(phi)
+                pushed[block].append(v)
+            for location, used, defined in accesses[block]:
+                for v in used:
+                    self.instruction_uses[(location, self.variables[v])] = len(self.use_definition)
+                    self.add_use(stacks[v][-1], location, -1)
+                for v in defined:
+                    definition = self.add_definition(v, INSTRUCTION_DEFINITION, location)
+                    self.instruction_defs[(location, self.variables[v])] = definition
+                    stacks[v].append(definition)
+                    pushed[block].append(v)
+
+            for successor in self.successors[block]:
+                for phi in block_phis[successor]:
+                    arguments = self.phi_arguments[phi]
+                    top = stacks[self.def_variable[phi]][-1]
+                    for i, predecessor in enumerate(self.predecessors[successor]):
+                        if predecessor == block:
+                            arguments[i] = top
+
+            work.append((block, True))
+            work.extend((child, False) for child in reversed(self.dominators.children[block]))
+
+        for phi, arguments in self.phi_arguments.items():
+            for definition in arguments:
+                self.add_use(definition, -1, phi)
+
+    def link_uses(self):
+        """
+        Builds the def-use chains from the use-def links with a counting sort
+        """
+        counts = [0] * (len(self.def_variable) + 1)
+        for definition in self.use_definition:
+            counts[definition + 1] += 1
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        self.def_uses_start = list(counts)
+        self.def_uses = [0] * len(self.use_definition)
+        for use, definition in enumerate(self.use_definition):
+            self.def_uses[counts[definition]] = use
+            counts[definition] += 1
+
+    def get_uses(self, definition: int) -> List[int]:
+        return self.def_uses[self.def_uses_start[definition]:self.def_uses_start[definition + 1]]
+
+    def get_reaching_definition(self, location: int, variable: PAC_variable) -> int:
+        """
+        :param location: the offset of an instruction that reads the variable
+        :param variable: a local variable
+        :return: the SSA definition the instruction reads
+        """
+        return self.use_definition[self.instruction_uses[(location, variable)]]
+
+    def get_dead_definitions(self) -> List[int]:
+        """
+        :return: the instruction definitions that no instruction or phi function reads
+        """
+        return [
+            definition for definition, kind in enumerate(self.def_kind)
+            if kind == INSTRUCTION_DEFINITION and self.def_uses_start[definition] == self.def_uses_start[definition + 1]
+        ]
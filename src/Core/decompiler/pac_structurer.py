@@ -0,0 +1,488 @@
+
+from Core.decompiler.pac_decompiler import (
+    PAC_Decompiler, PAC_Subroutine
+)
+from Core.decompiler.pac_dominators import (
+    PAC_DominatorTree
+)
+from Core.decompiler.pac_loops import (
+    PAC_LoopForest, PAC_Loop
+)
+from Core.PAC.pac_file import (
+    PAC_instruction, Switch_case_table
+)
+
+from typing import NamedTuple, Dict, List, Tuple, Optional, Set, TextIO
+
+
+# Instruction name -> the compound assignment it makes (the destination goes first)
+ASSIGNMENT_OPERATORS: Dict[str, str] = {
+    "cmd_mov": "=", "cmd_add": "+=", "cmd_sub": "-=", "cmd_mul": "*=", "cmd_div": "/=", "cmd_mod": "%=",
+    "cmd_iand": "&=", "cmd_ior": "|=", "cmd_ixor": "^=",
+}
+INCREMENT_OPERATORS: Dict[str, str] = {"cmd_inc": "++", "cmd_dec": "--"}
+# The suffix of cmd_ifXX / cmd_ifCallXX -> the operator of the condition
+CONDITION_OPERATORS: Dict[str, str] = {
+    "EQ": "==", "NE": "!=", "LSE": "<=", "LBE": ">=", "LS": "<", "LB": ">", "AND": "&", "OR": "|",
+}
+NEGATED_OPERATORS: Dict[str, str] = {"==": "!=", "!=": "==", "<=": ">", ">": "<=", ">=": "<", "<": ">="}
+# The prefixes of the resolved argument types -> the names of the variable arrays
+VARIABLE_ARRAYS: Dict[str, str] = {
+    "0x4 ": "IntLocal", "0x8 ": "IntGlobal", "0x20 ": "FloatLocal", "0x40 ": "FloatGlobal",
+}
+
+
+def get_goto_target(jump: str, v: int) -> Optional[int]:
+    return v if jump.startswith("goto ") else None
+
+
+class PAC_PseudocodeSettings(NamedTuple):
+    indent: str = "    "
+    max_nesting: int = 64  # the deeper constructs are replaced by goto
+    show_offsets: bool = False  # comment every statement with the offset of its instruction
+
+
+class PAC_LoopContext(NamedTuple):
+    header: int
+    body: Set[int]
+    exit: Optional[int]
+    latch: Optional[int]  # the latch whose condition closes a do-while loop
+    depth: int  # the nesting depth of the loop body
+    can_break: bool  # False within a switch: break would leave the switch instead of the loop
+
+
+class PAC_Structurer:
+    """
+    Turns the CFG of every function (see get_subroutines) into C-like pseudocode\n
+    The loops come from the loop nesting forest (the reducible ones become while / do-while loops), the follow
+    of an if / switch is the immediate post-dominator of its block, the rest of the control flow is expressed
+    with break, continue and goto. Every block is emitted once, so it takes O(E * a(V)) on top of
+    the dominator trees
+    """
+    def __init__(self, decompiler: PAC_Decompiler, settings: Optional[PAC_PseudocodeSettings] = None):
+        self.decompiler = decompiler
+        self.code = decompiler.code
+        self.settings = settings if settings is not None else PAC_PseudocodeSettings()
+        self.functions: Dict[int, PAC_Subroutine] = decompiler.get_functions()
+        self.block_to_function: Dict[int, int] = decompiler.functions.block_to_function
+
+        # The structure of the current function
+        self.blocks: List[int] = []  # vertex -> the start of the CFG block
+        self.vertex_of: Dict[int, int] = {}
+        self.successors: List[List[int]] = []  # the other functions' offsets are encoded as -1 - offset
+        self.predecessors: List[List[int]] = []
+        self.post_dominators: Optional[PAC_DominatorTree] = None
+        self.loops: Optional[PAC_LoopForest] = None
+        self.emitted: Set[int] = set()
+        self.entered_loops: Set[int] = set()
+        self.active_follows: Dict[int, int] = {}
+        self.pending: List[int] = []
+        self.closed_latches: Set[int] = set()
+        # (indent, text or None for a label, the vertex of the label or the goto target)
+        self.lines: List[Tuple[int, Optional[str], Optional[int]]] = []
+        self.gotos_count: int = 0
+
+    # Operands and statements
+
+    def get_pointer_name(self, offset: int) -> str:
+        return f"sub_{offset:X}" if offset in self.functions else f"label_{offset:X}"
+
+    def render_argument(self, param_type: str, value) -> str:
+        for prefix, array in VARIABLE_ARRAYS.items():
+            if param_type.startswith(prefix):
+                return f"{array}[{value}]"
+        if param_type.startswith("0x1"):
+            return f"&{self.get_pointer_name(value)}"
+        if param_type == "uint32_t_P":
+            return self.get_pointer_name(value)
+        if isinstance(value, str):
+            return "\"" + value.replace("\x00", "") + "\""
+        if isinstance(value, float):
+            return repr(value)
+        if param_type == "uint32_t":
+            return f"{value}"
+        return f"0x{value:X}" if isinstance(value, int) else f"{value}"
+
+    def render_arguments(self, instruction: PAC_instruction, skip: int = -1) -> List[str]:
+        return [
+            self.render_argument(param.type, value)
+            for index, (param, value) in enumerate(instruction.ordered_PAC_params) if index != skip
+        ]
+
+    def render_condition(self, instruction: PAC_instruction, negate: bool = False) -> str:
+        destination_index = self.code.cond_jump_instructions[instruction.signature]
+        arguments = self.render_arguments(instruction, destination_index)
+        name = instruction.name
+        suffix = name[len("cmd_ifCall"):] if name.startswith("cmd_ifCall") else name[len("cmd_if"):]
+        operator = CONDITION_OPERATORS.get(suffix) if name.startswith("cmd_if") else None
+        if operator is not None and len(arguments) == 2:
+            if negate and operator in NEGATED_OPERATORS:
+                return f"{arguments[0]} {NEGATED_OPERATORS[operator]} {arguments[1]}"
+            condition = f"{arguments[0]} {operator} {arguments[1]}"
+            return f"!({condition})" if negate else condition
+        condition = f"{name}({', '.join(arguments)})"
+        return f"!{condition}" if negate else condition
+
+    def render_statement(self, location: int, instruction: PAC_instruction) -> str:
+        name = instruction.name
+        signature = instruction.signature
+        arguments = self.render_arguments(instruction)
+        if name in ASSIGNMENT_OPERATORS and len(arguments) == 2:
+            return f"{arguments[0]} {ASSIGNMENT_OPERATORS[name]} {arguments[1]};"
+        if name in INCREMENT_OPERATORS and len(arguments) == 1:
+            return f"{arguments[0]}{INCREMENT_OPERATORS[name]};"
+        if signature == self.code.cmd_end:
+            return "return;"
+        if signature in self.code.saving_RA_instructions:
+            if signature in self.code.cond_jump_instructions:
+                # cmd_ifCallXX
+                destination = instruction.ordered_PAC_params[self.code.cond_jump_instructions[signature]][1]
+                return f"if ({self.render_condition(instruction)}) {self.get_pointer_name(destination)}();"
+            if signature in self.code.uncond_jump_instructions:
+                index = self.code.uncond_jump_instructions[signature]
+                if instruction.ordered_PAC_params[index][0].type == "uint32_t_P":
+                    destination = instruction.ordered_PAC_params[index][1]
+                    return f"{self.get_pointer_name(destination)}();"
+        return f"{name}({', '.join(arguments)});"
+
+    # Output
+
+    def emit(self, indent: int, text: str, location: int = -1, target: Optional[int] = None):
+        """
+        :param indent: the nesting level
+        :param text: the statement
+        :param location: the offset of the instruction the statement comes from
+        :param target: the vertex (or the encoded offset) if the statement ends with goto
+        """
+        if self.settings.show_offsets and location != -1:
+            text = f"{text}  // 0x{location:X}"
+        self.lines.append((indent, text, target))
+
+    def emit_label(self, indent: int, v: int):
+        self.lines.append((indent, None, v))
+
+    def get_jump(self, v: int, context: Optional[PAC_LoopContext]) -> Optional[str]:
+        """
+        :return: the statement that jumps to the vertex or None if the vertex should be emitted right here
+        """
+        if v < 0:
+            offset = -1 - v
+            if offset in self.functions:
+                return f"goto sub_{offset:X};"
+            return f"goto label_{offset:X};  // in sub_{self.block_to_function[offset]:X}"
+        if context is not None:
+            if v == context.header and v in self.emitted:
+                return "continue;"
+            if v == context.exit:
+                return "break;" if context.can_break else self.get_goto(v)
+            if v not in context.body:
+                return self.get_goto(v)
+        if v in self.emitted or v in self.active_follows:
+            return self.get_goto(v)
+        return None
+
+    def get_goto(self, v: int) -> str:
+        return f"goto label_{self.blocks[v]:X};"
+
+    # Structuring
+
+    def get_follow(self, v: int, context: Optional[PAC_LoopContext]) -> Optional[int]:
+        """
+        :return: the immediate post-dominator if the construct can fall into it
+        """
+        follow = self.post_dominators.idom[v]
+        if follow == self.post_dominators.root or follow in self.emitted:
+            return None
+        if context is not None and (follow not in context.body or follow == context.header):
+            return None
+        return follow
+
+    def emit_sequence(self, v: Optional[int], follow: Optional[int], context: Optional[PAC_LoopContext],
+                      depth: int):
+        while v is not None and v != follow:
+            jump = self.get_jump(v, context)
+            if jump is not None:
+                self.emit(depth, jump, target=get_goto_target(jump, v))
+                return
+            if depth > self.settings.max_nesting:
+                self.emit(depth, self.get_goto(v), target=v)
+                self.pending.append(v)
+                return
+
+            loop = self.loops.header_to_loop.get(v)
+            if loop is not None and loop.is_reducible and v not in self.entered_loops:
+                v = self.emit_loop(loop, context, depth)
+                continue
+
+            self.emitted.add(v)
+            self.emit_label(depth, v)
+            block = self.code.code_blocks[self.blocks[v]]
+            locations = block.instructions_offsets
+            last_location = locations[-1]
+            last = block.instructions[last_location]
+            is_terminator = (
+                last.signature in self.code.jumping_instructions and
+                last.signature not in self.code.saving_RA_instructions
+            )
+            for location in (locations[:-1] if is_terminator else locations):
+                self.emit(depth, self.render_statement(location, block.instructions[location]), location)
+
+            successors = self.successors[v]
+            if context is not None and v == context.latch and depth == context.depth:
+                # The condition closes the do-while loop
+                self.closed_latches.add(v)
+                return
+            if last.signature in self.code.cond_jump_instructions and is_terminator and len(successors) == 2:
+                v = self.emit_if(v, last_location, last, context, depth)
+            elif len(successors) > 1:
+                v = self.emit_switch(v, last_location, last, context, depth)
+            else:
+                if is_terminator and not successors:
+                    # An unresolved runtime jump
+                    self.emit(depth, self.render_statement(last_location, last), last_location)
+                v = successors[0] if successors else None
+
+    def get_branches(self, v: int, location: int, instruction: PAC_instruction) -> Tuple[int, int]:
+        """
+        :return: the vertices (or the encoded offsets) the branch goes to when the condition holds / fails
+        """
+        destination = instruction.ordered_PAC_params[self.code.cond_jump_instructions[instruction.signature]][1]
+        taken = fallthrough = None
+        for edge in self.code.code_blocks[self.blocks[v]].exit_point.where_to:
+            if edge.properties.fallthrough:
+                fallthrough = self.encode(edge.entry.code_block.start)
+            elif edge.entry.position == destination:
+                taken = self.encode(edge.entry.code_block.start)
+        if taken is None or fallthrough is None:
+            # Both edges lead to the same block
+            taken = fallthrough = self.successors[v][0]
+        return taken, fallthrough
+
+    def emit_if(self, v: int, location: int, instruction: PAC_instruction, context: Optional[PAC_LoopContext],
+                depth: int) -> Optional[int]:
+        taken, fallthrough = self.get_branches(v, location, instruction)
+        if taken == fallthrough:
+            return taken
+        follow = self.get_follow(v, context)
+        if follow is not None:
+            self.active_follows[follow] = self.active_follows.get(follow, 0) + 1
+
+        taken_jump = self.get_jump(taken, context) if taken != follow else None
+        fallthrough_jump = self.get_jump(fallthrough, context) if fallthrough != follow else None
+        if fallthrough == follow or taken_jump is not None and fallthrough_jump is None:
+            # if (condition) { taken }
+            if taken_jump is not None:
+                self.emit(
+                    depth, f"if ({self.render_condition(instruction)}) {taken_jump}", location,
+                    get_goto_target(taken_jump, taken)
+                )
+            else:
+                self.emit(depth, f"if ({self.render_condition(instruction)}) {{", location)
+                self.emit_sequence(taken, follow, context, depth + 1)
+                self.emit(depth, "}")
+            if fallthrough != follow:
+                self.release_follow(follow)
+                return fallthrough
+        elif taken == follow or fallthrough_jump is not None:
+            # if (!condition) { fallthrough }
+            if fallthrough_jump is not None:
+                self.emit(
+                    depth, f"if ({self.render_condition(instruction, True)}) {fallthrough_jump}", location,
+                    get_goto_target(fallthrough_jump, fallthrough)
+                )
+            else:
+                self.emit(depth, f"if ({self.render_condition(instruction, True)}) {{", location)
+                self.emit_sequence(fallthrough, follow, context, depth + 1)
+                self.emit(depth, "}")
+            if taken != follow:
+                self.release_follow(follow)
+                return taken
+        else:
+            self.emit(depth, f"if ({self.render_condition(instruction)}) {{", location)
+            self.emit_sequence(taken, follow, context, depth + 1)
+            self.emit(depth, "} else {")
+            self.emit_sequence(fallthrough, follow, context, depth + 1)
+            self.emit(depth, "}")
+        return self.release_follow(follow)
+
+    def release_follow(self, follow: Optional[int]) -> Optional[int]:
+        if follow is not None:
+            self.active_follows[follow] -= 1
+            if not self.active_follows[follow]:
+                del self.active_follows[follow]
+        return follow
+
+    def emit_switch(self, v: int, location: int, instruction: PAC_instruction, context: Optional[PAC_LoopContext],
+                    depth: int) -> Optional[int]:
+        cases: Dict[int, List[str]] = {}  # target -> its case labels
+        table = self.code.file.entities.get(location + instruction.size)
+        if instruction.signature == self.code.cmd_inxJmp and type(table) is Switch_case_table:
+            for index, branch in enumerate(table.branches):
+                target = self.encode_offset(branch)
+                if target is not None:
+                    cases.setdefault(target, []).append(f"case {index}:")
+        else:
+            # A runtime jump with the recovered destinations: the variable holds the offset
+            for target in self.successors[v]:
+                offset = self.blocks[target] if target >= 0 else -1 - target
+                cases.setdefault(target, []).append(f"case &{self.get_pointer_name(offset)}:")
+        variable = self.render_arguments(instruction)
+        follow = self.get_follow(v, context)
+        if follow is not None:
+            self.active_follows[follow] = self.active_follows.get(follow, 0) + 1
+
+        inner_context = context._replace(can_break=False) if context is not None else None
+        self.emit(depth, f"switch ({', '.join(variable)}) {{", location)
+        for target, labels in cases.items():
+            for label in labels:
+                self.emit(depth, label)
+            if target != follow:
+                self.emit_sequence(target, follow, inner_context, depth + 1)
+            if follow is not None:
+                self.emit(depth + 1, "break;")
+        self.emit(depth, "}")
+        return self.release_follow(follow)
+
+    def emit_loop(self, loop: PAC_Loop, context: Optional[PAC_LoopContext], depth: int) -> Optional[int]:
+        """
+        :return: the vertex the code goes to after the loop
+        """
+        header = loop.header
+        body = set(loop.get_all_blocks())
+        exits = sorted({to for v in body for to in self.successors[v] if to not in body})
+        if len(exits) == 1:
+            loop_exit = exits[0]
+        else:
+            loop_exit = self.post_dominators.idom[header]
+            if loop_exit == self.post_dominators.root or loop_exit in body:
+                loop_exit = None
+        if loop_exit is not None and loop_exit < 0:
+            loop_exit = None  # the jumps to the other functions stay goto
+
+        # do { ... } while (condition) if the only latch ends with the condition
+        latch = None
+        latches = {source for source, _ in loop.back_edges}
+        if len(latches) == 1 and header not in latches:
+            candidate = latches.pop()
+            block = self.code.code_blocks[self.blocks[candidate]]
+            last = block.instructions[block.instructions_offsets[-1]]
+            if last.signature in self.code.cond_jump_instructions and len(self.successors[candidate]) == 2:
+                if set(self.successors[candidate]) == {header, loop_exit}:
+                    latch = candidate
+
+        self.entered_loops.add(header)
+        inner_context = PAC_LoopContext(header, body, loop_exit, latch, depth + 1, True)
+        if latch is None:
+            self.emit(depth, "while (true) {")
+            self.emit_sequence(header, None, inner_context, depth + 1)
+            if self.lines[-1] == (depth + 1, "continue;", None):
+                self.lines.pop()
+            self.emit(depth, "}")
+            return loop_exit
+
+        opening = len(self.lines)
+        self.emit(depth, "do {")
+        self.emit_sequence(header, None, inner_context, depth + 1)
+        if latch not in self.closed_latches:
+            # The latch ended up in a branch, so its condition has become continue / break
+            self.lines[opening] = (depth, "while (true) {", None)
+            if self.lines[-1] == (depth + 1, "continue;", None):
+                self.lines.pop()
+            self.emit(depth, "}")
+            return loop_exit
+        block = self.code.code_blocks[self.blocks[latch]]
+        location = block.instructions_offsets[-1]
+        last = block.instructions[location]
+        taken, _ = self.get_branches(latch, location, last)
+        condition = self.render_condition(last, negate=taken != header)
+        self.emit(depth, f"}} while ({condition});", location)
+        return loop_exit
+
+    def encode(self, offset: int) -> int:
+        vertex = self.vertex_of.get(offset)
+        return vertex if vertex is not None else -1 - offset
+
+    def encode_offset(self, offset: int) -> Optional[int]:
+        """
+        :return: the vertex or the encoded offset of the block that starts at the offset, None if there's no block
+        """
+        res = self.code.get_block_by_offset(offset)
+        if res is None or res[0] != offset:
+            return None
+        return self.encode(offset)
+
+    def init_function(self, function: PAC_Subroutine):
+        self.blocks = function.blocks
+        self.vertex_of = {start: v for v, start in enumerate(self.blocks)}
+        self.successors = [[] for _ in self.blocks]
+        self.predecessors = [[] for _ in self.blocks]
+        for v, start in enumerate(self.blocks):
+            for edge in self.code.code_blocks[start].exit_point.where_to:
+                properties = edge.properties
+                if properties.save_address or properties.callback or properties.special:
+                    continue
+                to = self.encode(edge.entry.code_block.start)
+                if to in self.successors[v]:
+                    continue
+                self.successors[v].append(to)
+                if to >= 0:
+                    self.predecessors[to].append(v)
+
+        inner_successors = [[to for to in successors if to >= 0] for successors in self.successors]
+        entry_vertex = self.vertex_of[function.start]
+        self.loops = PAC_LoopForest(
+            len(self.blocks), inner_successors.__getitem__, self.predecessors.__getitem__, [entry_vertex]
+        )
+        exits = [v for v, successors in enumerate(inner_successors) if not successors]
+        self.post_dominators = PAC_DominatorTree(
+            len(self.blocks), self.predecessors.__getitem__, inner_successors.__getitem__, exits
+        )
+        self.emitted = set()
+        self.entered_loops = set()
+        self.active_follows = {}
+        self.pending = []
+        self.closed_latches = set()
+        self.lines = []
+
+    def structure_function(self, function: PAC_Subroutine) -> List[str]:
+        """
+        :param function: a function of the decompiler
+        :return: the lines of its pseudocode
+        """
+        self.init_function(function)
+        indent = self.settings.indent
+        self.emit_sequence(self.vertex_of[function.start], None, None, 1)
+        # The blocks left behind goto and the ones only the other functions jump to
+        labeled: Set[int] = set()
+        for v in self.pending + list(range(len(self.blocks))):
+            if v not in self.emitted:
+                labeled.add(v)
+                self.emit_sequence(v, None, None, 1)
+
+        for _, text, target in self.lines:
+            if text is not None and target is not None:
+                self.gotos_count += 1
+                labeled.add(target)
+
+        res = [f"void sub_{function.start:X}() {{"]
+        for level, text, v in self.lines:
+            if text is not None:
+                res.append(indent * level + text)
+            elif v in labeled:
+                res.append(indent * (level - 1) + f"label_{self.blocks[v]:X}:")
+        res.append("}")
+        return res
+
+    def write_pseudocode(self, output: TextIO) -> int:
+        """
+        Writes the pseudocode of all the functions of the file\n
+        :param output: the text stream to write to
+        :return: the number of goto statements it took
+        """
+        self.gotos_count = 0
+        output.write(f"// {self.code.file.name}\n")
+        for start in sorted(self.functions):
+            output.write("\n")
+            output.write("\n".join(self.structure_function(self.functions[start])))
+            output.write("\n")
+        return self.gotos_count
@@ -0,0 +1,129 @@
+
+from Core.decompiler.pac_corpus_batch import (
+    PAC_corpus, PAC_CorpusWorker, PAC_CorpusBatch
+)
+from Core.decompiler.pac_vt_session import (
+    PAC_VtSession, PAC_Correlator, VTSettings, BytesCorrelator, InstructionsCorrelator, NormalizedCorrelator,
+    DataCorrelator, MinHashCorrelator, PropagationCorrelator, FunctionCorrelator
+)
+from Core.decompiler.pac_data_correlator import (
+    DataSimilarityCorrelator
+)
+
+from pathlib import Path
+from typing import NamedTuple, Dict, List, Tuple, Optional, Callable, Any
+import time
+
+
+CORRELATORS: Dict[str, Callable[[], PAC_Correlator]] = {
+    "bytes": BytesCorrelator,
+    "instructions": InstructionsCorrelator,
+    "normalized": NormalizedCorrelator,
+    "data": DataCorrelator,
+    "minhash": MinHashCorrelator,
+    "propagation": PropagationCorrelator,
+    "functions": FunctionCorrelator,
+    "data_similarity": DataSimilarityCorrelator,
+}
+
+
+class PAC_pair_report(NamedTuple):
+    first_name: str
+    second_name: str
+    matches: List[Tuple[int, int]]
+    first_blocks: int
+    second_blocks: int
+    first_decompile_time: float
+    second_decompile_time: float
+    correlate_time: float
+    error: Optional[str] = None
+
+
+def find_file_pairs(first_directory: Path, second_directory: Path) -> List[Tuple[Path, Path]]:
+    """
+    Pairs the PAC files of two directories by their names (the case is ignored)\n
+    :return: the list of (first path, second path) sorted by the first name
+    """
+    second_files = {path.name.lower(): path for path in second_directory.glob("*.pac") if path.is_file()}
+    pairs = []
+    for path in sorted(first_directory.glob("*.pac")):
+        counterpart = second_files.get(path.name.lower())
+        if path.is_file() and counterpart is not None:
+            pairs.append((path, counterpart))
+    return pairs
+
+
+class PAC_VtWorker(PAC_CorpusWorker):
+    """
+    Decompiles and correlates the file pairs, one worker lives in every process of the pool
+    """
+    def __init__(self, first: PAC_corpus, second: PAC_corpus, correlator: str, settings: VTSettings):
+        super().__init__((first, second))
+        self.correlator = CORRELATORS[correlator]()
+        self.correlator.setSettings(settings)
+
+    def correlate_pair(self, first_path: Path, second_path: Path) -> PAC_pair_report:
+        try:
+            start = time.perf_counter()
+            first = self.decompile(first_path, 0)
+            first_done = time.perf_counter()
+            second = self.decompile(second_path, 1)
+            second_done = time.perf_counter()
+
+            session = PAC_VtSession()
+            session.reset(first, second)
+            matches = session.correlate(self.correlator)
+            correlated = time.perf_counter()
+        except Exception as e:
+            return PAC_pair_report(first_path.name, second_path.name, [], 0, 0, 0.0, 0.0, 0.0, repr(e))
+
+        return PAC_pair_report(
+            first_path.name, second_path.name,
+            [(match.first_address, match.second_address) for match in matches],
+            len(first.code.code_blocks), len(second.code.code_blocks),
+            first_done - start, second_done - first_done, correlated - second_done
+        )
+
+
+class PAC_VtBatch(PAC_CorpusBatch):
+    """
+    Correlates every file of the first corpus with its counterpart in the second one (e.g. P2 vs P3),
+    the pairs are decompiled and correlated in the worker processes
+    """
+    def __init__(self, first: PAC_corpus, second: PAC_corpus, correlator: str = "propagation",
+                 settings: Optional[VTSettings] = None, workers: Optional[int] = None):
+        if correlator not in CORRELATORS:
+            raise ValueError(f"Unknown correlator: {correlator}")
+        super().__init__(workers)
+        self.first = first
+        self.second = second
+        self.correlator = correlator
+        self.settings = settings if settings is not None else VTSettings()
+
+    def describe(self, report: PAC_pair_report) -> str:
+        status = report.error if report.error is not None else f"{len(report.matches)} matches"
+        return f"{report.first_name} <-> {report.second_name}: {status}"
+
+    def summarize(self, reports: List[PAC_pair_report], wall_time: float) -> Dict[str, Any]:
+        return {
+            "pairs": len(reports),
+            "failed": sum(report.error is not None for report in reports),
+            "matches": sum(len(report.matches) for report in reports),
+            "wall_time": wall_time,
+            "pair_time": sum(
+                r.first_decompile_time + r.second_decompile_time + r.correlate_time for r in reports
+            ),
+        }
+
+    def run(self, report_path: Path) -> List[PAC_pair_report]:
+        """
+        Writes the report as JSON Lines: a record per pair in the order of completion, then a summary record\n
+        :param report_path: the path of the report file
+        :return: the reports sorted by the first name
+        """
+        reports = self.run_in_pool(
+            report_path, "pair", PAC_VtWorker, (self.first, self.second, self.correlator, self.settings),
+            "correlate_pair", find_file_pairs(self.first.directory, self.second.directory)
+        )
+        reports.sort(key=lambda r: r.first_name)
+        return reports
@@ -1,58 +1,192 @@
 
 from Core.decompiler.pac_decompiler import (
-    PAC_Decompiler
+    PAC_Decompiler, PAC_Subroutine, edge_to_category
 )
 from Core.PAC.pac_file import (
-    PAC_file
+    PAC_file, is_pointer_param
 )
 from Core.decompiler.code_blocs.base_pac_code_blocks import (
     ContiguousCodeBlock, RawDataBlock
 )
 
-from hashlib import md5
-from typing import NamedTuple, Dict, List
+from hashlib import blake2b
+from struct import Struct
+from typing import NamedTuple, Dict, List, Tuple, Set, FrozenSet, Iterable, Iterator, Optional
+from collections import deque
+from pathlib import Path
+import csv
+import heapq
+import json
+import random
 
 from dataclasses import dataclass
 
 
+DIGEST_SIZE = 8
+DIGEST = Struct("<Q")
+
+
+def digest_to_int(data) -> int:
+    """
+    Hashes the bytes-like object into a fixed-width integer (blake2b with an 8-byte digest)\n
+    :param data: bytes, bytearray or memoryview
+    :return: the digest as an unsigned 64-bit integer
+    """
+    return DIGEST.unpack(blake2b(data, digest_size=DIGEST_SIZE).digest())[0]
+
+
 class PAC_hasher:
+    """
+    The digests are cached on the blocks in block.digests under the hasher's name. The rebuilt blocks are new
+    objects and normalize_block clears the digests of the blocks it shortens in place, so a block that changes
+    is hashed again
+    """
+    name = ""
+
     def hash(self, *args):
         raise NotImplementedError
 
+    def hash_uncached(self, file: PAC_file, blocks: list) -> List[int]:
+        return [self.hash(file, block) for block in blocks]
+
+    def hash_all(self, file: PAC_file, blocks: Iterable) -> Dict[int, int]:
+        """
+        Hashes many blocks of the same file in one call, reusing the cached digests\n
+        :param file: the PAC file
+        :param blocks: the code (or data) blocks
+        :return: block start -> digest
+        """
+        name = self.name
+        digests = {}
+        missing = []
+        for block in blocks:
+            digest = block.digests.get(name)
+            if digest is None:
+                missing.append(block)
+            else:
+                digests[block.start] = digest
+        for block, digest in zip(missing, self.hash_uncached(file, missing)):
+            block.digests[name] = digest
+            digests[block.start] = digest
+        return digests
+
 
 class BytesHasher(PAC_hasher):
-    def __init__(self):
-        self.hasher = None
+    name = "bytes"
 
-    def hash(self, file: PAC_file, code_block: ContiguousCodeBlock):
-        raw = file.raw_data[code_block.start: code_block.start + code_block.size]
-        self.hasher = md5()
-        self.hasher.update(raw)
-        return self.hasher.hexdigest()
+    def hash(self, file: PAC_file, code_block: ContiguousCodeBlock) -> int:
+        return digest_to_int(memoryview(file.raw_data)[code_block.start: code_block.start + code_block.size])
+
+    def hash_uncached(self, file: PAC_file, blocks: list) -> List[int]:
+        raw = memoryview(file.raw_data)
+        unpack = DIGEST.unpack
+        return [
+            unpack(blake2b(raw[block.start: block.start + block.size], digest_size=DIGEST_SIZE).digest())[0]
+            for block in blocks
+        ]
 
 
 class InstructionHasher(PAC_hasher):
-    def __init__(self):
-        self.hasher = None
+    name = "instructions"
+
+    def hash(self, file: PAC_file, code_block: ContiguousCodeBlock) -> int:
+        return self.hash_uncached(file, [code_block])[0]
+
+    def hash_uncached(self, file: PAC_file, blocks: list) -> List[int]:
+        # The signatures are stored big-endian in the file, so the digests match the ones of the raw signatures
+        raw = memoryview(file.raw_data)
+        unpack = DIGEST.unpack
+        return [
+            unpack(blake2b(b"".join([raw[offset: offset + 4] for offset in block.instructions_offsets]),
+                           digest_size=DIGEST_SIZE).digest())[0]
+            for block in blocks
+        ]
+
+
+class NormalizedHasher(PAC_hasher):
+    """
+    Hashes the instructions together with their canonicalized arguments: the constants and the variable indices
+    are kept, the pointers into the block become relative to its start and the other pointers are masked by the kind
+    of their target (code or data), so the same code hashes the same wherever it is in the file
+    """
+    name = "normalized"
 
-    def hash(self, file: PAC_file, code_block: ContiguousCodeBlock):
-        raw = bytearray()
-        self.hasher = md5()
-        for instr in code_block.ordered_instructions:
-            signature = instr.raw_data[:4]
-            raw.extend(signature)
-        self.hasher.update(raw)
-        return self.hasher.hexdigest()
+    def __init__(self):
+        self.pointer_params: Dict[str, bool] = {}
+
+    def hash(self, file: PAC_file, code_block: ContiguousCodeBlock) -> int:
+        return self.hash_uncached(file, [code_block])[0]
+
+    def normalize(self, file: PAC_file, code_block: ContiguousCodeBlock) -> list:
+        pointer_params = self.pointer_params
+        instructions = file.ordered_instructions
+        start = code_block.start
+        end = start + code_block.size
+        tokens = []
+        for instruction in code_block.instructions.values():
+            tokens.append(instruction.signature)
+            for param, value in instruction.ordered_PAC_params:
+                param_type = param.type
+                is_pointer = pointer_params.get(param_type)
+                if is_pointer is None:
+                    is_pointer = is_pointer_param(param_type)
+                    pointer_params[param_type] = is_pointer
+                if not is_pointer:
+                    tokens.append(param_type)
+                    tokens.append(value)
+                elif start <= value <= end:
+                    tokens.append("relative")
+                    tokens.append(value - start)
+                elif value in instructions:
+                    tokens.append("code")
+                elif 0 <= value < file.size:
+                    tokens.append("data")
+                else:
+                    # Not an offset after all
+                    tokens.append(param_type)
+                    tokens.append(value)
+        return tokens
+
+    def hash_uncached(self, file: PAC_file, blocks: list) -> List[int]:
+        return [digest_to_int(repr(self.normalize(file, block)).encode("utf-8")) for block in blocks]
 
 
 class RawDataHasher(PAC_hasher):
-    def __init__(self):
-        self.hasher = None
+    name = "data"
+
+    def hash(self, file: PAC_file, block: RawDataBlock) -> int:
+        return digest_to_int(block.data)
+
+
+MINHASH_PRIME = (1 << 61) - 1
+
+
+class MinHasher(PAC_hasher):
+    """
+    Computes the MinHash signature of the set of the instruction signature n-grams of a code block\n
+    Two signatures agree in a position with the probability equal to the Jaccard index of the n-gram sets
+    """
+    def __init__(self, ngram_size: int = 3, permutations: int = 64, seed: int = 0):
+        self.name = f"minhash_{ngram_size}_{permutations}_{seed}"
+        self.ngram_size = ngram_size
+        generator = random.Random(seed)
+        self.permutations: List[Tuple[int, int]] = [
+            (generator.randrange(1, MINHASH_PRIME), generator.randrange(MINHASH_PRIME)) for _ in range(permutations)
+        ]
+
+    def get_ngrams(self, code_block: ContiguousCodeBlock) -> Set[int]:
+        signatures = [instr.signature for instr in code_block.ordered_instructions]
+        n = self.ngram_size
+        if len(signatures) <= n:
+            # The whole block is a single n-gram
+            return {hash(tuple(signatures)) & MINHASH_PRIME}
+        return {hash(tuple(signatures[i:i + n])) & MINHASH_PRIME for i in range(len(signatures) - n + 1)}
 
-    def hash(self, file: PAC_file, block: RawDataBlock):
-        self.hasher = md5()
-        self.hasher.update(block.data)
-        return self.hasher.hexdigest()
+    def hash_ngrams(self, ngrams: Set[int]) -> Tuple[int, ...]:
+        return tuple(min((a * x + b) % MINHASH_PRIME for x in ngrams) for a, b in self.permutations)
+
+    def hash(self, file: PAC_file, code_block: ContiguousCodeBlock):
+        return self.hash_ngrams(self.get_ngrams(code_block))
 
 
 @dataclass
@@ -62,6 +196,18 @@ class VTSettings:
     unique_matches: bool = True
     non_unique_matches: bool = False
 
+    # Function matching (see FunctionCorrelator)
+    min_function_block_count: int = 2
+
+    # Fuzzy matching (see MinHashCorrelator)
+    ngram_size: int = 3
+    minhash_permutations: int = 64
+    lsh_bands: int = 16
+    min_jaccard: float = 0.7
+
+    # Data matching (see DataSimilarityCorrelator)
+    min_data_similarity: float = 0.5
+
 
 class PAC_Correlator:
     def __init__(self):
@@ -79,6 +225,18 @@ class PAC_Correlator:
     def correlate(self):
         raise NotImplementedError
 
+    def get_first_blocks(self) -> Dict[int, ContiguousCodeBlock]:
+        return self.first.code.code_blocks
+
+    def iter_records(self) -> Iterator["PAC_match_record"]:
+        """
+        Lists the correlation results as compact records (see make_match_record)\n
+        :return: the generator of PAC_match_record
+        """
+        blocks = self.get_first_blocks()
+        for match in self.correlate():
+            yield make_match_record(match, blocks[match.first_address].size)
+
 
 class PAC_match:
     def __init__(self):
@@ -118,47 +276,47 @@ class MatchedDataBlocks(NamedTuple):
 
 class CodeBlockMatcher:
     @staticmethod
-    def hash_block(block_hashes: Dict[str, PAC_match], file: PAC_file, block: ContiguousCodeBlock, hasher: PAC_hasher,
-                   is_first: bool):
+    def add_digests(block_hashes: Dict[int, PAC_match], digests: Dict[int, int], is_first: bool):
         """
-        Processes the code block and accumulates the hash info in block_hashes\n
+        Accumulates the hash info in block_hashes\n
         :param block_hashes: the mapping between the hashes and the matches
-        :param file: the PAC file
-        :param block: the code block
-        :param hasher: the hasher object that will be used to process the block
+        :param digests: block start -> digest (see PAC_hasher.hash_all)
         :param is_first: whether the file is the first one
         :return: None
         """
-        block_hash = hasher.hash(file, block)
-        submatch = block_hashes.get(block_hash, None)
-        if submatch is None:
-            submatch = PAC_match()
-            block_hashes[block_hash] = submatch
-        submatch.add(block.start, is_first)
+        for address, block_hash in digests.items():
+            submatch = block_hashes.get(block_hash, None)
+            if submatch is None:
+                submatch = PAC_match()
+                block_hashes[block_hash] = submatch
+            submatch.add(address, is_first)
 
     @staticmethod
-    def match(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher, settings: VTSettings):
-        block_hashes: Dict[str, PAC_match] = {}
-        matches: List[MatchedCodeBlocks] = []
+    def get_blocks(decompiler: PAC_Decompiler, settings: VTSettings) -> List[ContiguousCodeBlock]:
+        return [
+            block for block in decompiler.code.code_blocks.values()
+            if block.size >= settings.min_block_size and len(block.instructions) >= settings.min_block_instr_count
+        ]
 
-        # Hash the first file's blocks
-        for block in first.code.code_blocks.values():
-            if block.size < settings.min_block_size:
-                continue
-            if len(block.instructions) < settings.min_block_instr_count:
-                continue
+    @staticmethod
+    def hash_files(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher,
+                   first_blocks: list, second_blocks: list) -> Dict[int, PAC_match]:
+        block_hashes: Dict[int, PAC_match] = {}
 
-            CodeBlockMatcher.hash_block(block_hashes, first.file, block, hasher, True)
+        # Hash the first file's blocks
+        CodeBlockMatcher.add_digests(block_hashes, hasher.hash_all(first.file, first_blocks), True)
 
         # Hash the second file's blocks
-        for block in second.code.code_blocks.values():
-            if block.size < settings.min_block_size:
-                continue
-            if len(block.instructions) < settings.min_block_instr_count:
-                continue
-
-            CodeBlockMatcher.hash_block(block_hashes, second.file, block, hasher, False)
+        CodeBlockMatcher.add_digests(block_hashes, hasher.hash_all(second.file, second_blocks), False)
+        return block_hashes
 
+    @staticmethod
+    def iter_hash_matches(block_hashes: Dict[int, PAC_match], settings: VTSettings) \
+            -> Iterator[Tuple[int, int, int, int]]:
+        """
+        Lists the matches lazily, so the cartesian products of the non-unique matches never have to be stored\n
+        :return: the generator of (first address, second address, first count, second count)
+        """
         for match in block_hashes.values():
             first_addresses = match.first_addresses
             second_addresses = match.second_addresses
@@ -166,76 +324,394 @@ class CodeBlockMatcher:
             second_count = len(second_addresses)
 
             if settings.unique_matches and first_count == 1 and second_count == 1:
-                matches.append(
-                    MatchedCodeBlocks(first, second, 1, 1, first_addresses[0], second_addresses[0])
-                )
+                yield first_addresses[0], second_addresses[0], 1, 1
             if settings.non_unique_matches and not (first_count == 1 and second_count == 1):
                 for first_address in first_addresses:
                     for second_address in second_addresses:
-                        matches.append(
-                            MatchedCodeBlocks(
-                                first, second, first_count, second_count, first_address, second_address
-                            )
-                        )
-        return matches
+                        yield first_address, second_address, first_count, second_count
 
+    @staticmethod
+    def iter_matches(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher, settings: VTSettings):
+        block_hashes = CodeBlockMatcher.hash_files(
+            first, second, hasher,
+            CodeBlockMatcher.get_blocks(first, settings), CodeBlockMatcher.get_blocks(second, settings)
+        )
+        return CodeBlockMatcher.iter_hash_matches(block_hashes, settings)
 
-class DataBlockMatcher:
     @staticmethod
-    def hash_data(data_hashes: Dict[str, PAC_match], file: PAC_file, block: RawDataBlock, hasher: PAC_hasher,
-                  is_first: bool):
+    def match(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher, settings: VTSettings):
+        return [
+            MatchedCodeBlocks(first, second, first_count, second_count, first_address, second_address)
+            for first_address, second_address, first_count, second_count
+            in CodeBlockMatcher.iter_matches(first, second, hasher, settings)
+        ]
+
+
+class SimilarCodeBlocks(NamedTuple):
+    first: PAC_Decompiler
+    second: PAC_Decompiler
+    first_address: int
+    second_address: int
+    jaccard: float
+
+    def __repr__(self):
+        return f"Similar CodeBlocks: 0x{self.first_address:X} <-> 0x{self.second_address:X} ({self.jaccard:.2f})"
+
+
+class FuzzyCodeBlockMatcher:
+    @staticmethod
+    def group_blocks(decompiler: PAC_Decompiler, hasher: MinHasher, settings: VTSettings) \
+            -> Dict[FrozenSet[int], List[int]]:
         """
-        Processes the data block and accumulates the hash info in block_hashes\n
-        :param data_hashes: the mapping between the hashes and the matches
-        :param file: the PAC file
-        :param block: the data block
-        :param hasher: the hasher object that will be used to process the block
-        :param is_first: whether the file is the first one
-        :return:
+        Groups the file's blocks by their n-gram sets, so the repeated blocks are only hashed and compared once\n
+        :return: n-grams -> the starts of the blocks
         """
-        data_hash = hasher.hash(file, block)
-        submatch = data_hashes.get(data_hash, None)
-        if submatch is None:
-            submatch = PAC_match()
-            data_hashes[data_hash] = submatch
-        submatch.add(block.start, is_first)
+        groups: Dict[FrozenSet[int], List[int]] = {}
+        for block in decompiler.code.code_blocks.values():
+            if block.size < settings.min_block_size:
+                continue
+            if len(block.instructions) < settings.min_block_instr_count or not block.instructions:
+                continue
+            groups.setdefault(frozenset(hasher.get_ngrams(block)), []).append(block.start)
+        return groups
 
     @staticmethod
-    def match(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher, settings: VTSettings):
-        data_hashes: Dict[str, PAC_match] = {}
-        matches: List[MatchedDataBlocks] = []
+    def iter_matches(first: PAC_Decompiler, second: PAC_Decompiler, hasher: MinHasher, settings: VTSettings) \
+            -> Iterator[Tuple[int, int, float]]:
+        """
+        Finds the pairs of blocks whose n-gram sets are similar enough\n
+        The signatures are cut into bands and only the blocks that share a band are compared (LSH), so the
+        running time depends on the number of the similar pairs rather than on the product of the block counts
+        :return: the generator of (first address, second address, Jaccard index), with unique_matches every block
+        is paired at most once
+        """
+        first_groups = FuzzyCodeBlockMatcher.group_blocks(first, hasher, settings)
+        second_groups = FuzzyCodeBlockMatcher.group_blocks(second, hasher, settings)
+
+        rows = max(1, settings.minhash_permutations // settings.lsh_bands)
+        bands = range(settings.minhash_permutations // rows)
+        buckets: Dict[Tuple[int, ...], List[FrozenSet[int]]] = {}
+        for ngrams in first_groups:
+            signature = hasher.hash_ngrams(ngrams)
+            for band in bands:
+                buckets.setdefault((band, *signature[band * rows: (band + 1) * rows]), []).append(ngrams)
+
+        # Verify the candidates with the exact Jaccard index
+        scored: List[Tuple[float, FrozenSet[int], FrozenSet[int]]] = []
+        for second_ngrams in second_groups:
+            signature = hasher.hash_ngrams(second_ngrams)
+            candidates: Set[FrozenSet[int]] = set()
+            for band in bands:
+                candidates.update(buckets.get((band, *signature[band * rows: (band + 1) * rows]), ()))
+            for first_ngrams in candidates:
+                shared = len(first_ngrams & second_ngrams)
+                jaccard = shared / (len(first_ngrams) + len(second_ngrams) - shared)
+                if jaccard >= settings.min_jaccard:
+                    scored.append((jaccard, first_ngrams, second_ngrams))
+
+        if settings.non_unique_matches:
+            for jaccard, first_ngrams, second_ngrams in scored:
+                for first_address in first_groups[first_ngrams]:
+                    for second_address in second_groups[second_ngrams]:
+                        yield first_address, second_address, jaccard
+        elif settings.unique_matches:
+            # Pair every block at most once, the most similar pairs first
+            scored.sort(key=lambda item: (-item[0], first_groups[item[1]][0], second_groups[item[2]][0]))
+            used_first: Set[int] = set()
+            used_second: Set[int] = set()
+            for jaccard, first_ngrams, second_ngrams in scored:
+                first_addresses = [a for a in first_groups[first_ngrams] if a not in used_first]
+                second_addresses = [b for b in second_groups[second_ngrams] if b not in used_second]
+                for first_address, second_address in zip(first_addresses, second_addresses):
+                    used_first.add(first_address)
+                    used_second.add(second_address)
+                    yield first_address, second_address, jaccard
 
-        # Hash the data in the first file
-        for block in first.data.data_blocks.values():
-            if block.size < settings.min_block_size:
+    @staticmethod
+    def match(first: PAC_Decompiler, second: PAC_Decompiler, hasher: MinHasher, settings: VTSettings):
+        """
+        :return: the list of SimilarCodeBlocks (see iter_matches)
+        """
+        return [
+            SimilarCodeBlocks(first, second, first_address, second_address, jaccard)
+            for first_address, second_address, jaccard
+            in FuzzyCodeBlockMatcher.iter_matches(first, second, hasher, settings)
+        ]
+
+
+class PropagationMatcher:
+    """
+    Extends the unique hash matches along the CFG edges, similar to BinDiff's propagation: if a pair of matched
+    blocks has exactly one unmatched neighbour with the same hash on each side (reached by the same kind of
+    edge in the same direction), the neighbours are matched too\n
+    Every matched pair is expanded once, so the running time is linear in the number of edges
+    """
+    @staticmethod
+    def get_neighbours(block: ContiguousCodeBlock, matched: Dict[int, int], digests: Dict[int, int]) \
+            -> Dict[Tuple[bool, str, int], Optional[int]]:
+        """
+        Groups the unmatched neighbours of the block by (is outgoing, edge category, digest)\n
+        :return: the key -> the neighbour's start or None if there are several neighbours with this key
+        """
+        neighbours: Dict[Tuple[bool, str, int], Optional[int]] = {}
+        edges = [(True, edge, edge.entry.code_block) for edge in block.exit_point.where_to]
+        for entry_point in block.entry_points.values():
+            edges.extend((False, edge, edge.exit.code_block) for edge in entry_point.where_from)
+
+        for is_outgoing, edge, neighbour in edges:
+            address = neighbour.start
+            if address in matched:
+                continue
+            digest = digests.get(address)
+            if digest is None:
                 continue
-            DataBlockMatcher.hash_data(data_hashes, first.file, block, hasher, True)
+            key = (is_outgoing, edge_to_category(edge), digest)
+            if key in neighbours and neighbours[key] != address:
+                neighbours[key] = None
+            else:
+                neighbours[key] = address
+        return neighbours
 
-        # Hash the data in the second file
-        for block in second.data.data_blocks.values():
-            if block.size < settings.min_block_size:
+    @staticmethod
+    def iter_matches(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher, settings: VTSettings) \
+            -> Iterator[Tuple[int, int, int, int]]:
+        """
+        Lists the seeds and then the propagated pairs as soon as they are matched\n
+        :return: the generator of (first address, second address, first count, second count), the counts are
+        the numbers of the blocks with the same hash
+        """
+        first_blocks = [block for block in first.code.code_blocks.values() if not block.is_dummy]
+        second_blocks = [block for block in second.code.code_blocks.values() if not block.is_dummy]
+        first_digests = hasher.hash_all(first.file, first_blocks)
+        second_digests = hasher.hash_all(second.file, second_blocks)
+
+        block_hashes: Dict[int, PAC_match] = {}
+        CodeBlockMatcher.add_digests(block_hashes, first_digests, True)
+        CodeBlockMatcher.add_digests(block_hashes, second_digests, False)
+
+        # The unique matches of the big enough blocks are the seeds
+        first_to_second: Dict[int, int] = {}
+        second_to_first: Dict[int, int] = {}
+        queue = deque()
+        for block in CodeBlockMatcher.get_blocks(first, settings):
+            match = block_hashes[first_digests[block.start]]
+            if len(match.first_addresses) != 1 or len(match.second_addresses) != 1:
+                continue
+            second_address = match.second_addresses[0]
+            second_block = second.code.code_blocks[second_address]
+            if second_block.size < settings.min_block_size:
+                continue
+            if len(second_block.instructions) < settings.min_block_instr_count:
                 continue
-            DataBlockMatcher.hash_data(data_hashes, second.file, block, hasher, False)
+            first_to_second[block.start] = second_address
+            second_to_first[second_address] = block.start
+            queue.append((block.start, second_address))
+            yield block.start, second_address, 1, 1
+
+        while queue:
+            first_address, second_address = queue.popleft()
+            first_neighbours = PropagationMatcher.get_neighbours(
+                first.code.code_blocks[first_address], first_to_second, first_digests
+            )
+            second_neighbours = PropagationMatcher.get_neighbours(
+                second.code.code_blocks[second_address], second_to_first, second_digests
+            )
+            for key, first_neighbour in first_neighbours.items():
+                if first_neighbour is None:
+                    continue
+                second_neighbour = second_neighbours.get(key)
+                if second_neighbour is None:
+                    continue
+                if first_neighbour in first_to_second or second_neighbour in second_to_first:
+                    # The same block was reached by another key
+                    continue
+                first_to_second[first_neighbour] = second_neighbour
+                second_to_first[second_neighbour] = first_neighbour
+                queue.append((first_neighbour, second_neighbour))
+                match = block_hashes[first_digests[first_neighbour]]
+                yield first_neighbour, second_neighbour, len(match.first_addresses), len(match.second_addresses)
 
-        for match in data_hashes.values():
-            first_addresses = match.first_addresses
-            second_addresses = match.second_addresses
-            first_count = len(first_addresses)
-            second_count = len(second_addresses)
+    @staticmethod
+    def match(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher, settings: VTSettings):
+        """
+        :return: the list of MatchedCodeBlocks (see iter_matches)
+        """
+        return [
+            MatchedCodeBlocks(first, second, first_count, second_count, first_address, second_address)
+            for first_address, second_address, first_count, second_count
+            in PropagationMatcher.iter_matches(first, second, hasher, settings)
+        ]
 
-            if settings.unique_matches and first_count == 1 and second_count == 1:
-                matches.append(
-                    MatchedDataBlocks(first, second, 1, 1, first_addresses[0], second_addresses[0])
-                )
-            if settings.non_unique_matches and not (first_count == 1 and second_count == 1):
-                for first_address in first_addresses:
-                    for second_address in second_addresses:
-                        matches.append(
-                            MatchedDataBlocks(
-                                first, second, first_count, second_count, first_address, second_address
-                            )
-                        )
-        return matches
+
+class MatchedFunctions(NamedTuple):
+    first: PAC_Decompiler
+    second: PAC_Decompiler
+    first_address: int
+    second_address: int
+
+    def __repr__(self):
+        return f"Matched Functions: 0x{self.first_address:X} <-> 0x{self.second_address:X}"
+
+
+class FunctionMatcher:
+    """
+    Matches the functions by their fingerprints first (see PAC_Subroutine.compute_fingerprint), extends the
+    matches along the call graph and then matches the blocks inside the matched functions only
+    """
+    @staticmethod
+    def get_neighbours(function: PAC_Subroutine, functions: Dict[int, PAC_Subroutine], matched: Dict[int, int]) \
+            -> Dict[Tuple[bool, int], Optional[int]]:
+        """
+        Groups the unmatched callees and callers by (is callee, fingerprint)\n
+        :return: the key -> the function's start or None if there are several functions with this key
+        """
+        neighbours: Dict[Tuple[bool, int], Optional[int]] = {}
+        for is_callee, starts in ((True, function.get_callees()), (False, function.callers)):
+            for start in starts:
+                if start in matched:
+                    continue
+                key = (is_callee, functions[start].fingerprint)
+                neighbours[key] = None if key in neighbours else start
+        return neighbours
+
+    @staticmethod
+    def match(first: PAC_Decompiler, second: PAC_Decompiler, settings: VTSettings) -> List[MatchedFunctions]:
+        first_functions = first.get_functions()
+        second_functions = second.get_functions()
+
+        fingerprints: Dict[int, PAC_match] = {}
+        CodeBlockMatcher.add_digests(
+            fingerprints, {start: function.fingerprint for start, function in first_functions.items()}, True
+        )
+        CodeBlockMatcher.add_digests(
+            fingerprints, {start: function.fingerprint for start, function in second_functions.items()}, False
+        )
+
+        first_to_second: Dict[int, int] = {}
+        second_to_first: Dict[int, int] = {}
+        queue = deque()
+        for match in fingerprints.values():
+            if len(match.first_addresses) != 1 or len(match.second_addresses) != 1:
+                continue
+            first_address = match.first_addresses[0]
+            if len(first_functions[first_address].blocks) < settings.min_function_block_count:
+                continue
+            first_to_second[first_address] = match.second_addresses[0]
+            second_to_first[match.second_addresses[0]] = first_address
+            queue.append((first_address, match.second_addresses[0]))
+
+        # Propagate along the call graph
+        while queue:
+            first_address, second_address = queue.popleft()
+            first_neighbours = FunctionMatcher.get_neighbours(
+                first_functions[first_address], first_functions, first_to_second
+            )
+            second_neighbours = FunctionMatcher.get_neighbours(
+                second_functions[second_address], second_functions, second_to_first
+            )
+            for key, first_neighbour in first_neighbours.items():
+                second_neighbour = second_neighbours.get(key)
+                if first_neighbour is None or second_neighbour is None:
+                    continue
+                if first_neighbour in first_to_second or second_neighbour in second_to_first:
+                    continue
+                first_to_second[first_neighbour] = second_neighbour
+                second_to_first[second_neighbour] = first_neighbour
+                queue.append((first_neighbour, second_neighbour))
+
+        return [
+            MatchedFunctions(first, second, first_address, second_address)
+            for first_address, second_address in sorted(first_to_second.items())
+        ]
+
+    @staticmethod
+    def iter_refined(function_matches: List[MatchedFunctions], hasher: PAC_hasher, settings: VTSettings) \
+            -> Iterator[Tuple[int, int, int, int]]:
+        """
+        Matches the blocks that have a unique hash within a pair of the matched functions, one pair of the
+        functions at a time\n
+        :return: the generator of (first address, second address, first count, second count)
+        """
+        for function_match in function_matches:
+            first, second = function_match.first, function_match.second
+            block_hashes: Dict[int, PAC_match] = {}
+            for decompiler, address, is_first in ((first, function_match.first_address, True),
+                                                  (second, function_match.second_address, False)):
+                function = decompiler.get_functions()[address]
+                blocks = [
+                    block for block in (decompiler.code.code_blocks[start] for start in function.blocks)
+                    if block.size >= settings.min_block_size
+                    and len(block.instructions) >= settings.min_block_instr_count
+                ]
+                CodeBlockMatcher.add_digests(block_hashes, hasher.hash_all(decompiler.file, blocks), is_first)
+
+            for match in block_hashes.values():
+                if len(match.first_addresses) == 1 and len(match.second_addresses) == 1:
+                    yield match.first_addresses[0], match.second_addresses[0], 1, 1
+
+    @staticmethod
+    def refine(function_matches: List[MatchedFunctions], hasher: PAC_hasher, settings: VTSettings) \
+            -> List[MatchedCodeBlocks]:
+        """
+        :return: the list of MatchedCodeBlocks (see iter_refined)
+        """
+        return [
+            MatchedCodeBlocks(function_match.first, function_match.second, first_count, second_count,
+                              first_address, second_address)
+            for function_match in function_matches
+            for first_address, second_address, first_count, second_count
+            in FunctionMatcher.iter_refined([function_match], hasher, settings)
+        ]
+
+
+class DataBlockMatcher:
+    @staticmethod
+    def get_blocks(decompiler: PAC_Decompiler, settings: VTSettings) -> List[RawDataBlock]:
+        return [block for block in decompiler.data.data_blocks.values() if block.size >= settings.min_block_size]
+
+    @staticmethod
+    def iter_matches(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher, settings: VTSettings):
+        data_hashes = CodeBlockMatcher.hash_files(
+            first, second, hasher,
+            DataBlockMatcher.get_blocks(first, settings), DataBlockMatcher.get_blocks(second, settings)
+        )
+        return CodeBlockMatcher.iter_hash_matches(data_hashes, settings)
+
+    @staticmethod
+    def match(first: PAC_Decompiler, second: PAC_Decompiler, hasher: PAC_hasher, settings: VTSettings):
+        return [
+            MatchedDataBlocks(first, second, first_count, second_count, first_address, second_address)
+            for first_address, second_address, first_count, second_count
+            in DataBlockMatcher.iter_matches(first, second, hasher, settings)
+        ]
+
+
+class PAC_match_record(NamedTuple):
+    first_address: int
+    second_address: int
+    score: float
+
+
+def make_match_record(match, size: int) -> PAC_match_record:
+    """
+    Scores the match: the size of the first block divided by the number of the candidates it competed with
+    (or multiplied by the Jaccard index for the fuzzy matches)\n
+    :param match: MatchedCodeBlocks, MatchedDataBlocks, SimilarCodeBlocks, etc.
+    :param size: the size of the first block
+    :return: the compact record without the references to the decompilers
+    """
+    if isinstance(match, SimilarCodeBlocks):
+        return PAC_match_record(match.first_address, match.second_address, size * match.jaccard)
+    if isinstance(match, (MatchedCodeBlocks, MatchedDataBlocks)):
+        return PAC_match_record(
+            match.first_address, match.second_address, size / (match.total_first * match.total_second)
+        )
+    return PAC_match_record(match.first_address, match.second_address, float(size))
+
+
+def iter_hash_records(matches: Iterator[Tuple[int, int, int, int]], blocks: Dict) -> Iterator[PAC_match_record]:
+    for first_address, second_address, first_count, second_count in matches:
+        yield PAC_match_record(first_address, second_address, blocks[first_address].size / (first_count * second_count))
 
 
 class BytesCorrelator(PAC_Correlator):
@@ -247,6 +723,10 @@ class BytesCorrelator(PAC_Correlator):
         res = CodeBlockMatcher.match(self.first, self.second, hasher, self.settings)
         return res
 
+    def iter_records(self) -> Iterator[PAC_match_record]:
+        matches = CodeBlockMatcher.iter_matches(self.first, self.second, BytesHasher(), self.settings)
+        return iter_hash_records(matches, self.get_first_blocks())
+
 
 class InstructionsCorrelator(PAC_Correlator):
     def __init__(self):
@@ -257,6 +737,24 @@ class InstructionsCorrelator(PAC_Correlator):
         res = CodeBlockMatcher.match(self.first, self.second, hasher, self.settings)
         return res
 
+    def iter_records(self) -> Iterator[PAC_match_record]:
+        matches = CodeBlockMatcher.iter_matches(self.first, self.second, InstructionHasher(), self.settings)
+        return iter_hash_records(matches, self.get_first_blocks())
+
+
+class NormalizedCorrelator(PAC_Correlator):
+    def __init__(self):
+        super().__init__()
+
+    def correlate(self):
+        hasher = NormalizedHasher()
+        res = CodeBlockMatcher.match(self.first, self.second, hasher, self.settings)
+        return res
+
+    def iter_records(self) -> Iterator[PAC_match_record]:
+        matches = CodeBlockMatcher.iter_matches(self.first, self.second, NormalizedHasher(), self.settings)
+        return iter_hash_records(matches, self.get_first_blocks())
+
 
 class DataCorrelator(PAC_Correlator):
     def __init__(self):
@@ -267,11 +765,68 @@ class DataCorrelator(PAC_Correlator):
         res = DataBlockMatcher.match(self.first, self.second, hasher, self.settings)
         return res
 
+    def get_first_blocks(self) -> Dict[int, RawDataBlock]:
+        return self.first.data.data_blocks
+
+    def iter_records(self) -> Iterator[PAC_match_record]:
+        matches = DataBlockMatcher.iter_matches(self.first, self.second, RawDataHasher(), self.settings)
+        return iter_hash_records(matches, self.get_first_blocks())
+
+
+class MinHashCorrelator(PAC_Correlator):
+    def __init__(self):
+        super().__init__()
+
+    def correlate(self):
+        hasher = MinHasher(self.settings.ngram_size, self.settings.minhash_permutations)
+        res = FuzzyCodeBlockMatcher.match(self.first, self.second, hasher, self.settings)
+        return res
+
+    def iter_records(self) -> Iterator[PAC_match_record]:
+        hasher = MinHasher(self.settings.ngram_size, self.settings.minhash_permutations)
+        blocks = self.get_first_blocks()
+        for first_address, second_address, jaccard in FuzzyCodeBlockMatcher.iter_matches(
+                self.first, self.second, hasher, self.settings
+        ):
+            yield PAC_match_record(first_address, second_address, blocks[first_address].size * jaccard)
+
+
+class PropagationCorrelator(PAC_Correlator):
+    def __init__(self, hasher: Optional[PAC_hasher] = None):
+        super().__init__()
+        self.hasher = hasher if hasher is not None else InstructionHasher()
+
+    def correlate(self):
+        res = PropagationMatcher.match(self.first, self.second, self.hasher, self.settings)
+        return res
+
+    def iter_records(self) -> Iterator[PAC_match_record]:
+        matches = PropagationMatcher.iter_matches(self.first, self.second, self.hasher, self.settings)
+        return iter_hash_records(matches, self.get_first_blocks())
+
+
+class FunctionCorrelator(PAC_Correlator):
+    def __init__(self, hasher: Optional[PAC_hasher] = None):
+        super().__init__()
+        self.hasher = hasher if hasher is not None else InstructionHasher()
+        self.function_matches: List[MatchedFunctions] = []
+
+    def correlate(self):
+        self.function_matches = FunctionMatcher.match(self.first, self.second, self.settings)
+        res = FunctionMatcher.refine(self.function_matches, self.hasher, self.settings)
+        return res
+
+    def iter_records(self) -> Iterator[PAC_match_record]:
+        self.function_matches = FunctionMatcher.match(self.first, self.second, self.settings)
+        matches = FunctionMatcher.iter_refined(self.function_matches, self.hasher, self.settings)
+        return iter_hash_records(matches, self.get_first_blocks())
+
 
 class PAC_VtSession:
     def __init__(self):
         self.first: PAC_Decompiler = PAC_Decompiler()
         self.second: PAC_Decompiler = PAC_Decompiler()
+        self.verbose_level: int = 4  # The session stays silent by default
 
     def reset(self, first: PAC_Decompiler, second: PAC_Decompiler):
         self.first = first
@@ -283,9 +838,46 @@ class PAC_VtSession:
         # For now...
         return res
 
-    def postprocess_results(self, res: List[MatchedCodeBlocks]):
-        res.sort(key=lambda m: self.first.code.code_blocks[m.first_address].size, reverse=True)
-        print("Results sorted!")
+    def postprocess_results(self, records: Iterable[PAC_match_record]) -> List[PAC_match_record]:
+        """
+        Ranks the given records by their scores (see make_match_record)\n
+        :param records: e.g. PAC_Correlator.iter_records() or the records of a saved match file
+        :return: the records, the best first
+        """
+        ranked = sorted(records, key=lambda record: record.score, reverse=True)
+        if self.verbose_level <= 2:
+            print("Results sorted!")
+        return ranked
+
+    def top_matches(self, correlator: PAC_Correlator, k: int) -> List[PAC_match_record]:
+        """
+        Keeps only the k best-scored matches in a heap while the correlator streams the results\n
+        :return: the records sorted by the score (the best first)
+        """
+        correlator.reset(self.first, self.second)
+        return heapq.nlargest(k, correlator.iter_records(), key=lambda record: record.score)
+
+    def write_matches(self, correlator: PAC_Correlator, output_path: Path) -> int:
+        """
+        Streams the correlation results into a .csv or a .jsonl file\n
+        :return: the number of the written records
+        """
+        if output_path.suffix not in (".csv", ".jsonl"):
+            raise ValueError(f"Unknown match file format: {output_path.suffix}")
+        correlator.reset(self.first, self.second)
+        count = 0
+        with open(output_path, "w", newline="", encoding="utf-8") as output:
+            if output_path.suffix == ".csv":
+                writer = csv.writer(output)
+                writer.writerow(PAC_match_record._fields)
+                for record in correlator.iter_records():
+                    writer.writerow(record)
+                    count += 1
+            else:
+                for record in correlator.iter_records():
+                    output.write(json.dumps(record._asdict()) + "\n")
+                    count += 1
+        return count
 
     def make_dot_file_for_matches(self, matched: List[MatchedCodeBlocks], is_first: bool):
         if is_first:
@@ -22,9 +22,25 @@ from Core.decompiler.pac_vt_session import (
     PAC_VtSession, VTSettings, BytesCorrelator, InstructionsCorrelator, DataCorrelator
 )
 
+from Core.decompiler.pac_block_index import (
+    PAC_BlockIndex
+)
+from Core.decompiler.pac_corpus_batch import (
+    PAC_corpus, P2_INXJMP_SIGNATURE, P3_INXJMP_SIGNATURE
+)
+from Core.decompiler.pac_vt_batch import (
+    PAC_VtBatch
+)
+from Core.decompiler.pac_pseudocode_batch import (
+    PAC_PseudocodeBatch
+)
+
 from Core.PAC.instruction_set_reader import (
     InstructionSetReader
 )
+from Core.PAC.pac_diff import (
+    PAC_Diff
+)
 
 
 def run_tests():
@@ -79,6 +95,11 @@ def run_tests():
                 offsets = set(map(lambda n: int(n, 16), args))
                 name = input("Name = ")
                 print(decompiler.draw_parents(offsets, name=name))
+            elif command_name == "path":
+                source, destination = map(lambda n: int(n, 16), args[:2])
+                edge_kinds = set(args[2:]) if len(args) > 2 else None
+                name = input("Name = ")
+                print(decompiler.draw_path(source, destination, name=name, edge_kinds=edge_kinds))
             else:
                 pass
         except KeyboardInterrupt:
@@ -240,6 +261,122 @@ def decompile_pacs_in_directory(directory: Path, save_to: Path):
     pass
 
 
+def index_pacs_in_directory(directory: Path, index_path: Path):
+    instr_set_reader = InstructionSetReader()
+    pac_parser = PAC_parser()
+    instr_set_reader.read_instruction_set(str(instructions_info_path))
+    pac_parser.setTemplates(instr_set_reader.PAC_instruction_templates)
+
+    # pac_parser.cmd_inxJmp_signature = 0x25002D00  # P2
+    pac_parser.cmd_inxJmp_signature = 0x25002f00  # P3
+
+    pac_decompiler = PAC_Decompiler()
+    pac_decompiler.setResources(instr_set_reader.PAC_signature_to_name)
+    settings = DecompilerSettings()
+    settings.make_dot_file = False
+    settings.verbose_level = 2
+
+    index = PAC_BlockIndex.load(index_path) if index_path.is_file() else PAC_BlockIndex()
+    for path in directory.glob("*.pac"):
+        if not path.is_file():
+            continue
+        try:
+            file = PAC_file()
+            file.initialize_by_raw_data(load_file_by_path(str(path)))
+            file.name = path.name
+            if index.is_up_to_date(path.name, file.raw_data):
+                continue
+
+            pac_parser.reset(file)
+            pac_parser.parse()
+            pac_decompiler.reset(file)
+            pac_decompiler.decompile(settings)
+            index.add_file(pac_decompiler)
+            print(f"{path.name} indexed!")
+
+        except Exception as e:
+            print(e)
+    index.save(index_path)
+
+    print()
+    print(f"Files indexed: {len(index)}")
+    for similarity in index.get_all_similarities("instructions", min_jaccard=0.5):
+        print(f"{similarity.first} <-> {similarity.second}: {similarity.jaccard:.3f} ({similarity.shared} shared)")
+
+
+def batch_version_tracking(p2_directory: Path, p3_directory: Path, report_path: Path):
+    print("batch_version_tracking() started!")
+    settings = VTSettings()
+    settings.min_block_instr_count = 3
+
+    batch = PAC_VtBatch(
+        PAC_corpus(p2_directory, Path(p2_instructions_info_path), P2_INXJMP_SIGNATURE),
+        PAC_corpus(p3_directory, Path(instructions_info_path), P3_INXJMP_SIGNATURE),
+        "propagation",
+        settings
+    )
+    reports = batch.run(report_path)
+
+    print()
+    for report in reports:
+        if report.error is not None:
+            print(f"{report.first_name}: {report.error}")
+            continue
+        total_time = report.first_decompile_time + report.second_decompile_time + report.correlate_time
+        print(
+            f"{report.first_name}: {len(report.matches)} matches out of {report.first_blocks}/{report.second_blocks} "
+            f"blocks ({total_time:.2f}s)"
+        )
+
+
+def emit_pseudocode_for_directory(directory: Path, save_to: Path):
+    print("emit_pseudocode_for_directory() started!")
+    batch = PAC_PseudocodeBatch(PAC_corpus(directory, Path(instructions_info_path), P3_INXJMP_SIGNATURE))
+    reports = batch.run(save_to, save_to / "report.jsonl")
+
+    print()
+    for report in reports:
+        if report.error is not None:
+            print(f"{report.name}: {report.error}")
+            continue
+        total_time = report.decompile_time + report.structure_time
+        print(
+            f"{report.name}: {report.functions} functions, {report.gotos} gotos over {report.blocks} blocks "
+            f"({total_time:.2f}s)"
+        )
+
+
+def diff_pac_files(old_path: Path, new_path: Path, patch_path: Path):
+    instr_set_reader = InstructionSetReader()
+    pac_parser = PAC_parser()
+    instr_set_reader.read_instruction_set(str(instructions_info_path))
+    pac_parser.setTemplates(instr_set_reader.PAC_instruction_templates)
+
+    # pac_parser.cmd_inxJmp_signature = 0x25002D00  # P2
+    pac_parser.cmd_inxJmp_signature = 0x25002f00  # P3
+
+    files = []
+    for path in (old_path, new_path):
+        file = PAC_file()
+        file.initialize_by_raw_data(load_file_by_path(str(path)))
+        file.name = path.name
+        pac_parser.reset(file)
+        pac_parser.parse()
+        files.append(file)
+
+    diff = PAC_Diff(*files)
+    diff.verbose_level = 2
+    diff.write_patch(patch_path)
+    for hunk in diff.diff():
+        if hunk.op == "equal":
+            continue
+        old_range = diff.get_offset_range(diff.old_offsets, diff.old, hunk.old_start, hunk.old_end)
+        new_range = diff.get_offset_range(diff.new_offsets, diff.new, hunk.new_start, hunk.new_end)
+        print(
+            f"{hunk.op}: 0x{old_range[0]:X}-0x{old_range[1]:X} -> 0x{new_range[0]:X}-0x{new_range[1]:X}"
+        )
+
+
 def version_tracking_tests():
     print("version_tracking_tests() started!")
     instr_set_reader = InstructionSetReader()
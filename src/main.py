@@ -13,6 +13,9 @@ from Core.PAC.pac_parser import (
 from Core.PAC.pac_dumper import (
     PAC_DisasmSettings, PAC_dumper
 )
+from Core.PAC.pac_assembler import (
+    PAC_assembler
+)
 
 from Utils.utils import (
     load_file_by_path
@@ -22,8 +25,11 @@ from Core.PAC.instruction_set_reader import (
     InstructionSetReader
 )
 
-from typing import Dict, Set
+from typing import Dict, List, Set
 from pathlib import Path
+from bisect import bisect_right
+import io
+import time
 from xlsxwriter import Workbook
 import openpyxl
 from openpyxl import load_workbook
@@ -37,7 +43,8 @@ def parse_args():
     parser = ArgumentParser('Mode to run')
     parser.add_argument(
         '--mode',
-        choices=('decomp_tests', 'version_tracking', "decompile_dir", "scripts")
+        choices=('decomp_tests', 'version_tracking', "decompile_dir", "index_dir", "batch_version_tracking", "diff",
+                 "pseudocode_dir", "round_trip_dir", "scripts")
     )
     return parser.parse_args()
 
@@ -270,6 +277,60 @@ class PAC_disassemble_in_dir_tester(PAC_test_base):
         dumper.disassemble_to_file(self.directory / (path.with_suffix(".txt")))
 
 
+class PAC_round_trip_in_dir_tester(PAC_test_base):
+    def __init__(self, directory: Path, instruction_set: Path, cmd_inxJmp: int,
+                 settings_list: List[PAC_DisasmSettings]):
+        super().__init__(directory, instruction_set, cmd_inxJmp)
+        self.settings_list = settings_list
+        self.assembler = PAC_assembler()
+        self.assembler.setTemplates(self.instr_set_reader.PAC_instruction_templates)
+        self.failed_files: Dict[str, int] = {}  # "name (settings)" -> offset
+        self.files_count = 0
+        self.total_time = 0.0
+
+    def test(self, file: PAC_file, path: Path):
+        # Every file goes through the round trip with each of the settings
+        for settings in self.settings_list:
+            self.round_trip(file, settings)
+
+    def round_trip(self, file: PAC_file, settings: PAC_DisasmSettings):
+        dumper = PAC_dumper()
+        dumper.reset(file, settings)
+        text = io.StringIO()
+        dumper.disassemble(text)
+
+        start = time.perf_counter()
+        data = self.assembler.assemble(text.getvalue())
+        self.total_time += time.perf_counter() - start
+        self.files_count += 1
+        if data == file.raw_data:
+            return
+
+        # The bytes that can't be restored from the text don't count
+        lossy_starts = [lossy_range[0] for lossy_range in self.assembler.lossy_ranges]
+        lossy_ends = [lossy_range[1] for lossy_range in self.assembler.lossy_ranges]
+        for offset in range(max(len(data), len(file.raw_data))):
+            if offset < len(data) and offset < len(file.raw_data) and data[offset] == file.raw_data[offset]:
+                continue
+            index = bisect_right(lossy_starts, offset) - 1
+            if index == -1 or lossy_ends[index] <= offset:
+                name = f"{file.name} ({settings})"
+                print(f"{name}: the assembled file differs at offset 0x{offset:X}")
+                self.failed_files[name] = offset
+                return
+
+    def fini(self):
+        print(f"\nAssembled {self.files_count} files in {self.total_time:.3f} seconds")
+        if not self.failed_files:
+            print("All files were assembled back successfully!")
+            return
+        print("Mismatches found!")
+        for filename, offset in self.failed_files.items():
+            print(f"{filename}: offset 0x{offset:X}")
+        # A failed regression run must be visible to the caller
+        exit(1)
+
+
 class PAC_find_inconsistencies_in_dir_tester(PAC_test_base):
     def __init__(self, directory: Path, instruction_set: Path, cmd_inxJmp: int, where_to: Path):
         super().__init__(directory, instruction_set, cmd_inxJmp)
@@ -614,5 +675,40 @@ if __name__ == '__main__':
             Path(input()),
             Path(input())
         )
+    elif cmd_args.mode == "index_dir":
+        decompiler_tests.index_pacs_in_directory(
+            Path(input()),
+            Path(input())
+        )
+    elif cmd_args.mode == "batch_version_tracking":
+        decompiler_tests.batch_version_tracking(
+            Path(input()),
+            Path(input()),
+            Path(input())
+        )
+    elif cmd_args.mode == "diff":
+        decompiler_tests.diff_pac_files(
+            Path(input()),
+            Path(input()),
+            Path(input())
+        )
+    elif cmd_args.mode == "pseudocode_dir":
+        decompiler_tests.emit_pseudocode_for_directory(
+            Path(input()),
+            Path(input())
+        )
+    elif cmd_args.mode == "round_trip_dir":
+        # Disassemble -> assemble -> compare the bytes with every combination of the layout settings
+        round_trip_func = PAC_round_trip_in_dir_tester(
+            Path(input()),
+            Path(input()),
+            0x25002f00,  # P3
+            # 0x25002D00,  # P1/2
+            [
+                PAC_DisasmSettings(omit_arg_names=omit_arg_names, skip_padding_bytes=skip_padding_bytes)
+                for omit_arg_names in (False, True) for skip_padding_bytes in (False, True)
+            ]
+        )
+        round_trip_func()
     elif cmd_args.mode == "scripts":
         main()